@@ -268,9 +268,27 @@ import argparse
 import os
 import math
 import random
-import csv
+import json
+import time
+import socket
+import shutil
+import hashlib
+import traceback
+import subprocess
+from contextlib import ExitStack
 import bmesh
+import numpy as np
 from mathutils import Vector, Euler, Matrix
+from mathutils.bvhtree import BVHTree
+
+# Blender does not put the script folder on the path, the shared helpers live next to this file
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sensor_core import (add_common_arguments, load_setups, scan_format, build_direction_grid, box_corners, target_roi,
+                         apply_noise, random_seed, sample_rng, shard_sample_ids, shard_file_names,
+                         settings_line, job_arguments, job_report)
+from scan_store import open_batch_output, batch_output, existing_seed
+from profiler import RunProfiler, NO_PROFILER, format_summary
+from pose_sampling import run_sampler, report_coverage
 
 # --- 1. ARGUMENT PARSING ---
 def get_args():
@@ -298,23 +316,21 @@ def setup_sensor_object(location_str):
     
     return sensor
 
-def randomize_target(target_obj, trans_range, rot_range):
-    """Randomly rotates and translates the target object."""
-    rx_deg = random.uniform(-rot_range, rot_range)
-    ry_deg = random.uniform(-rot_range, rot_range)
-    rz_deg = random.uniform(-rot_range, rot_range)
-    rx, ry, rz = map(math.radians, [rx_deg, ry_deg, rz_deg])
-    
-    tx = random.uniform(-trans_range, trans_range)
-    ty = random.uniform(-trans_range, trans_range)
-    tz = random.uniform(-trans_range, trans_range)
+def randomize_target(target_obj, sampler, sample_id, rng, update_scene=True):
+    """
+    Rotates and translates the target object to the pose of the sample (see pose_sampling.PoseSampler),
+    drawing from the sample's rng. With update_scene=False the view layer is not re-evaluated and
+    the world matrix is composed directly from the new transform (the target must not be parented).
+    """
+    params = sampler.params(sample_id, rng)
+    target_obj.rotation_euler = Euler((params["rx_rad"], params["ry_rad"], params["rz_rad"]), 'XYZ')
+    target_obj.location = Vector((params["tx_m"], params["ty_m"], params["tz_m"]))
     
-    target_obj.rotation_euler = Euler((rx, ry, rz), 'XYZ')
-    target_obj.location = Vector((tx, ty, tz))
-    bpy.context.view_layer.update()
-
-    matrix = target_obj.matrix_world.copy()
-    params = {"rx_rad": rx, "ry_rad": ry, "rz_rad": rz, "tx_m": tx, "ty_m": ty, "tz_m": tz}
+    if update_scene:
+        bpy.context.view_layer.update()
+        matrix = target_obj.matrix_world.copy()
+    else:
+        matrix = Matrix.LocRotScale(target_obj.location, target_obj.rotation_euler, target_obj.scale)
     return matrix, params
 
 # --- VISUALIZATION HELPERS ---
@@ -501,8 +517,8 @@ def generate_debug_views(output_dir, target_obj, sensor_obj, fov_h, fov_v, max_d
     bpy.context.scene.render.engine = original_engine
     bpy.context.scene.display.shading.show_xray = False
     
-    # Delete temporary objects
-    objs_to_delete = [cam_obj, obj_body, obj_fov, hud_axes] + list(hud_axes.children)
+    # Delete temporary objects (the HUD axes are disabled above, so there is no hud_axes to remove)
+    objs_to_delete = [cam_obj, obj_body, obj_fov]
     bpy.ops.object.select_all(action='DESELECT')
     for obj in objs_to_delete:
         obj.select_set(True)
@@ -510,110 +526,488 @@ def generate_debug_views(output_dir, target_obj, sensor_obj, fov_h, fov_v, max_d
     
     for mesh in [mesh_body, mesh_fov]:
         bpy.data.meshes.remove(mesh, do_unlink=True)
+    bpy.data.cameras.remove(cam_data, do_unlink=True)
     
     print("--- Debug Views Saved ---")
 
-def perform_raycast_scan(sensor_obj, target_obj, res_w, res_h, fov_h, fov_v, max_dist, noise=0.0):
-    """Simulates the sensor by shooting rays."""
-    hit_points = []
+# --- DEBUG VIEW CACHE ---
+# The views only depend on the sensor setup and the scene, not on the samples. They are stored
+# once per fingerprint in a cache directory shared by the jobs (<cache>/<fingerprint>/setup_view_*.png)
+# and copied into every setup output. Missing views are rendered by a second background Blender
+# process while this one generates the samples.
+
+DEBUG_VIEWS = ("view_iso", "view_front", "view_right", "view_top")
+# Part of the fingerprint: change it when generate_debug_views draws something else
+DEBUG_VIEW_VERSION = 1
+# A lock older than this belongs to a render process that died
+_STALE_LOCK_SECONDS = 600
+
+def debug_view_fingerprint(setup, target_obj, viz_res):
+    """Hash of everything the debug views of a setup show: sensor, position, range, target and scene file."""
+    blend_file = bpy.data.filepath
+    key = {
+        "version": DEBUG_VIEW_VERSION,
+        "res": [setup["res_w"], setup["res_h"]], "fov": [setup["fov_h"], setup["fov_v"]],
+        "position": [round(float(v), 6) for v in setup["position"].split(',')], "max_dist": setup["max_dist"],
+        "target": target_obj.name, "target_matrix": [round(v, 6) for row in target_obj.matrix_world for v in row],
+        "target_size": [round(v, 6) for v in target_obj.dimensions],
+        "scene": [os.path.basename(blend_file), os.path.getmtime(blend_file) if blend_file else None],
+        "viz_res": viz_res,
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+def render_debug_views(view_dir, target_obj, view_spec):
+    """
+    Renders the debug views of one setup into view_dir at the view_spec's viz_res
+    ('scene' keeps the render resolution of the .blend file).
+    """
+    render = bpy.context.scene.render
+    original_res = (render.resolution_x, render.resolution_y, render.resolution_percentage)
+    if view_spec["viz_res"] != "scene":
+        render.resolution_x, render.resolution_y = map(int, view_spec["viz_res"].lower().split('x'))
+        render.resolution_percentage = 100
+    try:
+        sensor_obj = setup_sensor_object(view_spec["position"])
+        bpy.context.view_layer.update()
+        generate_debug_views(view_dir, target_obj, sensor_obj, view_spec["fov_h"], view_spec["fov_v"], view_spec["max_dist"])
+    finally:
+        render.resolution_x, render.resolution_y, render.resolution_percentage = original_res
+
+def render_cached_views(cache_dir, target_obj, view_spec):
+    """Renders one view spec into <cache_dir>/<fingerprint> (written to a temporary directory and renamed)."""
+    final_dir = os.path.join(cache_dir, view_spec["fingerprint"])
+    tmp_dir = f"{final_dir}.tmp{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    try:
+        render_debug_views(tmp_dir, target_obj, view_spec)
+        with open(os.path.join(tmp_dir, "views.json"), 'w') as f:
+            json.dump(view_spec, f, indent=1)
+        os.rename(tmp_dir, final_dir)
+    except OSError:
+        # Another process stored the same views first
+        if not os.path.isdir(final_dir):
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        _release_lock(cache_dir, view_spec["fingerprint"])
+
+def _cached_view_dir(cache_dir, fingerprint):
+    view_dir = os.path.join(cache_dir, fingerprint)
+    return view_dir if os.path.exists(os.path.join(view_dir, "views.json")) else None
+
+def _lock_path(cache_dir, fingerprint):
+    return os.path.join(cache_dir, f"{fingerprint}.lock")
+
+def _acquire_lock(cache_dir, fingerprint):
+    """True when this process renders the fingerprint, False when another (live) process already does."""
+    path = _lock_path(cache_dir, fingerprint)
+    for _ in range(2):
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) < _STALE_LOCK_SECONDS:
+                    return False
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return False
+
+def _release_lock(cache_dir, fingerprint):
+    try:
+        os.remove(_lock_path(cache_dir, fingerprint))
+    except FileNotFoundError:
+        pass
+
+def copy_cached_views(view_dir, output_dir):
+    for name in DEBUG_VIEWS:
+        shutil.copyfile(os.path.join(view_dir, f"setup_{name}.png"), os.path.join(output_dir, f"setup_{name}.png"))
+
+def start_debug_views(args, setups, target_obj):
+    """
+    Puts the debug views of every setup into its output: cached views are copied right away,
+    missing ones are rendered into the cache by a background Blender process (in this process
+    with --viz_sync, or when the scene was never saved). Returns the pending state for
+    finish_debug_views.
+    """
+    cache_dir = args.viz_cache or os.path.join(args.output, "viz_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    pending, to_render = [], {}
+    for setup in setups:
+        fingerprint = debug_view_fingerprint(setup, target_obj, args.viz_res)
+        view_dir = _cached_view_dir(cache_dir, fingerprint)
+        if view_dir:
+            copy_cached_views(view_dir, setup["output"])
+            continue
+        pending.append((fingerprint, setup["output"]))
+        if fingerprint not in to_render and _acquire_lock(cache_dir, fingerprint):
+            to_render[fingerprint] = {"fingerprint": fingerprint, "position": setup["position"], "fov_h": setup["fov_h"],
+                                      "fov_v": setup["fov_v"], "max_dist": setup["max_dist"], "viz_res": args.viz_res}
+    print(f"--- Debug views: {len(setups) - len(pending)} setups cached, {len(to_render)} to render ---")
+
+    process = None
+    if to_render and (args.viz_sync or not bpy.data.filepath):
+        for view_spec in to_render.values():
+            render_cached_views(cache_dir, target_obj, view_spec)
+    elif to_render:
+        command = [bpy.app.binary_path, "-b", bpy.data.filepath, "--python-exit-code", "1", "-P", os.path.abspath(__file__), "--",
+                   "--render_views", json.dumps({"cache_dir": cache_dir, "target_name": target_obj.name,
+                                                 "views": list(to_render.values())})]
+        # No stdin: in worker mode that is the job stream of this process
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return {"cache_dir": cache_dir, "pending": pending, "process": process, "rendering": list(to_render)}
+
+def finish_debug_views(state, timeout=_STALE_LOCK_SECONDS):
+    """Waits for the views of start_debug_views (also those another job renders) and copies them into the outputs."""
+    cache_dir = state["cache_dir"]
+    if state["process"] is not None and state["process"].wait() != 0:
+        print(f"Warning: Debug view render process failed (exit code {state['process'].returncode})")
+        for fingerprint in state["rendering"]:
+            _release_lock(cache_dir, fingerprint)
+
+    deadline = time.time() + timeout
+    for fingerprint, output_dir in state["pending"]:
+        view_dir = _cached_view_dir(cache_dir, fingerprint)
+        while view_dir is None and os.path.exists(_lock_path(cache_dir, fingerprint)) and time.time() < deadline:
+            time.sleep(0.5)
+            view_dir = _cached_view_dir(cache_dir, fingerprint)
+        if view_dir:
+            copy_cached_views(view_dir, output_dir)
+        else:
+            print(f"Warning: Debug views missing for {output_dir}")
+
+def render_views_main(spec):
+    """--render_views mode: renders the view specs of start_debug_views into the cache."""
+    target_obj = bpy.data.objects[spec["target_name"]]
+    for view_spec in spec["views"]:
+        render_cached_views(spec["cache_dir"], target_obj, view_spec)
+
+def target_bounds(target_obj):
+    """(min, max) corners of the evaluated target's bounding box in object space."""
     depsgraph = bpy.context.evaluated_depsgraph_get()
-    sensor_loc, sensor_mat = sensor_obj.location, sensor_obj.matrix_world
-    fov_h_rad, fov_v_rad = math.radians(fov_h), math.radians(fov_v)
-    
-    step_x = 1 
-    step_y = 1
-    
-    for y in range(0, res_h, step_y):
-        for x in range(0, res_w, step_x):
-            u, v = (x / res_w) - 0.5, (y / res_h) - 0.5
-            angle_x, angle_y = u * fov_h_rad, v * fov_v_rad
-            local_dir = Vector((math.tan(angle_x), math.tan(angle_y), -1.0)).normalized()
-            world_dir = sensor_mat.to_3x3() @ local_dir
-            
-            result, location, normal, index, obj, matrix = bpy.context.scene.ray_cast(depsgraph, sensor_loc, world_dir, distance=max_dist)
-            
-            if result and obj.name == target_obj.name:
-                if noise > 0:
-                    location = Vector((location.x + random.gauss(0, noise), 
-                                       location.y + random.gauss(0, noise), 
-                                       location.z + random.gauss(0, noise)))
-                hit_points.append(location)
-    return hit_points
+    corners = np.array([corner[:] for corner in target_obj.evaluated_get(depsgraph).bound_box])
+    return corners.min(axis=0), corners.max(axis=0)
+
+def roi_directions(directions, sensor_obj, target_matrix, bounds, res_w, res_h, fov_h, fov_v, max_dist):
+    """Rows of a full direction grid around the target's projected bounding box and the clamped range (see target_roi)."""
+    corners = box_corners(*bounds, np.array(target_matrix))
+    pixels, max_dist = target_roi(res_w, res_h, fov_h, fov_v, np.array(sensor_obj.location),
+                                  np.array(sensor_obj.matrix_world.to_3x3()), corners, max_dist)
+    return (directions if pixels is None else directions[pixels]), max_dist
+
+def perform_raycast_scan(sensor_obj, target_obj, res_w, res_h, fov_h, fov_v, max_dist, noise=0.0, rng=None, bounds=None,
+                         profiler=NO_PROFILER):
+    """
+    Simulates the sensor by shooting rays. Returns the hits as an (N, 3) float32 array.
+    With the target's bounds (target_bounds) only the rays that can reach it are cast.
+    The profiler times the 'raycast' and 'noise' stages and counts the rays and hits.
+    """
+    with profiler.stage("raycast"):
+        points, n_rays = _scene_hits(sensor_obj, target_obj, res_w, res_h, fov_h, fov_v, max_dist, bounds)
+    profiler.count(rays=n_rays, hits=len(points))
+    with profiler.stage("noise"):
+        return apply_noise(points, noise, rng)
+
+def _scene_hits(sensor_obj, target_obj, res_w, res_h, fov_h, fov_v, max_dist, bounds):
+    """Hits of perform_raycast_scan before the noise, and the number of rays cast."""
+    scene = bpy.context.scene
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    sensor_loc = sensor_obj.location.copy()
+    sensor_rot = np.array(sensor_obj.matrix_world.to_3x3(), dtype=np.float32)
+    
+    # Rotate the whole grid into world space with a single matrix multiply
+    world_dirs = build_direction_grid(res_w, res_h, fov_h, fov_v) @ sensor_rot.T
+    if bounds is not None:
+        world_dirs, max_dist = roi_directions(world_dirs, sensor_obj, target_obj.matrix_world, bounds,
+                                              res_w, res_h, fov_h, fov_v, max_dist)
+    
+    # Preallocated hit buffer, trimmed to the number of hits afterwards
+    hits = np.empty((len(world_dirs), 3), dtype=np.float32)
+    n_hits = 0
+    target_name = target_obj.name
+    ray_cast = scene.ray_cast
+    
+    # scene.ray_cast has no batched variant, so only the cast itself stays per ray
+    for direction in world_dirs.tolist():
+        result, location, normal, index, obj, matrix = ray_cast(depsgraph, sensor_loc, direction, distance=max_dist)
+        if result and obj.name == target_name:
+            hits[n_hits] = location
+            n_hits += 1
+    
+    return hits[:n_hits], len(world_dirs)
+
+def build_target_bvh(target_obj):
+    """Builds a BVH tree of the evaluated target mesh in its own object space."""
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    return BVHTree.FromObject(target_obj, depsgraph)
+
+def perform_bvh_scan(sensor_obj, target_bvh, target_matrix, res_w, res_h, fov_h, fov_v, max_dist, noise=0.0, rng=None, bounds=None,
+                     profiler=NO_PROFILER):
+    """
+    Same scan as perform_raycast_scan, but the rays are moved into the target's object
+    space and cast against its BVH, so no scene evaluation is needed per pose.
+    Only the target is hit: other scene objects do not occlude it in this mode.
+    """
+    with profiler.stage("raycast"):
+        points, n_rays = _bvh_hits(sensor_obj, target_bvh, target_matrix, res_w, res_h, fov_h, fov_v, max_dist, bounds)
+    profiler.count(rays=n_rays, hits=len(points))
+    with profiler.stage("noise"):
+        return apply_noise(points, noise, rng)
+
+def _bvh_hits(sensor_obj, target_bvh, target_matrix, res_w, res_h, fov_h, fov_v, max_dist, bounds):
+    """Hits of perform_bvh_scan in world space before the noise, and the number of rays cast."""
+    local_to_world = np.array(target_matrix)
+    world_to_local = np.array(target_matrix.inverted())
+    sensor_rot = np.array(sensor_obj.matrix_world.to_3x3())
+    
+    origin = world_to_local[:3, :3] @ np.array(sensor_obj.location) + world_to_local[:3, 3]
+    local_dirs = build_direction_grid(res_w, res_h, fov_h, fov_v) @ (world_to_local[:3, :3] @ sensor_rot).T
+    if bounds is not None:
+        local_dirs, max_dist = roi_directions(local_dirs, sensor_obj, target_matrix, bounds,
+                                              res_w, res_h, fov_h, fov_v, max_dist)
+    
+    # BVHTree.ray_cast normalizes the direction, so the range is scaled into object space per ray
+    local_dists = max_dist * np.linalg.norm(local_dirs, axis=1)
+    
+    hits = np.empty((len(local_dirs), 3), dtype=np.float32)
+    n_hits = 0
+    origin = Vector(origin)
+    ray_cast = target_bvh.ray_cast
+    
+    for direction, distance in zip(local_dirs.tolist(), local_dists.tolist()):
+        location, normal, index, dist = ray_cast(origin, direction, distance)
+        if location is not None:
+            hits[n_hits] = location
+            n_hits += 1
+    
+    # Map all hits back to world space in one go
+    return (hits[:n_hits] @ local_to_world[:3, :3].T + local_to_world[:3, 3]).astype(np.float32), len(local_dirs)
 
 # --- 3. MAIN EXECUTION ---
 
-def main():
+def build_parser():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--sensor_res", required=True)
-    parser.add_argument("--sensor_fov", required=True)
-    parser.add_argument("--position", required=True)
-    parser.add_argument("--samples", type=int, required=True)
-    parser.add_argument("--output", required=True)
+    add_common_arguments(parser)
     
-    parser.add_argument("--rot_range", type=float, default=180.0)
-    parser.add_argument("--trans_range", type=float, default=0.0)
-    parser.add_argument("--noise", type=float, default=0.0)
-    parser.add_argument("--target_name", default="Cube")
-    parser.add_argument("--max_dist", type=float, default=100.0)
-    
-    # NEW: Optional flag to enable/disable visualization images
-    # Use action='store_true' -> if present = True, if missing = False
-    parser.add_argument("--viz", action="store_true", help="Generate debug visualization images")
+    # Ray casting backend: 'scene' casts against the whole evaluated scene,
+    # 'bvh' casts against an object-space BVH of the target only (no per-sample scene update)
+    parser.add_argument("--engine", choices=["scene", "bvh"], default="scene", help="Ray casting backend")
+    return parser
 
-    args = parser.parse_args(get_args())
-    
+def run_job(args):
+    """
+    Generates one job in the loaded scene: a single sensor/position, or with --setups every
+    pose scanned from all setups in turn (see load_setups).
+    Returns a summary dict, raises ValueError on bad settings.
+    """
     try:
-        res_w, res_h = map(int, args.sensor_res.split('x'))
-        fov_h, fov_v = map(float, args.sensor_fov.split('x'))
-    except ValueError: return print("Error: Resolution or FOV format incorrect.")
+        setups = load_setups(args)
+        sample_ids = shard_sample_ids(args.start_index, args.samples, args.shards, args.shard_index)
+    except ValueError as e: raise ValueError(f"Resolution, FOV, setup or shard settings incorrect ({e}).")
     
-    print(f"--- Blender Script Start (Max Dist: {args.max_dist}m) ---")
+    # A resumed run keeps the seed of the interrupted one, so every sample gets the same pose
+    gt_name, store_name = shard_file_names(args.shards, args.shard_index)
+    seed = args.seed
+    if seed is None and args.resume: seed = existing_seed(os.path.join(setups[0]["output"], gt_name))
+    if seed is None: seed = random_seed()
     
-    if args.target_name not in bpy.data.objects: return print(f"ERROR: Object '{args.target_name}' not found!")
-    target_obj = bpy.data.objects[args.target_name]
+    max_dists = ", ".join(f"{setup['max_dist']}m" for setup in setups)
+    print(f"--- Blender Script Start (Max Dist: {max_dists}) ---")
+    
+    sampler = run_sampler(args, seed)
+    profile_name = "profile" if args.shards == 1 else f"profile_shard{args.shard_index:02d}"
+    profiler = RunProfiler(args.output, enabled=args.profile, name=profile_name)
     
-    sensor_obj = setup_sensor_object(args.position)
+    if args.target_name not in bpy.data.objects: raise ValueError(f"Object '{args.target_name}' not found!")
+    target_obj = bpy.data.objects[args.target_name]
     
-    if not os.path.exists(args.output): os.makedirs(args.output)
+    # Place the sensor once per setup; the loop only swaps in the stored world matrix
+    for setup in setups:
+        sensor_obj = setup_sensor_object(setup["position"])
+        bpy.context.view_layer.update()
+        setup["sensor_matrix"] = sensor_obj.matrix_world.copy()
+        
+        if not os.path.exists(setup["output"]): os.makedirs(setup["output"])
 
     # --- CHECK FLAG BEFORE GENERATING IMAGES ---
+    # Cached views are copied now, missing ones render in the background during the samples
+    debug_views = None
     if args.viz:
         try:
-            generate_debug_views(args.output, target_obj, sensor_obj, fov_h, fov_v, args.max_dist)
+            with profiler.stage("debug_views"):
+                debug_views = start_debug_views(args, setups, target_obj)
         except Exception as e:
             print(f"Warning: Could not generate debug views: {e}")
-            import traceback; traceback.print_exc()
+            traceback.print_exc()
     else:
         print("--- Visualization skipped (Enable with --viz) ---")
 
-    # --- GROUND TRUTH & LOOP ---
-    gt_filepath = os.path.join(args.output, "ground_truth.csv")
-    with open(gt_filepath, 'w', newline='') as gt_file:
-        gt_writer = csv.writer(gt_file)
-        gt_file.write(f"# Settings: Res={res_w}x{res_h}, FOV={fov_h}x{fov_v}, Pos={args.position}, Range={args.max_dist}\n")
-        header = ['sample_id', 'filename', 'rx_rad', 'ry_rad', 'rz_rad', 'tx_m', 'ty_m', 'tz_m']
-        matrix_headers = [f"m{r}{c}" for r in range(4) for c in range(4)]
-        gt_writer.writerow(header + matrix_headers)
-
-        for i in range(args.samples):
-            gt_matrix, params = randomize_target(target_obj, args.trans_range, args.rot_range)
-            points = perform_raycast_scan(sensor_obj, target_obj, res_w, res_h, fov_h, fov_v, 
-                                          max_dist=args.max_dist, noise=args.noise)
-            
-            filename = f"scan_{i:04d}.csv"
-            filepath = os.path.join(args.output, filename)
-            with open(filepath, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['X', 'Y', 'Z'])
-                for p in points: writer.writerow([f"{p.x:.6f}", f"{p.y:.6f}", f"{p.z:.6f}"])
+    # The sensors are fixed, so in bvh mode only the target's object space tree is needed
+    with profiler.stage("bvh_build"):
+        target_bvh = build_target_bvh(target_obj) if args.engine == "bvh" else None
+    bounds = None if args.full_grid else target_bounds(target_obj)
+
+    with ExitStack() as stack:
+        # --- GROUND TRUTH PER SETUP ---
+        outputs = []
+        for setup in setups:
+            settings = settings_line(setup["res_w"], setup["res_h"], setup["fov_h"], setup["fov_v"],
+                                     setup["position"], setup["max_dist"], seed, sampler.label)
+            gt_file, scan_writer, todo_ids = open_batch_output(setup["output"], gt_name, store_name, scan_format(args),
+                                                               settings, sample_ids, args.resume)
+            output = stack.enter_context(batch_output(gt_file, scan_writer, args.write_queue, args.fsync_interval))
+            outputs.append((output, set(todo_ids)))
+            if len(todo_ids) < len(sample_ids): print(f"--- Resuming {setup['output']} after {len(sample_ids) - len(todo_ids)} existing samples ---")
+
+        # --- LOOP: every pose is set once and scanned from all setups ---
+        todo_ids = [i for i in sample_ids if any(i in todo for _, todo in outputs)]
+        for n, i in enumerate(todo_ids):
+            profiler.start_sample(i)
+            with profiler.stage("pose"):
+                rng = sample_rng(seed, i)
+                gt_matrix, params = randomize_target(target_obj, sampler, i, rng,
+                                                     update_scene=(args.engine == "scene"))
             
-            flat_matrix = [f"{gt_matrix[r][c]:.6f}" for r in range(4) for c in range(4)]
-            row_data = [i, filename, f"{params['rx_rad']:.6f}", f"{params['ry_rad']:.6f}", f"{params['rz_rad']:.6f}", f"{params['tx_m']:.6f}", f"{params['ty_m']:.6f}", f"{params['tz_m']:.6f}"]
-            gt_writer.writerow(row_data + flat_matrix)
+            counts = []
+            for k, (setup, (output, todo)) in enumerate(zip(setups, outputs)):
+                if i not in todo:
+                    continue
+                # Setting matrix_world directly needs no scene update; the scans only read the sensor's matrix
+                sensor_obj.matrix_world = setup["sensor_matrix"]
+                # The first setup draws its noise from the pose RNG, so single setup runs are unchanged
+                noise_rng = rng if k == 0 else sample_rng(seed, i, k)
+                scan_args = (setup["res_w"], setup["res_h"], setup["fov_h"], setup["fov_v"])
+                if args.engine == "bvh":
+                    points = perform_bvh_scan(sensor_obj, target_bvh, gt_matrix, *scan_args,
+                                              max_dist=setup["max_dist"], noise=setup["noise"], rng=noise_rng, bounds=bounds,
+                                              profiler=profiler)
+                else:
+                    points = perform_raycast_scan(sensor_obj, target_obj, *scan_args,
+                                                  max_dist=setup["max_dist"], noise=setup["noise"], rng=noise_rng, bounds=bounds,
+                                                  profiler=profiler)
+                
+                # With a write queue this is only the hand-over (and the wait while the queue is full)
+                with profiler.stage("write"):
+                    written = output.write(i, points, gt_matrix, params)
+                # Queued scans are serialized later by the writer thread, the run total covers them
+                if written is not None: profiler.count(bytes=written)
+                counts.append(str(len(points)))
+            profiler.end_sample()
             
-            if i % 10 == 0: print(f"Generated sample {i}/{args.samples} - {len(points)} points")
-
+            if n % 10 == 0: print(f"Generated sample {i} ({n + 1}/{len(todo_ids)}) - {'/'.join(counts)} points")
+        
+        # Wait for the writer threads to store the queued scans
+        with profiler.stage("write_drain"):
+            for output, _ in outputs: output.close()
+
+    if debug_views is not None:
+        with profiler.stage("debug_views_wait"):
+            finish_debug_views(debug_views)
+
+    # The writer threads may still write after the last sample, so the byte total is taken here
+    profiler.close(setups=[setup["name"] for setup in setups if setup["name"]], format=scan_format(args), engine=args.engine,
+                   bytes=sum(output.bytes_written for output, _ in outputs))
+    if args.profile: print(f"--- Profile: {format_summary(profiler.summary())} ---")
+    # Sharded runs are measured by parallel_generate.py once the shards are merged
+    coverage = report_coverage(args) if args.coverage and args.shards == 1 else None
     print("--- Blender Script Finished ---")
+    return {"output": args.output, "samples": len(sample_ids), "seed": seed, "setups": [setup["name"] for setup in setups],
+            "pose_coverage": coverage}
+
+# --- 4. WORKER MODE ---
+
+def snapshot_transform(obj):
+    return obj.location.copy(), obj.rotation_euler.copy(), obj.scale.copy()
+
+def restore_transform(obj, transform):
+    obj.location, obj.rotation_euler, obj.scale = transform
+
+def run_spec(spec):
+    """
+    Runs one JSON job spec and puts the scene back as it was loaded:
+    the target gets its original transform and a SensorOrigin created by the job is removed.
+    """
+    started = time.time()
+    target_obj = bpy.data.objects.get(spec.get("target_name", "Cube"))
+    target_transform = snapshot_transform(target_obj) if target_obj else None
+    sensor_obj = bpy.data.objects.get("SensorOrigin")
+    sensor_transform = snapshot_transform(sensor_obj) if sensor_obj else None
+    
+    try:
+        result = {"status": "done", **run_job(build_parser().parse_args(job_arguments(spec)))}
+    except SystemExit:
+        # argparse already printed the reason
+        result = {"status": "error", "error": "invalid job arguments"}
+    except Exception as e:
+        traceback.print_exc()
+        result = {"status": "error", "error": str(e)}
+    finally:
+        if target_obj:
+            restore_transform(target_obj, target_transform)
+        if sensor_obj:
+            restore_transform(sensor_obj, sensor_transform)
+        elif "SensorOrigin" in bpy.data.objects:
+            bpy.data.objects.remove(bpy.data.objects["SensorOrigin"], do_unlink=True)
+        bpy.context.view_layer.update()
+    
+    result.update(id=spec.get("id"), seconds=round(time.time() - started, 3))
+    return result
+
+def handle_stream(reader, writer):
+    """Runs the job specs of one line stream. Returns False when a {"command": "quit"} line arrives."""
+    for line in reader:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            spec = json.loads(line)
+        except json.JSONDecodeError as e:
+            result = {"status": "error", "error": f"bad job spec: {e}"}
+        else:
+            if spec.get("command") == "quit":
+                return False
+            result = run_spec(spec)
+        writer.write(job_report(result))
+        writer.flush()
+    return True
+
+def serve(port=None):
+    """
+    Keeps the .blend file loaded and runs job specs from stdin (until EOF),
+    or from local socket connections on 'port' (until a quit command).
+    """
+    print(f"--- Blender Worker Ready ({'stdin' if port is None else f'port {port}'}) ---", flush=True)
+    if port is None:
+        handle_stream(sys.stdin, sys.stdout)
+        return
+    
+    with socket.create_server(("127.0.0.1", port)) as server:
+        running = True
+        while running:
+            conn, _ = server.accept()
+            with conn, conn.makefile('r') as reader, conn.makefile('w') as writer:
+                running = handle_stream(reader, writer)
+
+def main():
+    argv = get_args()
+    
+    # Worker mode: load the scene once and run many jobs (see job_scheduler.py)
+    mode_parser = argparse.ArgumentParser(add_help=False)
+    mode_parser.add_argument("--serve", action="store_true", help="Run JSON job specs instead of a single job")
+    mode_parser.add_argument("--port", type=int, default=None, help="Read the job specs from a local socket instead of stdin")
+    mode_parser.add_argument("--render_views", default=None, help="Render debug views into the cache (see start_debug_views)")
+    mode, _ = mode_parser.parse_known_args(argv)
+    if mode.serve:
+        return serve(mode.port)
+    if mode.render_views:
+        return render_views_main(json.loads(mode.render_views))
+    
+    try:
+        run_job(build_parser().parse_args(argv))
+    except ValueError as e:
+        print(f"ERROR: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,171 @@
+"""
+Blender-free version of BlenderSensorProgram.py.
+
+Loads the target as a triangle mesh (OBJ/PLY, exported from DataGenerator.blend or
+converted from the STEP model in 'CAD data/') and casts the sensor rays with NumPy.
+Takes the same arguments and writes the same scan_XXXX.csv / ground_truth.csv files:
+
+    python HeadlessSensorProgram.py --mesh cube.obj --sensor_res 848x480 --sensor_fov 69.0x42.0 \
+        --position 0.0,2.0,1.5 --samples 10 --output ../Blender_Generated_Data/Test_1/cam_d435/setup_front
+
+The mesh must be in the target's object space with Blender axes (Z up), e.g. exported
+with 'Forward: Y, Up: Z'. Use --mesh_scale for CAD exports in millimeters (0.001).
+"""
+import sys
+import os
+import argparse
+from contextlib import ExitStack
+import numpy as np
+
+from sensor_core import (add_common_arguments, load_setups, scan_format, parse_position, build_direction_grid,
+                         box_corners, target_roi, sensor_rotation, apply_noise, random_seed, sample_rng, shard_sample_ids,
+                         shard_file_names, pose_matrix, settings_line)
+from mesh_raycast import load_mesh, TriangleBVH
+from scan_store import open_batch_output, batch_output, existing_seed
+from profiler import RunProfiler, NO_PROFILER, format_summary
+from pose_sampling import run_sampler, report_coverage
+
+# --- 1. ARGUMENT PARSING ---
+def get_args():
+    """Accepts the arguments either directly or after a Blender style '--' separator."""
+    argv = sys.argv[1:]
+    if "--" in argv:
+        return argv[argv.index("--") + 1:]
+    return argv
+
+# --- 2. SCANNING ---
+
+def perform_mesh_scan(bvh, sensor_loc, sensor_rot, target_matrix, res_w, res_h, fov_h, fov_v, max_dist, noise=0.0, rng=None, roi=True,
+                      profiler=NO_PROFILER):
+    """
+    Simulates the sensor against the posed target mesh. The rays are moved into the
+    target's object space, so the BVH is built once for all poses.
+    With roi only the pixels around the projected bounding box are cast (same hits).
+    Returns the hits in world space as an (N, 3) float32 array.
+    """
+    with profiler.stage("raycast"):
+        points = _cast_target_rays(bvh, sensor_loc, sensor_rot, target_matrix, res_w, res_h, fov_h, fov_v, max_dist, roi, profiler)
+    with profiler.stage("noise"):
+        return apply_noise(points, noise, rng)
+
+def _cast_target_rays(bvh, sensor_loc, sensor_rot, target_matrix, res_w, res_h, fov_h, fov_v, max_dist, roi, profiler):
+    world_dirs = build_direction_grid(res_w, res_h, fov_h, fov_v) @ sensor_rot.T
+    if roi:
+        corners = box_corners(*bvh.bounds, target_matrix)
+        pixels, max_dist = target_roi(res_w, res_h, fov_h, fov_v, sensor_loc, sensor_rot, corners, max_dist)
+        if pixels is not None:
+            world_dirs = world_dirs[pixels]
+
+    world_to_local = np.linalg.inv(target_matrix)
+    origin = world_to_local[:3, :3] @ sensor_loc + world_to_local[:3, 3]
+    local_dirs = world_dirs @ world_to_local[:3, :3].T
+
+    # The hit parameter is shared by both frames because the world directions are unit length
+    t, face = bvh.ray_cast(origin, local_dirs, max_dist)
+    hit = face >= 0
+    profiler.count(rays=len(world_dirs), hits=hit.sum())
+    return (sensor_loc + t[hit, np.newaxis] * world_dirs[hit]).astype(np.float32)
+
+# --- 3. MAIN EXECUTION ---
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    add_common_arguments(parser)
+    parser.add_argument("--mesh", required=True, help="Target mesh (.obj or .ply) in object space")
+    parser.add_argument("--mesh_scale", type=float, default=1.0, help="Scale applied to the mesh vertices")
+    return parser
+
+def main():
+    args = build_parser().parse_args(get_args())
+
+    try:
+        setups = load_setups(args)
+        sample_ids = shard_sample_ids(args.start_index, args.samples, args.shards, args.shard_index)
+    except ValueError as e: return print(f"Error: Resolution, FOV, setup or shard settings incorrect ({e}).")
+    
+    # A resumed run keeps the seed of the interrupted one, so every sample gets the same pose
+    gt_name, store_name = shard_file_names(args.shards, args.shard_index)
+    seed = args.seed
+    if seed is None and args.resume: seed = existing_seed(os.path.join(setups[0]["output"], gt_name))
+    if seed is None: seed = random_seed()
+
+    max_dists = ", ".join(f"{setup['max_dist']}m" for setup in setups)
+    print(f"--- Headless Script Start (Max Dist: {max_dists}) ---")
+
+    sampler = run_sampler(args, seed)
+    profile_name = "profile" if args.shards == 1 else f"profile_shard{args.shard_index:02d}"
+    profiler = RunProfiler(args.output, enabled=args.profile, name=profile_name)
+
+    if not os.path.exists(args.mesh): return print(f"ERROR: Mesh '{args.mesh}' not found!")
+    with profiler.stage("mesh_load"):
+        vertices, faces = load_mesh(args.mesh, scale=args.mesh_scale)
+    with profiler.stage("bvh_build"):
+        bvh = TriangleBVH(vertices, faces)
+    print(f"Loaded '{args.target_name}' mesh: {len(vertices)} vertices, {len(faces)} triangles")
+
+    for setup in setups:
+        setup["sensor_loc"] = parse_position(setup["position"])
+        setup["sensor_rot"] = sensor_rotation(setup["sensor_loc"])
+        if not os.path.exists(setup["output"]): os.makedirs(setup["output"])
+
+    if args.viz:
+        print("--- Visualization needs Blender, skipped in headless mode ---")
+
+    with ExitStack() as stack:
+        # --- GROUND TRUTH PER SETUP ---
+        outputs = []
+        for setup in setups:
+            settings = settings_line(setup["res_w"], setup["res_h"], setup["fov_h"], setup["fov_v"],
+                                     setup["position"], setup["max_dist"], seed, sampler.label)
+            try:
+                gt_file, scan_writer, todo_ids = open_batch_output(setup["output"], gt_name, store_name, scan_format(args),
+                                                                   settings, sample_ids, args.resume)
+            except ValueError as e: return print(f"ERROR: {e}")
+            output = stack.enter_context(batch_output(gt_file, scan_writer, args.write_queue, args.fsync_interval))
+            outputs.append((output, set(todo_ids)))
+            if len(todo_ids) < len(sample_ids): print(f"--- Resuming {setup['output']} after {len(sample_ids) - len(todo_ids)} existing samples ---")
+
+        # --- LOOP: every pose once, scanned from all setups ---
+        todo_ids = [i for i in sample_ids if any(i in todo for _, todo in outputs)]
+        for n, i in enumerate(todo_ids):
+            profiler.start_sample(i)
+            with profiler.stage("pose"):
+                rng = sample_rng(seed, i)
+                params = sampler.params(i, rng)
+                gt_matrix = pose_matrix(params)
+
+            counts = []
+            for k, (setup, (output, todo)) in enumerate(zip(setups, outputs)):
+                if i not in todo:
+                    continue
+                # The first setup draws its noise from the pose RNG, so single setup runs are unchanged
+                noise_rng = rng if k == 0 else sample_rng(seed, i, k)
+                points = perform_mesh_scan(bvh, setup["sensor_loc"], setup["sensor_rot"], gt_matrix,
+                                           setup["res_w"], setup["res_h"], setup["fov_h"], setup["fov_v"],
+                                           max_dist=setup["max_dist"], noise=setup["noise"], rng=noise_rng,
+                                           roi=not args.full_grid, profiler=profiler)
+
+                # With a write queue this is only the hand-over (and the wait while the queue is full)
+                with profiler.stage("write"):
+                    written = output.write(i, points, gt_matrix, params)
+                # Queued scans are serialized later by the writer thread, the run total covers them
+                if written is not None: profiler.count(bytes=written)
+                counts.append(str(len(points)))
+            profiler.end_sample()
+
+            if n % 10 == 0: print(f"Generated sample {i} ({n + 1}/{len(todo_ids)}) - {'/'.join(counts)} points")
+
+        # Wait for the writer threads to store the queued scans
+        with profiler.stage("write_drain"):
+            for output, _ in outputs: output.close()
+
+    # The writer threads may still write after the last sample, so the byte total is taken here
+    profiler.close(setups=[setup["name"] for setup in setups if setup["name"]], format=scan_format(args),
+                   bytes=sum(output.bytes_written for output, _ in outputs))
+    if args.profile: print(f"--- Profile: {format_summary(profiler.summary())} ---")
+    # Sharded runs are measured by parallel_generate.py once the shards are merged
+    if args.coverage and args.shards == 1: report_coverage(args)
+    print("--- Headless Script Finished ---")
+
+if __name__ == "__main__":
+    main()
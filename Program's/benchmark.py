@@ -0,0 +1,282 @@
+"""
+Reproducible throughput benchmark of the generator, the scan formats and the registration.
+
+Runs headless on a synthetic cube mesh (no Blender, no .blend file) with a fixed seed:
+
+    raycast        scans/s and rays/s of HeadlessSensorProgram.perform_mesh_scan for every
+                   sensor resolution x FOV, with and without the target ROI culling
+    storage        write and read throughput of every scan format (SCAN_FORMATS)
+    registration   seconds per scan of each registration pipeline variant (needs open3d,
+                   skipped otherwise)
+
+The results go to a JSON file together with the commit, so runs of different commits on the
+same machine can be compared:
+
+    python benchmark.py --output bench_before.json
+    python benchmark.py --output bench_after.json
+    python benchmark.py --compare bench_before.json bench_after.json
+"""
+import os
+import csv
+import json
+import time
+import socket
+import platform
+import argparse
+import subprocess
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+from sensor_core import (SCAN_FORMATS, parse_sensor_spec, parse_position, sensor_rotation, sample_rng,
+                         sample_pose_params, pose_matrix, settings_line, ground_truth_row)
+from mesh_raycast import load_mesh, TriangleBVH
+from scan_store import open_batch_output, ScanStore
+from profiler import RunProfiler
+from pose_metrics import CUBE_SYMMETRIES, pose_errors
+from HeadlessSensorProgram import perform_mesh_scan
+
+DEFAULT_RESOLUTIONS = ["424x240", "848x480", "1280x720"]
+DEFAULT_FOVS = ["69.0x42.0", "87.0x58.0"]
+DEFAULT_POSITION = "0.0,2.0,1.5"
+
+# --- 1. FIXTURES ---
+
+def cube_mesh(size=0.2):
+    """Vertices and triangles of an axis aligned cube centered on the origin."""
+    corners = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=np.float64)
+    quads = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    faces = np.array([(a, b, c) for a, b, c, d in quads] + [(a, c, d) for a, b, c, d in quads], dtype=np.int64)
+    return corners * size / 2, faces
+
+def sample_poses(samples, seed, rot_range=180.0, trans_range=0.0):
+    """(sample id, pose params, 4x4 matrix) of the first samples ids, as the generators draw them."""
+    poses = []
+    for i in range(samples):
+        params = sample_pose_params(trans_range, rot_range, sample_rng(seed, i))
+        poses.append((i, params, pose_matrix(params)))
+    return poses
+
+def git_commit(path="."):
+    """(commit hash, working tree has changes) of the repository at path, or (None, None)."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=path, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=path,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+def machine_info():
+    return {"host": socket.gethostname(), "platform": platform.platform(), "processor": platform.processor(),
+            "cpus": os.cpu_count(), "python": platform.python_version(), "numpy": np.__version__}
+
+# --- 2. BENCHMARKS ---
+
+def bench_raycast(bvh, resolutions, fovs, poses, position=DEFAULT_POSITION, roi_modes=(True, False)):
+    """One result per resolution x FOV x ROI mode: scans/s, rays/s, hits and seconds per scan."""
+    sensor_loc = parse_position(position)
+    sensor_rot = sensor_rotation(sensor_loc)
+    results = []
+    for resolution in resolutions:
+        for fov in fovs:
+            res_w, res_h, fov_h, fov_v = parse_sensor_spec(resolution, fov)
+            for roi in roi_modes:
+                # The first scan builds the cached direction grid, it is not part of the timing
+                perform_mesh_scan(bvh, sensor_loc, sensor_rot, poses[0][2], res_w, res_h, fov_h, fov_v, 100.0, roi=roi)
+
+                with tempfile.TemporaryDirectory() as tmp:
+                    profiler = RunProfiler(tmp)
+                    seconds = []
+                    for i, _, matrix in poses:
+                        profiler.start_sample(i)
+                        started = time.perf_counter()
+                        perform_mesh_scan(bvh, sensor_loc, sensor_rot, matrix, res_w, res_h, fov_h, fov_v, 100.0,
+                                          roi=roi, profiler=profiler)
+                        seconds.append(time.perf_counter() - started)
+                        profiler.end_sample()
+                    summary = profiler.summary()
+                    profiler.close()
+
+                total = sum(seconds)
+                results.append({
+                    "resolution": resolution, "fov": fov, "roi": roi, "scans": len(poses),
+                    "scans_per_s": len(poses) / total, "rays_per_s": summary["rays"] / total,
+                    "rays_per_scan": summary["rays"] / len(poses), "hits_per_scan": summary["hits"] / len(poses),
+                    "median_seconds": float(np.median(seconds)),
+                })
+                print(f"raycast {resolution} {fov} {'roi ' if roi else 'full'}: "
+                      f"{results[-1]['scans_per_s']:.1f} scans/s, {results[-1]['rays_per_s'] / 1e6:.2f} Mrays/s")
+    return results
+
+def bench_storage(bvh, formats, poses, resolution, fov, position=DEFAULT_POSITION):
+    """Write and read throughput (scans/s, MB/s of points) of every format on the same scans."""
+    res_w, res_h, fov_h, fov_v = parse_sensor_spec(resolution, fov)
+    sensor_loc = parse_position(position)
+    sensor_rot = sensor_rotation(sensor_loc)
+    scans = [(i, params, matrix, perform_mesh_scan(bvh, sensor_loc, sensor_rot, matrix, res_w, res_h, fov_h, fov_v, 100.0))
+             for i, params, matrix in poses]
+    point_bytes = sum(points.nbytes for _, _, _, points in scans)
+    settings = settings_line(res_w, res_h, fov_h, fov_v, position, 100.0, 0)
+
+    results = []
+    for fmt in formats:
+        with tempfile.TemporaryDirectory() as tmp:
+            started = time.perf_counter()
+            gt_file, writer, _ = open_batch_output(tmp, "ground_truth.csv", "scans", fmt, settings, [])
+            with gt_file, writer:
+                gt_writer = csv.writer(gt_file)
+                for i, params, matrix, points in scans:
+                    filename, storage = writer.write(i, points, matrix)
+                    gt_writer.writerow(ground_truth_row(i, filename, matrix, params) + storage)
+            write_seconds = time.perf_counter() - started
+            disk_bytes = sum(entry.stat().st_size for entry in os.scandir(tmp))
+
+            # A fresh store per pass, so the container opening counts as part of the read
+            started = time.perf_counter()
+            store = ScanStore(tmp)
+            n_points = sum(len(np.array(store[k])) for k in range(len(store)))
+            read_seconds = time.perf_counter() - started
+
+        results.append({
+            "format": fmt, "resolution": resolution, "fov": fov, "scans": len(scans), "points": n_points,
+            "disk_bytes": disk_bytes, "bytes_per_point": disk_bytes / max(n_points, 1),
+            "write_scans_per_s": len(scans) / write_seconds, "write_mb_per_s": point_bytes / write_seconds / 1e6,
+            "read_scans_per_s": len(scans) / read_seconds, "read_mb_per_s": point_bytes / read_seconds / 1e6,
+        })
+        print(f"storage {fmt}: write {results[-1]['write_scans_per_s']:.0f} scans/s, "
+              f"read {results[-1]['read_scans_per_s']:.0f} scans/s, {disk_bytes / 1e6:.2f} MB")
+    return results
+
+def registration_variants():
+    """{name: register(points, voxel_size) -> (T, fitness, rmse, seconds)} on the registration_eval worker state."""
+    import registration_eval
+    return {"ransac_icp": registration_eval.register_scan,
+            "pyramid": lambda points, voxel_size: registration_eval.register_scan_pyramid(points, voxel_size)[:4]}
+
+def bench_registration(bvh, poses, resolution, fov, voxel_size, position=DEFAULT_POSITION):
+    """
+    Seconds per scan and cube-symmetric rotation error of every registration variant, each scan
+    registered onto the first one.
+    """
+    try:
+        import registration_eval
+        variants = registration_variants()
+    except ImportError as e:
+        print(f"registration skipped (open3d not available: {e})")
+        return []
+
+    res_w, res_h, fov_h, fov_v = parse_sensor_spec(resolution, fov)
+    sensor_loc = parse_position(position)
+    sensor_rot = sensor_rotation(sensor_loc)
+    scans = [(matrix, perform_mesh_scan(bvh, sensor_loc, sensor_rot, matrix, res_w, res_h, fov_h, fov_v, 100.0))
+             for _, _, matrix in poses]
+
+    # Same setup as a worker of registration_eval.evaluate, in this process
+    reference_points = scans[0][1]
+    registration_eval._init_worker(reference_points, registration_eval.feature_arrays(reference_points, voxel_size), None, 0,
+                                   registration_eval.pyramid_arrays(reference_points, voxel_size))
+    reference_pose = np.asarray(scans[0][0])
+
+    results = []
+    for name, register in variants.items():
+        seconds, estimates = [], []
+        for matrix, points in scans[1:]:
+            T, fitness, rmse, elapsed = register(points, voxel_size)
+            # T maps the scan onto the reference, so inverse(T) @ reference pose is the scan's pose
+            estimates.append(np.linalg.inv(T) @ reference_pose)
+            seconds.append(elapsed)
+        truths = np.stack([matrix for matrix, _ in scans[1:]])
+        rot_errors = pose_errors(np.stack(estimates), truths, CUBE_SYMMETRIES)['rot_error_sym']
+        results.append({
+            "variant": name, "resolution": resolution, "fov": fov, "voxel_size": voxel_size, "scans": len(seconds),
+            "scans_per_s": len(seconds) / sum(seconds), "mean_seconds": float(np.mean(seconds)),
+            "median_seconds": float(np.median(seconds)), "median_rot_error": float(np.median(rot_errors)),
+        })
+        print(f"registration {name}: {results[-1]['mean_seconds'] * 1000:.1f} ms/scan, "
+              f"median rotation error {results[-1]['median_rot_error']:.2f} deg")
+    return results
+
+# --- 3. RUN / COMPARE ---
+
+def run(args):
+    commit, dirty = git_commit(os.path.dirname(os.path.abspath(__file__)))
+    if args.mesh:
+        vertices, faces = load_mesh(args.mesh, scale=args.mesh_scale)
+    else:
+        vertices, faces = cube_mesh()
+    bvh = TriangleBVH(vertices, faces)
+    poses = sample_poses(args.samples, args.seed)
+
+    report = {
+        "commit": commit, "dirty": dirty, "date": datetime.now().isoformat(timespec='seconds'),
+        "machine": machine_info(),
+        "config": {"samples": args.samples, "seed": args.seed, "mesh": args.mesh or "cube 0.2m",
+                   "resolutions": args.resolutions, "fovs": args.fovs, "formats": args.formats},
+    }
+    report["raycast"] = bench_raycast(bvh, args.resolutions, args.fovs, poses)
+    report["storage"] = bench_storage(bvh, args.formats, poses, args.resolutions[0], args.fovs[0])
+    report["registration"] = [] if args.skip_registration else bench_registration(
+        bvh, poses[:args.registration_samples + 1], args.resolutions[0], args.fovs[0], args.voxel_size)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"--- Benchmark written to {args.output} ---")
+    return report
+
+# Result keys of each section and the throughput metric compared between two runs
+_COMPARE = {
+    "raycast": (("resolution", "fov", "roi"), "scans_per_s"),
+    "storage": (("format",), "write_scans_per_s"),
+    "registration": (("variant",), "scans_per_s"),
+}
+
+def compare(before, after):
+    """Rows (section, key, before, after, ratio) of the throughput of two benchmark reports."""
+    rows = []
+    for section, (keys, metric) in _COMPARE.items():
+        old = {tuple(r[k] for k in keys): r for r in before.get(section, [])}
+        for result in after.get(section, []):
+            key = tuple(result[k] for k in keys)
+            if key in old:
+                rows.append((section, " ".join(map(str, key)), old[key][metric], result[metric],
+                             result[metric] / old[key][metric]))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmark on a synthetic cube (no Blender needed)")
+    parser.add_argument("--output", default=None, help="Result JSON (default: benchmark_<commit>.json)")
+    parser.add_argument("--resolutions", default=",".join(DEFAULT_RESOLUTIONS), help="Comma separated WxH list")
+    parser.add_argument("--fovs", default=",".join(DEFAULT_FOVS), help="Comma separated HxV degrees list")
+    parser.add_argument("--formats", default=",".join(SCAN_FORMATS), help="Scan formats of the storage benchmark")
+    parser.add_argument("--samples", type=int, default=50, help="Scans per configuration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mesh", default=None, help="Benchmark this mesh instead of the synthetic cube")
+    parser.add_argument("--mesh_scale", type=float, default=1.0)
+    parser.add_argument("--voxel_size", type=float, default=0.01, help="Voxel size of the registration")
+    parser.add_argument("--registration_samples", type=int, default=10, help="Scans registered per variant")
+    parser.add_argument("--skip_registration", action="store_true")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path, 'r') as f:
+                reports.append(json.load(f))
+        print(f"{reports[0]['commit']} -> {reports[1]['commit']}")
+        for section, key, old, new, ratio in compare(*reports):
+            print(f"{section:13s} {key:35s} {old:10.2f} -> {new:10.2f} ({ratio:.2f}x)")
+        return
+
+    args.resolutions = args.resolutions.split(',')
+    args.fovs = args.fovs.split(',')
+    args.formats = args.formats.split(',')
+    if args.output is None:
+        commit, _ = git_commit(os.path.dirname(os.path.abspath(__file__)))
+        args.output = f"benchmark_{(commit or 'nogit')[:10]}.json"
+    run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+One queryable index over all generated batches, without opening any scan files.
+
+The catalog reads the ground truth files below a data root once (the flat
+dataset_index.csv and every <batch_id>/<sensor_id>/<pos_id>/ground_truth.csv) and keeps
+
+    batches   one entry per ground truth file: directory, the batch/sensor/position names
+              of the path, the parsed '# Settings:' line (res_w, res_h, fov_h, fov_v, pos_x,
+              pos_y, pos_z, max_dist, seed, poses), scan format and derived (noise_augment.py)
+    columns   one NumPy array per ground truth column over all scans: batch (index into
+              batches), row, sample_id, filename, offset/count of the scan in its container
+              (-1 for csv scans), the pose parameters and the 16 matrix entries
+
+in <root>/catalog.npz. update_catalog() only reads what changed since the last call:
+new files completely, grown files (a run in progress, --resume) from the last indexed
+row on, files that were rewritten again; catalogs of removed batches are dropped.
+
+    catalog = update_catalog("../Blender_Generated_Data")
+    front = catalog.query(sensor_id="cam_d435", pos_id="setup_front", rx_rad=(-0.3, 0.3))
+    for row, points in catalog.iter_scans(front):
+        ...
+
+Conditions: a value selects equal entries, a (low, high) tuple a closed range (None for
+open ends), a list/set any of its values, and a callable gets the column array and returns
+a mask (batch-level columns: the value of every batch). Command line:
+
+    python dataset_catalog.py ../Blender_Generated_Data --where sensor_id=cam_d435 --where rx_rad=-0.3:0.3
+"""
+import os
+import csv
+import json
+import glob
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from sensor_core import SCAN_FORMATS, GT_HEADER, GT_MATRIX_HEADER, parse_settings_line
+from scan_store import ScanStore, load_scan_csv, read_range_container
+
+CATALOG_NAME = "catalog.npz"
+CATALOG_VERSION = 2
+
+FLOAT_COLUMNS = GT_HEADER[2:] + GT_MATRIX_HEADER
+ROW_COLUMNS = ['batch', 'row', 'sample_id', 'filename', 'offset', 'count'] + FLOAT_COLUMNS
+BATCH_COLUMNS = ['batch_dir', 'batch_id', 'sensor_id', 'pos_id', 'format', 'derived', 'res_w', 'res_h', 'fov_h', 'fov_v',
+                 'pos_x', 'pos_y', 'pos_z', 'max_dist', 'seed', 'poses']
+
+# Column names of the flat dataset_index.csv written by the first Blender script
+_LEGACY_COLUMNS = {'id': 'sample_id', 'rot_x_rad': 'rx_rad', 'rot_y_rad': 'ry_rad', 'rot_z_rad': 'rz_rad',
+                   'loc_x': 'tx_m', 'loc_y': 'ty_m', 'loc_z': 'tz_m'}
+
+# --- 1. READING GROUND TRUTH FILES ---
+
+def _ground_truth_files(root):
+    """Ground truth files below root, relative to root."""
+    paths = [os.path.relpath(path, root)
+             for path in glob.glob(os.path.join(root, "**", "ground_truth.csv"), recursive=True)]
+    if os.path.exists(os.path.join(root, "dataset_index.csv")):
+        paths.append("dataset_index.csv")
+    return sorted(paths)
+
+def _read_rows(path, start=0, header=None):
+    """
+    Complete rows of a ground truth file from byte offset start (0: the settings line and
+    header are read first). A row still being written (no line end) is left for the next update.
+    Returns (settings line or None, header, rows as lists of strings, byte offset after the last row).
+    """
+    settings = None
+    rows = []
+    with open(path, 'rb') as f:
+        f.seek(start)
+        if start == 0:
+            line = f.readline()
+            if line.startswith(b'#'):
+                settings = line.decode().strip()
+                line = f.readline()
+            header = [_LEGACY_COLUMNS.get(name, name) for name in line.decode().rstrip('\r\n').split(',')]
+        end = f.tell()
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            rows.append(next(csv.reader([line.decode()])))
+            end += len(line)
+    return settings, header, rows, end
+
+def _scan_format(path):
+    """Scan format of a stored scan (see ScanStore.format); range16 shares the .range extension."""
+    ext = os.path.splitext(path)[1][1:]
+    if ext != 'range':
+        return ext if ext in SCAN_FORMATS else ''
+    try:
+        return "range16" if read_range_container(path)[0]['range_dtype'] == '<f2' else "range"
+    except (OSError, ValueError):
+        return ''
+
+def _batch_info(root, gt_rel, settings, rows, header):
+    """Batch-level columns of one ground truth file."""
+    batch_dir = os.path.dirname(gt_rel)
+    parts = batch_dir.replace(os.sep, '/').split('/') if batch_dir else []
+    names = ([''] * 3 + parts)[-3:]
+    info = {'batch_dir': batch_dir, 'batch_id': names[0], 'sensor_id': names[1], 'pos_id': names[2],
+            'derived': os.path.exists(os.path.join(root, batch_dir, "augmentation.json")),
+            'format': '', 'res_w': 0, 'res_h': 0, 'fov_h': np.nan, 'fov_v': np.nan,
+            'pos_x': np.nan, 'pos_y': np.nan, 'pos_z': np.nan, 'max_dist': np.nan, 'seed': -1, 'poses': ''}
+    if rows:
+        info['format'] = _scan_format(os.path.join(root, batch_dir, rows[0][header.index('filename')]))
+    if settings:
+        try:
+            sensor = parse_settings_line(settings)
+        except ValueError:
+            sensor = None
+        if sensor:
+            info.update(res_w=sensor['res_w'], res_h=sensor['res_h'], fov_h=sensor['fov_h'], fov_v=sensor['fov_v'],
+                        max_dist=sensor['max_dist'], seed=-1 if sensor['seed'] is None else sensor['seed'],
+                        poses=sensor['poses'])
+            info['pos_x'], info['pos_y'], info['pos_z'] = (float(v) for v in sensor['position'])
+    return info
+
+def _row_columns(batch, first_row, header, rows):
+    """Row-level column arrays of rows of one batch."""
+    n = len(rows)
+    index = {name: k for k, name in enumerate(header)}
+    table = np.array(rows, dtype=str).reshape(n, len(header))
+
+    columns = {'batch': np.full(n, batch, dtype=np.int32),
+               'row': np.arange(first_row, first_row + n, dtype=np.int32),
+               'sample_id': table[:, index['sample_id']].astype(np.int64),
+               'filename': table[:, index['filename']]}
+    offset_name = 'point_offset' if 'point_offset' in index else 'record_offset' if 'record_offset' in index else None
+    columns['offset'] = table[:, index[offset_name]].astype(np.int64) if offset_name else np.full(n, -1, dtype=np.int64)
+    columns['count'] = table[:, index['point_count']].astype(np.int64) if 'point_count' in index else np.full(n, -1, dtype=np.int64)
+    for name in FLOAT_COLUMNS:
+        columns[name] = table[:, index[name]].astype(np.float64) if name in index else np.full(n, np.nan)
+    return columns
+
+# --- 2. CATALOG ---
+
+class DatasetCatalog:
+    """Batch table and row columns of a data root; see the module docstring."""
+
+    def __init__(self, root, batches=None, columns=None):
+        self.root = root
+        self.batches = batches or []
+        self.columns = columns or _empty_columns()
+
+    def __len__(self):
+        return len(self.columns['batch'])
+
+    @property
+    def path(self):
+        return os.path.join(self.root, CATALOG_NAME)
+
+    # --- STORAGE ---
+
+    @classmethod
+    def load(cls, root):
+        """Catalog stored in root, or an empty one (no catalog yet, or one of another version)."""
+        path = os.path.join(root, CATALOG_NAME)
+        if not os.path.exists(path):
+            return cls(root)
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != CATALOG_VERSION:
+                return cls(root)
+            return cls(root, meta['batches'], {name: data[name] for name in ROW_COLUMNS})
+
+    def save(self):
+        """Writes catalog.npz (replaced atomically, readers never see a partial file)."""
+        meta = json.dumps({'version': CATALOG_VERSION, 'batches': self.batches})
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path, meta=np.array(meta), **self.columns)
+        os.replace(tmp_path, self.path)
+
+    # --- UPDATING ---
+
+    def update(self):
+        """
+        Brings the catalog up to date with the ground truth files below root.
+        Returns {'added', 'updated', 'removed', 'rows'}: batch counts and the rows read.
+        """
+        current = {batch['gt_path']: k for k, batch in enumerate(self.batches)}
+        found = _ground_truth_files(self.root)
+        stats = {'added': 0, 'updated': 0, 'removed': len(set(current) - set(found)), 'rows': 0}
+
+        keep = [k for k, batch in enumerate(self.batches) if batch['gt_path'] in found]
+        self._select_batches(keep)
+        current = {batch['gt_path']: k for k, batch in enumerate(self.batches)}
+
+        parts = [self.columns]
+        for gt_rel in found:
+            path = os.path.join(self.root, gt_rel)
+            stat = os.stat(path)
+            k = current.get(gt_rel)
+            if k is not None:
+                batch = self.batches[k]
+                if (stat.st_size, stat.st_mtime_ns) == (batch['size'], batch['mtime_ns']):
+                    continue
+                if stat.st_size >= batch['gt_bytes'] and _same_start(path, batch):
+                    # Appended rows only (a running or resumed generator)
+                    _, _, rows, end = _read_rows(path, batch['gt_bytes'], batch['header'])
+                    parts.append(_row_columns(k, batch['rows'], batch['header'], rows) if rows else _empty_columns())
+                    batch.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, gt_bytes=end, rows=batch['rows'] + len(rows))
+                    if rows and not batch['format']:
+                        batch.update(_batch_info(self.root, gt_rel, batch['settings'], rows, batch['header']))
+                    stats['updated'] += 1
+                    stats['rows'] += len(rows)
+                    continue
+                # Rewritten file: drop its rows and read it again under the same batch index
+                parts = [_take(part, part['batch'] != k) for part in parts]
+                stats['updated'] += 1
+            else:
+                k = len(self.batches)
+                self.batches.append(None)
+                stats['added'] += 1
+
+            settings, header, rows, end = _read_rows(path)
+            self.batches[k] = dict(_batch_info(self.root, gt_rel, settings, rows, header), gt_path=gt_rel,
+                                   settings=settings, header=header, start=_start_bytes(path),
+                                   size=stat.st_size, mtime_ns=stat.st_mtime_ns, gt_bytes=end, rows=len(rows))
+            if rows:
+                parts.append(_row_columns(k, 0, header, rows))
+            stats['rows'] += len(rows)
+
+        self.columns = {name: np.concatenate([part[name] for part in parts]) for name in ROW_COLUMNS}
+        order = np.lexsort((self.columns['row'], self.columns['batch']))
+        self.columns = _take(self.columns, order)
+        return stats
+
+    def _select_batches(self, keep):
+        """Keeps the listed batches (in order) and renumbers the batch column."""
+        if len(keep) == len(self.batches):
+            return
+        mapping = np.full(len(self.batches), -1, dtype=np.int32)
+        mapping[keep] = np.arange(len(keep), dtype=np.int32)
+        self.batches = [self.batches[k] for k in keep]
+        self.columns = _take(self.columns, mapping[self.columns['batch']] >= 0)
+        self.columns['batch'] = mapping[self.columns['batch']]
+
+    # --- QUERIES ---
+
+    def batch_frame(self):
+        """Batch table as a DataFrame (index: batch number)."""
+        return pd.DataFrame([{name: batch[name] for name in BATCH_COLUMNS} for batch in self.batches], columns=BATCH_COLUMNS)
+
+    def mask(self, **conditions):
+        """Boolean mask over all scans for the conditions (see the module docstring). Raises KeyError on unknown columns."""
+        selected = np.ones(len(self), dtype=bool)
+        batch_conditions = {name: value for name, value in conditions.items() if name in BATCH_COLUMNS}
+        if batch_conditions:
+            batches = self.batch_frame()
+            keep = np.ones(len(batches), dtype=bool)
+            for name, value in batch_conditions.items():
+                keep &= _condition_mask(batches[name].to_numpy(), value)
+            selected &= keep[self.columns['batch']] if len(batches) else False
+        for name, value in conditions.items():
+            if name in BATCH_COLUMNS:
+                continue
+            if name not in self.columns:
+                raise KeyError(f"Unknown catalog column '{name}' (choose from {', '.join(BATCH_COLUMNS + ROW_COLUMNS)})")
+            selected &= _condition_mask(self.columns[name], value)
+        return selected
+
+    def query(self, columns=None, **conditions):
+        """
+        DataFrame of the matching scans: their row columns and batch columns, in catalog order.
+        columns limits the result to these names.
+        """
+        rows = pd.DataFrame(_take(self.columns, self.mask(**conditions)))
+        frame = rows.join(self.batch_frame(), on='batch')
+        return frame if columns is None else frame[list(columns)]
+
+    def count(self, by=None, **conditions):
+        """Number of matching scans, or a Series of counts per value of the by column(s)."""
+        if by is None:
+            return int(self.mask(**conditions).sum())
+        return self.query(**conditions).groupby(by).size()
+
+    # --- SCAN ACCESS ---
+
+    def scan_path(self, row):
+        """File holding the scan of a query row (the container file for npy/shard/range)."""
+        directory = os.path.join(self.root, row['batch_dir'])
+        if self.batches[int(row['batch'])]['gt_path'] == "dataset_index.csv":
+            directory = os.path.join(directory, "scans")
+        return os.path.join(directory, row['filename'])
+
+    def iter_scans(self, frame):
+        """Yields (row, points) for the rows of a query result, one ScanStore per batch."""
+        stores = {}
+        for _, row in frame.iterrows():
+            batch = int(row['batch'])
+            if self.batches[batch]['gt_path'] == "dataset_index.csv":
+                yield row, load_scan_csv(self.scan_path(row))
+                continue
+            if batch not in stores:
+                stores[batch] = ScanStore(os.path.join(self.root, row['batch_dir']))
+            yield row, stores[batch][int(row['row'])]
+
+def _start_bytes(path, size=256):
+    """First bytes of a ground truth file (settings line and header), to recognize rewritten files."""
+    with open(path, 'rb') as f:
+        return f.read(size).decode('latin1')
+
+def _same_start(path, batch):
+    return _start_bytes(path, len(batch['start'])) == batch['start']
+
+def _empty_columns():
+    columns = {'batch': np.zeros(0, dtype=np.int32), 'row': np.zeros(0, dtype=np.int32),
+               'sample_id': np.zeros(0, dtype=np.int64), 'filename': np.zeros(0, dtype=str),
+               'offset': np.zeros(0, dtype=np.int64), 'count': np.zeros(0, dtype=np.int64)}
+    columns.update({name: np.zeros(0) for name in FLOAT_COLUMNS})
+    return columns
+
+def _take(columns, selection):
+    return {name: values[selection] for name, values in columns.items()}
+
+def _condition_mask(values, condition):
+    if callable(condition):
+        return np.asarray(condition(values), dtype=bool)
+    if isinstance(condition, tuple):
+        low, high = condition
+        mask = np.ones(len(values), dtype=bool)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+    if isinstance(condition, (list, set, frozenset)):
+        return np.isin(values, list(condition))
+    return values == condition
+
+def update_catalog(root, save=True):
+    """Loads the catalog of root, reads the new and changed ground truth files and saves it. Returns the catalog."""
+    catalog = DatasetCatalog.load(root)
+    stats = catalog.update()
+    if save and (stats['added'] or stats['updated'] or stats['removed'] or not os.path.exists(catalog.path)):
+        catalog.save()
+    print(f"Catalog {root}: {len(catalog)} scans in {len(catalog.batches)} batches "
+          f"({stats['added']} added, {stats['updated']} updated, {stats['removed']} removed, {stats['rows']} rows read)")
+    return catalog
+
+# --- 3. MAIN EXECUTION ---
+
+def parse_condition(text):
+    """'name=value' / 'name=low:high' (either end may be empty) / 'name=a|b' to (name, condition)."""
+    name, _, value = text.partition('=')
+
+    def convert(item):
+        for kind in (int, float):
+            try:
+                return kind(item)
+            except ValueError:
+                pass
+        return item
+
+    if ':' in value and name in FLOAT_COLUMNS + ['sample_id', 'row', 'offset', 'count', 'res_w', 'res_h', 'fov_h', 'fov_v',
+                                                 'pos_x', 'pos_y', 'pos_z', 'max_dist', 'seed']:
+        low, high = value.split(':')
+        return name, (convert(low) if low else None, convert(high) if high else None)
+    if '|' in value:
+        return name, [convert(item) for item in value.split('|')]
+    if value.lower() in ('true', 'false'):
+        return name, value.lower() == 'true'
+    return name, convert(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / update the scan catalog of a data root and query it")
+    parser.add_argument("root", help="Data root (Blender_Generated_Data)")
+    parser.add_argument("--where", action="append", default=[], metavar="COND",
+                        help="name=value, name=low:high or name=a|b (repeatable)")
+    parser.add_argument("--by", default=None, help="Count the matches per value of this column")
+    parser.add_argument("--out", default=None, help="Write the matching rows to this csv")
+    args = parser.parse_args()
+
+    catalog = update_catalog(args.root)
+    conditions = dict(parse_condition(text) for text in args.where)
+    if args.by:
+        print(catalog.count(by=args.by, **conditions).to_string())
+    else:
+        print(f"{catalog.count(**conditions)} matching scans")
+    if args.out:
+        catalog.query(**conditions).to_csv(args.out, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Content-addressed on-disk cache for per-scan registration features
+(downsampled points, normals, FPFH descriptors).
+
+The key is a hash of the scan's points plus the voxel size and search parameters, so it does
+not depend on the storage format or file name. A rerun with other ICP / RANSAC settings finds
+every entry. A new voxel size or feature parameter gives new keys. Entries are float64 .npz
+files, so a cached run gets exactly the arrays of an uncached one. When the total size exceeds max_bytes, the least recently used entries are removed.
+
+Safe to share between the worker processes of registration_eval.evaluate.
+"""
+import os
+import json
+import zipfile
+import hashlib
+import numpy as np
+
+# Part of every key; raised when the entry contents change (2: float64 entries instead of float32)
+ENTRY_VERSION = 2
+
+def feature_key(points, voxel_size, params):
+    """Cache key of one scan's features."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(np.ascontiguousarray(points, dtype='<f4').tobytes())
+    digest.update(json.dumps({'version': ENTRY_VERSION, 'voxel_size': float(voxel_size), **params}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+class FeatureCache:
+    """Directory of <key>.npz feature entries, bounded to max_bytes in total."""
+
+    def __init__(self, cache_dir, max_bytes=2 * 2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._bytes = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _entries(self):
+        """(last use, size, path) of every entry."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npz'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def get(self, key):
+        """Cached arrays of key as a dict, or None."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+            # The modification time is the last use for the LRU eviction
+            os.utime(path)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return arrays
+
+    def put(self, key, arrays):
+        """Stores a dict of arrays as float64 (what Open3D returns)."""
+        path = self._path(key)
+        # Write to a private file first, so other processes never read half an entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **{name: np.asarray(value, dtype=np.float64) for name, value in arrays.items()})
+        os.replace(tmp_path, path)
+
+        self._bytes += os.path.getsize(path)
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._bytes = total
+
+    def clear(self):
+        for _, _, path in self._entries():
+            os.remove(path)
+        self._bytes = 0
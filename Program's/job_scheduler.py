@@ -0,0 +1,355 @@
+"""
+Parallel, resumable scheduler for the Run_Matrix of Data_generation_settings.xlsx.
+
+Every active Run_Matrix row is expanded into (batch, sensor, position) jobs. The jobs run
+in a bounded pool of generator processes, and their state is kept in a JSON ledger
+(job_ledger.json in the output root):
+
+    - jobs whose output is complete (and generated with the same arguments) are skipped on a rerun
+    - failed jobs are retried up to 'retries' times
+    - status, attempts, timings and the last error of every job stay in the ledger
+
+Used by DataGenerator.ipynb:
+
+    jobs, problems = expand_run_matrix(df_matrix, df_sensors, df_positions, df_datasets, OUTPUT_ROOT)
+    ledger = JobLedger(os.path.join(OUTPUT_ROOT, "job_ledger.json"))
+    scheduler = JobScheduler(ledger, max_workers=4, on_update=callback)
+    scheduler.run(jobs, lambda job: blender_command(BLENDER_EXE, BLEND_FILE, SENSOR_PROGRAM_FILE, job['args']))
+
+With worker_command (a 'BlenderSensorProgram.py --serve' command line) the jobs are fed to
+max_workers warm Blender processes instead of starting Blender once per job:
+
+    scheduler.run(jobs, worker_command=blender_command(BLENDER_EXE, BLEND_FILE, SENSOR_PROGRAM_FILE, ["--serve"]))
+
+With paired=True a batch becomes a single --setups job: every pose is scanned from all of its
+sensors and positions, so the setups see the same target poses (same output layout).
+"""
+import os
+import json
+import time
+import queue
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+from sensor_core import job_spec, parse_job_report
+
+MATRIX_FIXED_COLUMNS = ['Batch_ID', 'Generate', 'Data generation settings']
+
+# --- 1. JOBS ---
+
+def generator_args(sensor_spec, pos_spec, data_spec, output_dir, viz=True):
+    """Generator command line arguments of one sensor/position/dataset combination."""
+    args = [
+        "--sensor_res", f"{int(sensor_spec['resolution_width'])}x{int(sensor_spec['resolution_height'])}",
+        "--sensor_fov", f"{sensor_spec['fov_horizontal']}x{sensor_spec['fov_vertical']}",
+        "--position", f"{pos_spec['pos_x']},{pos_spec['pos_y']},{pos_spec['pos_z']}",
+        "--samples", str(int(data_spec['num_samples'])),
+        "--output", output_dir,
+
+        # Optional args (using .get() in case they are missing in Excel)
+        "--max_dist", f"{sensor_spec['max_range']}",
+        "--noise", str(sensor_spec.get('noise_level', 0.0)),
+        "--target_name", "Cube",
+    ]
+    return args + _dataset_args(data_spec, viz)
+
+def setup_spec(sensor_spec, pos_spec, name):
+    """--setups entry of one sensor/position combination (see sensor_core.load_setups)."""
+    return {
+        "name": name,
+        "sensor_res": f"{int(sensor_spec['resolution_width'])}x{int(sensor_spec['resolution_height'])}",
+        "sensor_fov": f"{sensor_spec['fov_horizontal']}x{sensor_spec['fov_vertical']}",
+        "position": f"{pos_spec['pos_x']},{pos_spec['pos_y']},{pos_spec['pos_z']}",
+        "max_dist": float(sensor_spec['max_range']),
+        "noise": float(sensor_spec.get('noise_level', 0.0)),
+    }
+
+def paired_generator_args(setups, data_spec, output_dir, viz=True):
+    """Generator command line arguments of one run that scans every pose from all setups (setup_spec dicts)."""
+    args = [
+        "--setups", json.dumps(setups),
+        "--samples", str(int(data_spec['num_samples'])),
+        "--output", output_dir,
+        "--target_name", "Cube",
+    ]
+    return args + _dataset_args(data_spec, viz)
+
+def _dataset_args(data_spec, viz):
+    args = ["--viz"] if viz else []
+
+    # Add ranges if they exist in the dataset spec
+    if 'rot_range' in data_spec:
+        args.extend(["--rot_range", str(data_spec['rot_range'])])
+    if 'trans_range' in data_spec:
+        args.extend(["--trans_range", str(data_spec['trans_range'])])
+    # Optional 'pose_sampler' column (random, quaternion, sobol, halton, grid), empty cells keep random
+    if isinstance(data_spec.get('pose_sampler'), str):
+        args.extend(["--pose_sampler", data_spec['pose_sampler']])
+    return args
+
+def blender_command(blender_exe, blend_file, program_file, args):
+    """Background Blender call of BlenderSensorProgram.py. Script errors give a non-zero exit code."""
+    return [blender_exe, "-b", blend_file, "--python-exit-code", "1", "-P", program_file, "--"] + list(args)
+
+def expand_run_matrix(df_matrix, df_sensors, df_positions, df_datasets, output_root, viz=True, paired=False, profile=False):
+    """
+    Expands the active Run_Matrix rows into jobs: one per (batch, sensor, position), or with
+    paired one per batch that scans every pose from all its sensors and positions.
+    With profile the generators write profile_summary.json into the job's output_dir (see profiler.py).
+    Returns (jobs, problems) where problems maps a batch id to the reason it has no jobs.
+    """
+    extra_args = ["--profile"] if profile else []
+    # One debug view cache for the whole matrix: jobs with the same sensor and position reuse the views
+    if viz:
+        extra_args += ["--viz_cache", os.path.join(output_root, "viz_cache")]
+    active = df_matrix[df_matrix['Generate'].astype(str).str.upper().isin(['JA', 'YES', 'TRUE'])]
+    jobs, problems = [], {}
+
+    for _, row in active.iterrows():
+        batch_id = row['Batch_ID']
+        dataset_id = row['Data generation settings']
+
+        if dataset_id not in df_datasets.index:
+            problems[batch_id] = f"ERROR: Dataset '{dataset_id}' not found!"
+            continue
+        data_spec = df_datasets.loc[dataset_id]
+
+        # Select Sensors & Positions (any non-empty cell in their column)
+        selected_sensors, selected_positions = [], []
+        for col_name in df_matrix.columns:
+            if col_name in MATRIX_FIXED_COLUMNS:
+                continue
+            cell_value = row[col_name]
+            if pd.notna(cell_value) and str(cell_value).strip() != "":
+                if col_name in df_sensors.index:
+                    selected_sensors.append(col_name)
+                elif col_name in df_positions.index:
+                    selected_positions.append(col_name)
+
+        if not selected_sensors or not selected_positions:
+            problems[batch_id] = "Skipped (No sensors/positions selected)"
+            continue
+
+        if paired:
+            combos = [(sens_id, pos_id) for sens_id in selected_sensors for pos_id in selected_positions]
+            output_dir = os.path.join(output_root, batch_id)
+            setups = [setup_spec(df_sensors.loc[s], df_positions.loc[p], f"{s}/{p}") for s, p in combos]
+            jobs.append({
+                'key': batch_id,
+                'batch_id': batch_id,
+                'sensor_id': "+".join(selected_sensors),
+                'pos_id': "+".join(selected_positions),
+                'output_dir': output_dir,
+                'setup_dirs': [os.path.join(output_dir, s, p) for s, p in combos],
+                'samples': int(data_spec['num_samples']),
+                'args': paired_generator_args(setups, data_spec, output_dir, viz) + extra_args,
+            })
+            continue
+
+        for sens_id in selected_sensors:
+            for pos_id in selected_positions:
+                output_dir = os.path.join(output_root, batch_id, sens_id, pos_id)
+                jobs.append({
+                    'key': f"{batch_id}/{sens_id}/{pos_id}",
+                    'batch_id': batch_id,
+                    'sensor_id': sens_id,
+                    'pos_id': pos_id,
+                    'output_dir': output_dir,
+                    'samples': int(data_spec['num_samples']),
+                    'args': generator_args(df_sensors.loc[sens_id], df_positions.loc[pos_id], data_spec, output_dir, viz) + extra_args,
+                })
+    return jobs, problems
+
+def output_complete(job):
+    """True when the ground_truth.csv of the job (of every setup of a paired job) holds a row for every requested sample."""
+    for output_dir in job.get('setup_dirs', [job['output_dir']]):
+        gt_path = os.path.join(output_dir, "ground_truth.csv")
+        if not os.path.exists(gt_path):
+            return False
+        with open(gt_path, 'r') as f:
+            rows = sum(1 for line in f if line.strip() and not line.startswith('#')) - 1
+        if rows < job['samples']:
+            return False
+    return True
+
+# --- 2. LEDGER ---
+
+class JobLedger:
+    """Persistent per-job state, rewritten atomically after every change."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+
+    def get(self, key):
+        return self.entries.get(key, {})
+
+    def update(self, key, **fields):
+        with self.lock:
+            self.entries.setdefault(key, {}).update(fields)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def is_done(self, job):
+        """Done in an earlier run with the same arguments, and the output is still there."""
+        entry = self.get(job['key'])
+        return entry.get('status') == 'done' and entry.get('args') == job['args'] and output_complete(job)
+
+# --- 3. SCHEDULER ---
+
+def _run_process(cmd, log_path):
+    """Runs one generator process. Returns None on success, else an error message."""
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    try:
+        with open(log_path, 'w') as log:
+            result = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT)
+    except OSError as e:
+        return str(e)
+    if result.returncode != 0:
+        return f"exit code {result.returncode} (see {log_path})"
+    return None
+
+class WarmWorker:
+    """One long-running '--serve' generator process, fed with job specs over stdin."""
+
+    def __init__(self, command):
+        self.proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, text=True, bufsize=1)
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def run(self, job, log_path):
+        """Runs one job. Returns None on success, else an error message."""
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, 'w') as log:
+            try:
+                self.proc.stdin.write(json.dumps(job_spec(job['args'], job['key'])) + "\n")
+                self.proc.stdin.flush()
+            except OSError as e:
+                return f"worker not reachable: {e}"
+
+            # Everything up to the job's report line is its log output
+            for line in self.proc.stdout:
+                report = parse_job_report(line)
+                if report is None:
+                    log.write(line)
+                elif report['status'] == 'done':
+                    return None
+                else:
+                    return f"{report.get('error')} (see {log_path})"
+        return f"worker exited with code {self.proc.wait()} (see {log_path})"
+
+    def close(self):
+        if self.alive():
+            self.proc.stdin.close()
+            self.proc.wait()
+
+class JobScheduler:
+    """
+    Runs jobs in a pool of at most max_workers concurrent generator processes.
+    on_update(job, status) is called from the calling thread for every state change
+    ('skipped', 'queued', 'running', 'retrying', 'done', 'failed'). A job is 'queued' once submitted
+    to the pool and 'running' when a pool thread actually starts its process.
+    """
+
+    def __init__(self, ledger, max_workers=None, retries=1, on_update=None):
+        self.ledger = ledger
+        self.max_workers = max_workers or os.cpu_count()
+        self.retries = retries
+        self.on_update = on_update or (lambda job, status: None)
+
+    def run(self, jobs, command_for=None, worker_command=None):
+        """
+        Runs all jobs, either one process per job (command_for(job) gives its command line)
+        or through warm workers started with worker_command. Returns {status: [job keys]}.
+        """
+        idle_workers = queue.Queue()
+
+        def execute(job, log_path):
+            if worker_command is None:
+                return _run_process(command_for(job), log_path)
+            # At most max_workers jobs run at once, so at most max_workers workers are started
+            try:
+                worker = idle_workers.get_nowait()
+            except queue.Empty:
+                try:
+                    worker = WarmWorker(worker_command)
+                except OSError as e:
+                    return f"worker could not be started: {e}"
+            error = worker.run(job, log_path)
+            if worker.alive():
+                idle_workers.put(worker)
+            return error
+
+        try:
+            return self._run(jobs, execute)
+        finally:
+            while not idle_workers.empty():
+                idle_workers.get_nowait().close()
+
+    def _run(self, jobs, execute):
+        summary = {'skipped': [], 'done': [], 'failed': []}
+
+        todo = []
+        for job in jobs:
+            if self.ledger.is_done(job):
+                summary['skipped'].append(job['key'])
+                self.on_update(job, 'skipped')
+            else:
+                todo.append(job)
+
+        # Jobs a pool thread has picked up, reported to on_update from this thread
+        started = queue.Queue()
+
+        def start(job, log_path):
+            self.ledger.update(job['key'], status='running', started=time.time())
+            started.put(job)
+            return execute(job, log_path)
+
+        def report_started():
+            while not started.empty():
+                self.on_update(started.get_nowait(), 'running')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {}
+
+            def submit(job, attempts):
+                self.ledger.update(job['key'], status='queued', attempts=attempts, args=job['args'],
+                                   started=None, finished=None, error=None)
+                log_path = os.path.join(job['output_dir'], "generator.log")
+                futures[pool.submit(start, job, log_path)] = (job, attempts)
+                self.on_update(job, 'queued')
+
+            for job in todo:
+                submit(job, 1)
+
+            while futures:
+                finished, _ = wait(futures, timeout=0.5, return_when=FIRST_COMPLETED)
+                report_started()
+                for future in finished:
+                    job, attempts = futures.pop(future)
+                    error = future.result()
+                    if error is None:
+                        self.ledger.update(job['key'], status='done', finished=time.time())
+                        summary['done'].append(job['key'])
+                        self.on_update(job, 'done')
+                    elif attempts <= self.retries:
+                        self.ledger.update(job['key'], status='retrying', error=error)
+                        self.on_update(job, 'retrying')
+                        submit(job, attempts + 1)
+                    else:
+                        self.ledger.update(job['key'], status='failed', error=error, finished=time.time())
+                        summary['failed'].append(job['key'])
+                        self.on_update(job, 'failed')
+        return summary
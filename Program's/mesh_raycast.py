@@ -0,0 +1,262 @@
+"""
+Pure NumPy triangle mesh ray casting for the headless generator.
+Loads OBJ/PLY meshes, builds a bounding volume hierarchy and intersects whole
+batches of rays with vectorized Moller-Trumbore tests.
+"""
+import os
+import numpy as np
+
+# --- 1. MESH LOADING ---
+
+def load_mesh(filepath, scale=1.0):
+    """
+    Loads a triangle mesh from an .obj or .ply file.
+    Polygons are fan-triangulated. Returns (vertices (V, 3) float64, faces (F, 3) int64).
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == ".obj":
+        vertices, faces = _load_obj(filepath)
+    elif ext == ".ply":
+        vertices, faces = _load_ply(filepath)
+    else:
+        raise ValueError(f"Unsupported mesh format '{ext}' (use .obj or .ply)")
+
+    if len(faces) == 0:
+        raise ValueError(f"Mesh '{filepath}' contains no faces")
+    return vertices * scale, faces
+
+def _triangulate(polygons):
+    """Fan-triangulates a list of vertex index lists."""
+    triangles = []
+    for poly in polygons:
+        for k in range(1, len(poly) - 1):
+            triangles.append((poly[0], poly[k], poly[k + 1]))
+    return np.array(triangles, dtype=np.int64).reshape(-1, 3)
+
+def _load_obj(filepath):
+    vertices, polygons = [], []
+    with open(filepath, 'r') as f:
+        for line in f:
+            if line.startswith('v '):
+                vertices.append([float(x) for x in line.split()[1:4]])
+            elif line.startswith('f '):
+                poly = []
+                for token in line.split()[1:]:
+                    # 'v', 'v/vt', 'v//vn' or 'v/vt/vn', 1-based or negative (relative)
+                    idx = int(token.split('/')[0])
+                    poly.append(idx - 1 if idx > 0 else len(vertices) + idx)
+                polygons.append(poly)
+    return np.array(vertices, dtype=np.float64).reshape(-1, 3), _triangulate(polygons)
+
+_PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+
+def _load_ply(filepath):
+    with open(filepath, 'rb') as f:
+        if f.readline().strip() != b'ply':
+            raise ValueError(f"'{filepath}' is not a PLY file")
+
+        # Header: format + elements with their properties
+        fmt, elements = None, []
+        while True:
+            words = f.readline().decode('ascii').split()
+            if not words or words[0] == 'comment':
+                continue
+            if words[0] == 'end_header':
+                break
+            if words[0] == 'format':
+                fmt = words[1]
+            elif words[0] == 'element':
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == 'property':
+                elements[-1][2].append(words[1:])
+
+        endian = '>' if fmt == 'binary_big_endian' else '<'
+        if fmt == 'ascii':
+            lines = iter(f.read().decode('ascii').splitlines())
+
+        def read_binary(kind, count):
+            dtype = np.dtype(endian + _PLY_TYPES[kind])
+            return np.frombuffer(f.read(count * dtype.itemsize), dtype=dtype, count=count)
+
+        vertices, polygons = None, []
+        for name, count, props in elements:
+            if fmt != 'ascii' and not any(p[0] == 'list' for p in props):
+                # Fixed-size binary records are read in one go
+                dtype = np.dtype([(p[1], endian + _PLY_TYPES[p[0]]) for p in props])
+                data = np.frombuffer(f.read(count * dtype.itemsize), dtype=dtype, count=count)
+                if name == 'vertex':
+                    vertices = np.stack([data['x'], data['y'], data['z']], axis=1).astype(np.float64)
+                continue
+
+            rows = []
+            for _ in range(count):
+                row = {}
+                if fmt == 'ascii':
+                    values, pos = next(lines).split(), 0
+                    for p in props:
+                        if p[0] == 'list':
+                            n = int(values[pos])
+                            row[p[-1]] = [int(v) for v in values[pos + 1:pos + 1 + n]]
+                            pos += 1 + n
+                        else:
+                            row[p[-1]] = float(values[pos])
+                            pos += 1
+                else:
+                    for p in props:
+                        if p[0] == 'list':
+                            n = int(read_binary(p[1], 1)[0])
+                            row[p[-1]] = read_binary(p[2], n).tolist()
+                        else:
+                            row[p[-1]] = read_binary(p[0], 1)[0]
+                rows.append(row)
+
+            if name == 'vertex':
+                vertices = np.array([[r['x'], r['y'], r['z']] for r in rows], dtype=np.float64)
+            elif name == 'face':
+                # 'vertex_indices' (or 'vertex_index' in older exporters) is the only list property
+                key = next(p[-1] for p in props if p[0] == 'list')
+                polygons = [r[key] for r in rows]
+
+    return vertices.reshape(-1, 3), _triangulate(polygons)
+
+# --- 2. BVH ---
+
+class TriangleBVH:
+    """
+    Static bounding volume hierarchy over a triangle mesh (median split on the
+    longest centroid axis). Nodes are stored as flat arrays; leaves reference a
+    contiguous range of the reordered triangles.
+    """
+
+    def __init__(self, vertices, faces, leaf_size=8):
+        tris = vertices[faces]                       # (F, 3 corners, 3)
+        centroids = tris.mean(axis=1)
+        tri_min, tri_max = tris.min(axis=1), tris.max(axis=1)
+
+        order = np.arange(len(faces))
+        bbox_min, bbox_max, left, right, start, count = [], [], [], [], [], []
+
+        def new_node(lo, hi):
+            idx = order[lo:hi]
+            bbox_min.append(tri_min[idx].min(axis=0))
+            bbox_max.append(tri_max[idx].max(axis=0))
+            left.append(-1); right.append(-1)
+            start.append(lo); count.append(hi - lo)
+            return len(start) - 1
+
+        stack = [(new_node(0, len(faces)), 0, len(faces))]
+        while stack:
+            node, lo, hi = stack.pop()
+            if hi - lo <= leaf_size:
+                continue
+            idx = order[lo:hi]
+            c = centroids[idx]
+            axis = np.argmax(c.max(axis=0) - c.min(axis=0))
+            mid = (hi - lo) // 2
+            part = np.argpartition(c[:, axis], mid)
+            order[lo:hi] = idx[part]
+            mid += lo
+
+            left[node] = new_node(lo, mid)
+            right[node] = new_node(mid, hi)
+            count[node] = 0
+            stack.append((left[node], lo, mid))
+            stack.append((right[node], mid, hi))
+
+        self.bbox_min = np.array(bbox_min)
+        self.bbox_max = np.array(bbox_max)
+        self.left = np.array(left)
+        self.right = np.array(right)
+        self.start = np.array(start)
+        self.count = np.array(count)
+
+        # Triangles in leaf order, pre-split for Moller-Trumbore
+        tris = tris[order]
+        self.v0 = tris[:, 0]
+        self.e1 = tris[:, 1] - tris[:, 0]
+        self.e2 = tris[:, 2] - tris[:, 0]
+        self.face_index = order
+
+    @property
+    def bounds(self):
+        """(min, max) corners of the whole mesh."""
+        return self.bbox_min[0], self.bbox_max[0]
+
+    def ray_cast(self, origin, directions, max_dist, chunk_size=65536):
+        """
+        Casts rays from a single origin along (R, 3) directions.
+        Returns (t (R,), face (R,)): hit parameter along each direction (inf on a miss)
+        and the hit face index (-1 on a miss). Both triangle sides are hit, like Blender.
+        """
+        origin = np.asarray(origin, dtype=np.float64)
+        directions = np.asarray(directions, dtype=np.float64)
+        t_best = np.full(len(directions), np.inf)
+        face = np.full(len(directions), -1, dtype=np.int64)
+
+        for lo in range(0, len(directions), chunk_size):
+            hi = min(lo + chunk_size, len(directions))
+            t_best[lo:hi], face[lo:hi] = self._cast_chunk(origin, directions[lo:hi], max_dist)
+        return t_best, face
+
+    def _cast_chunk(self, origin, directions, max_dist):
+        t_best = np.full(len(directions), float(max_dist))
+        tri_best = np.full(len(directions), -1, dtype=np.int64)
+
+        safe = np.where(np.abs(directions) < 1e-12, 1e-12, directions)
+        inv_dir = 1.0 / safe
+
+        stack = [(0, np.arange(len(directions)))]
+        while stack:
+            node, rays = stack.pop()
+
+            # Slab test of the node box against the still active rays
+            t0 = (self.bbox_min[node] - origin) * inv_dir[rays]
+            t1 = (self.bbox_max[node] - origin) * inv_dir[rays]
+            t_near = np.minimum(t0, t1).max(axis=1)
+            t_far = np.maximum(t0, t1).min(axis=1)
+            keep = (t_far >= np.maximum(t_near, 0.0)) & (t_near <= t_best[rays])
+            rays = rays[keep]
+            if len(rays) == 0:
+                continue
+
+            if self.left[node] >= 0:
+                stack.append((self.right[node], rays))
+                stack.append((self.left[node], rays))
+                continue
+
+            lo = self.start[node]
+            hi = lo + self.count[node]
+            t, k = self._intersect(origin, directions[rays], lo, hi)
+            closer = t < t_best[rays]
+            t_best[rays[closer]] = t[closer]
+            tri_best[rays[closer]] = k[closer]
+
+        hit = tri_best >= 0
+        t_best[~hit] = np.inf
+        face = np.where(hit, self.face_index[np.maximum(tri_best, 0)], -1)
+        return t_best, face
+
+    def _intersect(self, origin, directions, lo, hi):
+        """Moller-Trumbore of (M, 3) rays against triangles lo:hi. Returns nearest (t, triangle)."""
+        v0, e1, e2 = self.v0[lo:hi], self.e1[lo:hi], self.e2[lo:hi]
+
+        pvec = np.cross(directions[:, np.newaxis, :], e2[np.newaxis])      # (M, K, 3)
+        det = np.einsum('kj,mkj->mk', e1, pvec)
+        valid = np.abs(det) > 1e-12
+        inv_det = np.where(valid, 1.0 / np.where(valid, det, 1.0), 0.0)
+
+        tvec = origin - v0                                                  # (K, 3)
+        u = np.einsum('kj,mkj->mk', tvec, pvec) * inv_det
+        qvec = np.cross(tvec, e1)                                           # (K, 3)
+        v = (directions @ qvec.T) * inv_det
+        t = (e2 * qvec).sum(axis=1)[np.newaxis, :] * inv_det
+
+        valid &= (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t > 1e-9)
+        t = np.where(valid, t, np.inf)
+        k = t.argmin(axis=1)
+        return t[np.arange(len(t)), k], k + lo
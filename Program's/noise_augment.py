@@ -0,0 +1,208 @@
+"""
+Sensor noise as a separate stage on stored (clean) scans, instead of raycasting again per noise level.
+
+Noise models, all vectorized per scan and seeded per sample:
+
+    gaussian      isotropic gaussian noise, std in meters
+    range         depth noise along the sensor ray with std = range * distance^2 (D435-like)
+    dropout       fraction of points removed at random
+    flying        fraction of silhouette / depth-edge points pushed back along their ray
+                  by up to flying_depth meters (flying pixels)
+
+The sensor position, resolution and FOV come from the '# Settings:' line of the batch.
+Every variant is written as a derived batch (<batch>_<variant>) with the same poses in
+its ground_truth.csv and an augmentation.json that links back to the source batch:
+
+    python noise_augment.py ../Blender_Generated_Data/Test_1 \
+        --variant gauss_1mm:gaussian=0.001 --variant d435:range=0.001,dropout=0.02,flying=0.3
+
+All variants of a batch are produced in a single read pass over its scans.
+"""
+import os
+import csv
+import glob
+import json
+import zlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sensor_core import (SCAN_FORMATS, RANGE_FORMATS, parse_settings_line, sensor_rotation, project_points,
+                         ground_truth_row, GT_HEADER)
+from scan_store import ScanStore, open_batch_output
+
+NOISE_DEFAULTS = {"gaussian": 0.0, "range": 0.0, "dropout": 0.0, "flying": 0.0, "flying_depth": 0.05, "edge_jump": 0.05}
+
+def parse_noise_spec(spec):
+    """'gaussian=0.001,dropout=0.05' to a full noise model dict. Raises ValueError on unknown keys."""
+    model = dict(NOISE_DEFAULTS)
+    for item in filter(None, spec.split(',')):
+        key, value = item.split('=')
+        if key not in NOISE_DEFAULTS:
+            raise ValueError(f"Unknown noise parameter '{key}' (choose from {', '.join(NOISE_DEFAULTS)})")
+        model[key] = float(value)
+    return model
+
+# --- 1. NOISE MODELS ---
+
+def ray_directions(points, sensor_pos):
+    """Unit directions from the sensor to every point, and the distances."""
+    offsets = points - sensor_pos
+    dist = np.linalg.norm(offsets, axis=1)
+    return offsets / np.maximum(dist, 1e-12)[:, np.newaxis], dist
+
+def add_gaussian_noise(points, sigma, rng):
+    return points + rng.normal(0.0, sigma, points.shape)
+
+def add_range_noise(points, sensor_pos, coeff, rng):
+    """Depth error along the ray with a std growing with the squared distance."""
+    dirs, dist = ray_directions(points, sensor_pos)
+    return points + dirs * rng.normal(0.0, 1.0, len(points))[:, np.newaxis] * (coeff * dist**2)[:, np.newaxis]
+
+def apply_dropout(points, rate, rng):
+    return points[rng.random(len(points)) >= rate]
+
+def edge_mask(points, sensor, edge_jump=0.05):
+    """
+    Points on a silhouette or depth edge. The points are put back on the sensor's pixel grid
+    (project_points); a pixel is an edge when a 4-neighbour has no hit or a range more than
+    edge_jump meters away.
+    """
+    res_w, res_h = sensor["res_w"], sensor["res_h"]
+    row, col, depth = project_points(points, sensor["position"], sensor_rotation(sensor["position"]),
+                                     res_w, res_h, sensor["fov_h"], sensor["fov_v"])
+
+    # Depth image with a one pixel border of 'no hit'
+    image = np.full((res_h + 2, res_w + 2), np.nan)
+    image[row + 1, col + 1] = depth
+
+    edge = np.zeros(len(points), dtype=bool)
+    for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+        neighbour = image[row + 1 + dr, col + 1 + dc]
+        edge |= np.isnan(neighbour) | (np.abs(neighbour - depth) > edge_jump)
+    return edge
+
+def add_flying_pixels(points, sensor_pos, edge, rate, max_offset, rng):
+    """Pushes a fraction of the edge points back along their ray by up to max_offset meters."""
+    flying = edge & (rng.random(len(points)) < rate)
+    dirs, _ = ray_directions(points[flying], sensor_pos)
+    points = points.copy()
+    points[flying] += dirs * rng.uniform(0.0, max_offset, flying.sum())[:, np.newaxis]
+    return points
+
+def augment_points(points, model, sensor, rng, edge=None):
+    """Applies a noise model to one clean scan. edge (edge_mask) is only needed for flying pixels."""
+    points = np.asarray(points, dtype=np.float64)
+    if model["flying"] > 0:
+        if edge is None:
+            edge = edge_mask(points, sensor, model["edge_jump"])
+        points = add_flying_pixels(points, sensor["position"], edge, model["flying"], model["flying_depth"], rng)
+    if model["range"] > 0:
+        points = add_range_noise(points, sensor["position"], model["range"], rng)
+    if model["gaussian"] > 0:
+        points = add_gaussian_noise(points, model["gaussian"], rng)
+    if model["dropout"] > 0:
+        points = apply_dropout(points, model["dropout"], rng)
+    return points.astype(np.float32)
+
+def variant_rng(seed, sample_id, name):
+    """Independent RNG per (seed, sample, variant), so variants and reruns never share noise."""
+    return np.random.default_rng(np.random.SeedSequence([seed, sample_id, zlib.crc32(name.encode())]))
+
+# --- 2. DERIVED DATASETS ---
+
+def augment_batch(directory, variants, out_root=None, fmt=None, seed=None):
+    """
+    Writes one derived batch per {name: noise model} variant of a batch directory.
+    Output goes to <directory>_<name>, or <out_root>/<batch name>_<name>. fmt defaults to the
+    source format, npy for range sources (noisy points leave their pixel ray, so the range
+    formats cannot hold them), seed to the seed in the settings line.
+    Returns the output directories. Raises ValueError for a range output format.
+    """
+    if fmt in RANGE_FORMATS:
+        raise ValueError(f"noisy scans need a point format, not '{fmt}'")
+    store = ScanStore(directory)
+    sensor = parse_settings_line(store.settings)
+    if seed is None:
+        seed = sensor["seed"] or 0
+    if fmt is None:
+        fmt = "npy" if store.format in RANGE_FORMATS else store.format
+
+    batch_dir = os.path.normpath(directory)
+    outputs = {}
+    for name, model in variants.items():
+        out_dir = f"{batch_dir}_{name}" if out_root is None else os.path.join(out_root, f"{os.path.basename(batch_dir)}_{name}")
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, "augmentation.json"), 'w') as f:
+            json.dump({"source": os.path.relpath(batch_dir, out_dir),
+                       "source_ground_truth": os.path.relpath(os.path.join(batch_dir, "ground_truth.csv"), out_dir),
+                       "noise": model, "seed": seed}, f, indent=1)
+        gt_file, writer, _ = open_batch_output(out_dir, "ground_truth.csv", "scans", fmt, store.settings + "\n", [])
+        outputs[name] = (out_dir, gt_file, writer, csv.writer(gt_file))
+
+    try:
+        for i, row in enumerate(store.rows):
+            clean = np.asarray(store[i], dtype=np.float64)
+            sample_id = int(row['sample_id'])
+            matrix = store.matrix(i)
+            params = {k: float(row[k]) for k in GT_HEADER[2:]}
+
+            # The edges only depend on the clean scan, so variants with the same edge_jump share them
+            edges = {}
+            for name, model in variants.items():
+                _, _, writer, gt_writer = outputs[name]
+                edge = None
+                if model["flying"] > 0:
+                    if model["edge_jump"] not in edges:
+                        edges[model["edge_jump"]] = edge_mask(clean, sensor, model["edge_jump"])
+                    edge = edges[model["edge_jump"]]
+                points = augment_points(clean, model, sensor, variant_rng(seed, sample_id, name), edge)
+                filename, storage = writer.write(sample_id, points, matrix)
+                gt_writer.writerow(ground_truth_row(sample_id, filename, matrix, params) + storage)
+    finally:
+        for _, gt_file, writer, _ in outputs.values():
+            writer.close()
+            gt_file.close()
+
+    print(f"Augmented {len(store)} scans of {directory} into {len(variants)} variants")
+    return [out_dir for out_dir, _, _, _ in outputs.values()]
+
+def source_batches(root):
+    """Batch directories below root, without derived (augmented) batches."""
+    batches = []
+    for gt_path in sorted(glob.glob(os.path.join(root, "**", "ground_truth.csv"), recursive=True)):
+        directory = os.path.dirname(gt_path)
+        if not os.path.exists(os.path.join(directory, "augmentation.json")):
+            batches.append(directory)
+    return batches
+
+def augment_tree(root, variants, fmt=None, seed=None, workers=None):
+    """augment_batch for every source batch below root (or root itself), one process per batch."""
+    batches = source_batches(root)
+    variants = {name: dict(NOISE_DEFAULTS, **model) for name, model in variants.items()}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(augment_batch, batch, variants, None, fmt, seed) for batch in batches]
+        return [out_dir for future in futures for out_dir in future.result()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Derive noisy datasets from clean scans")
+    parser.add_argument("directory", help="Batch directory, or a root with Test_*/cam_*/setup_* batches")
+    parser.add_argument("--variant", action="append", required=True, metavar="NAME:SPEC",
+                        help="e.g. d435:range=0.001,dropout=0.02,flying=0.3 (repeatable)")
+    parser.add_argument("--format", choices=[fmt for fmt in SCAN_FORMATS if fmt not in RANGE_FORMATS], default=None,
+                        help="Output format (default: as source, npy for range sources)")
+    parser.add_argument("--seed", type=int, default=None, help="Noise seed (default: the run's seed)")
+    parser.add_argument("--workers", type=int, default=None, help="Batches processed in parallel")
+    args = parser.parse_args()
+
+    variants = {}
+    for item in args.variant:
+        name, _, spec = item.partition(':')
+        variants[name] = parse_noise_spec(spec)
+
+    outputs = augment_tree(args.directory, variants, args.format, args.seed, args.workers)
+    print(f"--- {len(outputs)} derived batches written ---")
+
+if __name__ == "__main__":
+    main()
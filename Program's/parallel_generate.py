@@ -0,0 +1,115 @@
+"""
+Splits one generator run over several worker processes.
+
+Every worker generates a disjoint, contiguous slice of the sample ids with the same base
+seed (--shards K --shard-index k --seed S), so the result does not depend on the number of
+workers. Afterwards the per-shard ground truth files are merged into one ordered
+ground_truth.csv.
+
+    python parallel_generate.py --workers 8 -- --mesh cube.obj --sensor_res 848x480 --sensor_fov 69.0x42.0 \
+        --position 0.0,2.0,1.5 --samples 10000 --output out --seed 42
+
+    python parallel_generate.py --workers 8 --backend blender --blender_exe <blender.exe> \
+        --blend_file DataGenerator.blend -- <same generator arguments>
+"""
+import os
+import sys
+import csv
+import argparse
+import subprocess
+
+from sensor_core import add_common_arguments, load_setups, random_seed, shard_file_names
+from pose_sampling import report_coverage
+
+PROGRAM_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def worker_command(backend, generator_args, shards, shard_index, seed, blender_exe=None, blend_file=None):
+    """Command line of one shard worker."""
+    shard_args = list(generator_args) + ["--shards", str(shards), "--shard-index", str(shard_index), "--seed", str(seed)]
+    if backend == "blender":
+        # --python-exit-code makes Blender report script errors through its exit code
+        return [blender_exe, "-b", blend_file, "--python-exit-code", "1",
+                "-P", os.path.join(PROGRAM_DIR, "BlenderSensorProgram.py"), "--"] + shard_args
+    return [sys.executable, os.path.join(PROGRAM_DIR, "HeadlessSensorProgram.py")] + shard_args
+
+def merge_shard_ground_truth(output_dir, shards):
+    """Merges ground_truth_shardXX.csv pieces into one ground_truth.csv ordered by sample id."""
+    if shards == 1:
+        return
+    settings, header, rows = None, None, []
+    for k in range(shards):
+        path = os.path.join(output_dir, shard_file_names(shards, k)[0])
+        with open(path, 'r', newline='') as f:
+            shard_settings = f.readline()
+            reader = csv.reader(f)
+            shard_header = next(reader)
+            if settings is None:
+                settings, header = shard_settings, shard_header
+            elif shard_settings != settings or shard_header != header:
+                raise ValueError(f"Shard {k} was generated with different settings: {shard_settings.strip()}")
+            rows.extend(reader)
+
+    rows.sort(key=lambda row: int(row[0]))
+    with open(os.path.join(output_dir, "ground_truth.csv"), 'w', newline='') as f:
+        f.write(settings)
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+    for k in range(shards):
+        os.remove(os.path.join(output_dir, shard_file_names(shards, k)[0]))
+
+def run_sharded(generator_args, workers, backend="headless", blender_exe=None, blend_file=None):
+    """
+    Runs 'workers' shard processes of one generator job in parallel and merges their output.
+    generator_args are the normal generator arguments (including --output).
+    Returns the base seed that was used.
+    """
+    parser = add_common_arguments(argparse.ArgumentParser(add_help=False))
+    known, _ = parser.parse_known_args(generator_args)
+
+    seed = known.seed if known.seed is not None else random_seed()
+    os.makedirs(known.output, exist_ok=True)
+
+    procs = []
+    for k in range(workers):
+        log = open(os.path.join(known.output, f"generate_shard{k:02d}.log"), 'w')
+        cmd = worker_command(backend, generator_args, workers, k, seed, blender_exe, blend_file)
+        procs.append((k, subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT), log))
+
+    failed = []
+    for k, proc, log in procs:
+        if proc.wait() != 0:
+            failed.append(k)
+        log.close()
+    if failed:
+        raise RuntimeError(f"Shard(s) {failed} failed, see generate_shardXX.log in {known.output}")
+
+    # With --setups every setup directory holds its own shard files
+    for setup in load_setups(known):
+        merge_shard_ground_truth(setup["output"], workers)
+    if known.coverage:
+        report_coverage(known)
+    return seed
+
+def main():
+    argv = sys.argv[1:]
+    if "--" not in argv:
+        return print("Usage: python parallel_generate.py [--workers N] [--backend ...] -- <generator arguments>")
+    split = argv.index("--")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--backend", choices=["headless", "blender"], default="headless")
+    parser.add_argument("--blender_exe")
+    parser.add_argument("--blend_file")
+    args = parser.parse_args(argv[:split])
+
+    if args.backend == "blender" and not (args.blender_exe and args.blend_file):
+        return print("ERROR: --backend blender needs --blender_exe and --blend_file")
+
+    seed = run_sharded(argv[split + 1:], args.workers, args.backend, args.blender_exe, args.blend_file)
+    print(f"--- {args.workers} shards finished (seed {seed}) ---")
+
+if __name__ == "__main__":
+    main()
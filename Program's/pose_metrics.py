@@ -0,0 +1,134 @@
+"""
+Vectorized pose error metrics over whole result sets.
+
+All functions work on stacks of poses: (N, 4, 4) matrices, (N, 3, 3) rotations and
+(N, 3) translations, in one NumPy pass without per-row Python loops:
+
+    T_gt = load_ground_truth_matrices("ground_truth.csv")          # (N, 4, 4)
+    T_est = invert_poses(np.stack(df_res['matrix_icp']))            # ICP maps scan -> reference
+    errors = pose_errors(T_est, T_gt, symmetries=CUBE_SYMMETRIES)
+    print(summarize(errors))
+
+For a symmetric target, a pose and the same pose turned by one of the object's symmetry
+rotations give the same scan. The symmetry-aware rotation error is the smallest error over
+that group. CUBE_SYMMETRIES is the 24-element rotation group of the cube target.
+"""
+import itertools
+import numpy as np
+
+from sensor_core import GT_MATRIX_HEADER
+
+# --- 1. LOADING ---
+
+def matrices_from_columns(table):
+    """(N, 4, 4) matrices from the m00..m33 columns of a DataFrame or a list of row dicts."""
+    if isinstance(table, list):
+        flat = np.array([[float(row[c]) for c in GT_MATRIX_HEADER] for row in table], dtype=np.float64)
+    else:
+        flat = table[GT_MATRIX_HEADER].to_numpy(dtype=np.float64)
+    return flat.reshape(-1, 4, 4)
+
+def load_ground_truth_matrices(filepath):
+    """(N, 4, 4) matrices of a dataset_index.csv / ground_truth.csv (a '# Settings' line is skipped)."""
+    with open(filepath, 'r') as f:
+        header = f.readline()
+        skip = 1
+        if header.startswith('#'):
+            header = f.readline()
+            skip = 2
+    columns = header.strip().split(',')
+    usecols = [columns.index(c) for c in GT_MATRIX_HEADER]
+    flat = np.loadtxt(filepath, delimiter=',', skiprows=skip, usecols=usecols, dtype=np.float64, ndmin=2)
+    return flat.reshape(-1, 4, 4)
+
+# --- 2. POSE ALGEBRA ---
+
+def normalize_rotations(T):
+    """Copy of (N, 4, 4) poses with unit length rotation columns (removes the object scale)."""
+    T = np.array(T, dtype=np.float64)
+    norms = np.linalg.norm(T[:, :3, :3], axis=1, keepdims=True)
+    T[:, :3, :3] /= np.where(norms > 0, norms, 1.0)
+    return T
+
+def invert_poses(T):
+    """Inverse of (N, 4, 4) rigid poses (rotation transposed, translation rotated back)."""
+    T = np.asarray(T, dtype=np.float64)
+    inv = np.zeros_like(T)
+    R_t = np.transpose(T[:, :3, :3], (0, 2, 1))
+    inv[:, :3, :3] = R_t
+    inv[:, :3, 3] = -np.einsum('nij,nj->ni', R_t, T[:, :3, 3])
+    inv[:, 3, 3] = 1.0
+    return inv
+
+def _angles_from_traces(traces):
+    return np.degrees(np.arccos(np.clip((traces - 1.0) / 2.0, -1.0, 1.0)))
+
+def rotation_errors(R_est, R_gt):
+    """Geodesic angle (degrees) between (N, 3, 3) rotation stacks."""
+    # trace(R_est @ R_gt.T) without forming the product
+    return _angles_from_traces(np.einsum('nij,nij->n', R_est, R_gt))
+
+def symmetric_rotation_errors(R_est, R_gt, symmetries):
+    """
+    Smallest geodesic angle (degrees) between R_est and R_gt @ S over the (S, 3, 3) symmetry group.
+    Also returns the index of the best symmetry per pose.
+    """
+    # trace(R_est @ (R_gt @ S).T) = sum_ij (R_gt.T @ R_est)_ij * S_ij
+    M = np.einsum('nki,nkj->nij', R_gt, R_est)
+    traces = np.einsum('nij,sij->ns', M, symmetries)
+    best = np.argmax(traces, axis=1)
+    return _angles_from_traces(traces[np.arange(len(best)), best]), best
+
+def translation_errors(t_est, t_gt):
+    """Euclidean distance between (N, 3) translation stacks."""
+    return np.linalg.norm(np.asarray(t_est) - np.asarray(t_gt), axis=1)
+
+def _cube_symmetries():
+    """All 24 proper rotations that map the axis-aligned cube onto itself (signed permutations, det +1)."""
+    group = []
+    for perm in itertools.permutations(range(3)):
+        for signs in itertools.product((1.0, -1.0), repeat=3):
+            S = np.zeros((3, 3))
+            S[range(3), perm] = signs
+            if np.linalg.det(S) > 0:
+                group.append(S)
+    return np.array(group)
+
+CUBE_SYMMETRIES = _cube_symmetries()
+
+# --- 3. SCORING ---
+
+def pose_errors(T_est, T_gt, symmetries=None):
+    """
+    Errors of estimated poses against the ground truth, both (N, 4, 4). Scale is removed from both.
+    Returns {'rot_error', 'trans_error'} arrays, plus 'rot_error_sym' when a symmetry group is given.
+    """
+    T_est = normalize_rotations(T_est)
+    T_gt = normalize_rotations(T_gt)
+    errors = {
+        'rot_error': rotation_errors(T_est[:, :3, :3], T_gt[:, :3, :3]),
+        'trans_error': translation_errors(T_est[:, :3, 3], T_gt[:, :3, 3]),
+    }
+    if symmetries is not None:
+        errors['rot_error_sym'], _ = symmetric_rotation_errors(T_est[:, :3, :3], T_gt[:, :3, :3], symmetries)
+    return errors
+
+def summarize(errors, rot_threshold=5.0, trans_threshold=0.01):
+    """
+    Aggregate statistics of pose_errors output. 'success_rate' is the fraction of poses below
+    both thresholds (degrees, meters); the symmetric rotation error is used when present.
+    """
+    summary = {}
+    for name, values in errors.items():
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            continue
+        p50, p90, p95 = np.percentile(values, [50, 90, 95])
+        summary[name] = {'mean': values.mean(), 'std': values.std(), 'median': p50,
+                         'p90': p90, 'p95': p95, 'max': values.max()}
+
+    rot = np.asarray(errors.get('rot_error_sym', errors['rot_error']))
+    trans = np.asarray(errors['trans_error'])
+    summary['count'] = len(rot)
+    summary['success_rate'] = float(np.mean((rot < rot_threshold) & (trans < trans_threshold))) if len(rot) else 0.0
+    return summary
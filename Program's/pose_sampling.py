@@ -0,0 +1,228 @@
+"""
+Target pose samplers (--pose_sampler) and a coverage metric of the sampled poses.
+
+For every sampler --rot_range bounds each Blender 'XYZ' Euler angle to +-rot_range degrees
+and --trans_range each translation axis to +-trans_range; only the distribution in that box
+differs:
+
+    random      independent uniform Euler angles and translations (sample_pose_params, the
+                original behaviour)
+    quaternion  random rotations with the SO(3) (Haar) density, i.e. uniform over the rotations
+                in the box (uniform over SO(3) for rot_range >= 180)
+    sobol       Sobol sequence over the 6 pose dimensions (3 rotation, 3 translation)
+    halton      Halton sequence (bases 2, 3, 5, 7, 11, 13)
+    grid        jittered Latin hypercube: each pose dimension is split into as many strata as the
+                run has samples and every stratum holds exactly one sample
+
+The quasi-random and grid samplers map a point of the unit cube to a pose with the same
+measure-preserving map as 'quaternion', so they fill the rotation space evenly. Every pose
+only depends on (sampler, seed, sample id): the sequences are indexed by sample id and
+shifted by a random offset of the seed (Cranley-Patterson rotation), so shards and resumed
+runs get the same poses.
+
+pose_coverage() measures how densely poses cover the rotation and translation ranges: the
+distance from random probe poses in the box to their nearest sample (smaller is better). It
+only runs with --coverage, once on the finished ground truth (after the shard merge).
+"""
+import os
+import csv
+import math
+import json
+import numpy as np
+
+from sensor_core import sample_rng, sample_pose_params, parse_settings_line, load_setups
+
+POSE_SAMPLERS = ("random", "quaternion", "sobol", "halton", "grid")
+
+# Stream number of the per-seed RNG (Cranley-Patterson shift, grid order); the sample streams are small integers
+_POSE_STREAM = 0x504F5345
+
+# --- 1. UNIT CUBE SEQUENCES ---
+
+# Joe & Kuo direction numbers (s, a, m) of the Sobol dimensions 2..6
+_SOBOL_PARAMS = [(1, 0, [1]), (2, 1, [1, 3]), (3, 1, [1, 3, 1]), (3, 2, [1, 1, 1]), (4, 1, [1, 1, 3, 3])]
+_SOBOL_BITS = 32
+
+def _sobol_directions():
+    """(6, 32) direction integers; dimension 1 is the van der Corput sequence."""
+    directions = np.zeros((6, _SOBOL_BITS), dtype=np.uint64)
+    directions[0] = [1 << (_SOBOL_BITS - 1 - k) for k in range(_SOBOL_BITS)]
+    for dim, (s, a, m) in enumerate(_SOBOL_PARAMS, start=1):
+        v = [m[k] << (_SOBOL_BITS - 1 - k) for k in range(s)]
+        for k in range(s, _SOBOL_BITS):
+            value = v[k - s] ^ (v[k - s] >> s)
+            for l in range(1, s):
+                if (a >> (s - 1 - l)) & 1:
+                    value ^= v[k - l]
+            v.append(value)
+        directions[dim] = v
+    return directions
+
+_SOBOL_DIRECTIONS = _sobol_directions()
+
+def sobol_points(indices):
+    """(N, 6) Sobol points of the given indices (XOR of the direction integers of the index bits)."""
+    indices = np.asarray(indices, dtype=np.uint64)
+    bits = (indices[:, np.newaxis] >> np.arange(_SOBOL_BITS, dtype=np.uint64)) & np.uint64(1)
+    values = np.zeros((len(indices), 6), dtype=np.uint64)
+    for k in range(_SOBOL_BITS):
+        values ^= np.where(bits[:, k, np.newaxis] == 1, _SOBOL_DIRECTIONS[:, k], np.uint64(0))
+    return values.astype(np.float64) / 2.0**_SOBOL_BITS
+
+_HALTON_BASES = (2, 3, 5, 7, 11, 13)
+
+def halton_points(indices):
+    """(N, 6) Halton points of the given indices (radical inverse in the first six prime bases)."""
+    indices = np.asarray(indices, dtype=np.int64)
+    points = np.zeros((len(indices), len(_HALTON_BASES)))
+    for dim, base in enumerate(_HALTON_BASES):
+        n = indices.copy()
+        scale = 1.0 / base
+        while np.any(n > 0):
+            points[:, dim] += (n % base) * scale
+            n //= base
+            scale /= base
+    return points
+
+# --- 2. UNIT CUBE TO POSE ---
+
+def _haar_pitch(u, max_angle):
+    """Middle ('XYZ' Y) angles in +-max_angle with the SO(3) (Haar) density |cos(ry)| of that angle."""
+    table = np.linspace(-max_angle, max_angle, 4097)
+    density = np.abs(np.cos(table))
+    cdf = np.concatenate([[0.0], np.cumsum((density[1:] + density[:-1]) / 2 * np.diff(table))])
+    return np.interp(u * cdf[-1], cdf, table)
+
+def box_euler_angles(u, rot_range):
+    """
+    (N, 3) uniform [0, 1) values to (N, 3) 'XYZ' Euler angles within +-rot_range degrees with the
+    SO(3) (Haar) density, so the rotations are spread evenly over the range (over all of SO(3)
+    for rot_range >= 180).
+    """
+    max_angle = math.radians(min(rot_range, 180.0))
+    return np.stack([(2 * u[:, 0] - 1) * max_angle, _haar_pitch(u[:, 1], max_angle),
+                     (2 * u[:, 2] - 1) * max_angle], axis=1)
+
+def euler_to_quaternions(rx, ry, rz):
+    """Vectorized Blender 'XYZ' Euler angles to (N, 4) quaternions (q = qz * qy * qx)."""
+    cx, sx = np.cos(np.asarray(rx) / 2), np.sin(np.asarray(rx) / 2)
+    cy, sy = np.cos(np.asarray(ry) / 2), np.sin(np.asarray(ry) / 2)
+    cz, sz = np.cos(np.asarray(rz) / 2), np.sin(np.asarray(rz) / 2)
+    return np.stack([cz * cy * cx + sz * sy * sx,
+                     cz * cy * sx - sz * sy * cx,
+                     cz * sy * cx + sz * cy * sx,
+                     sz * cy * cx - cz * sy * sx], axis=-1)
+
+def unit_pose_params(u, rot_range, trans_range):
+    """Pose dict of one point u in [0, 1)^6: rotation from u[:3], translation from u[3:]."""
+    rx, ry, rz = box_euler_angles(u[np.newaxis, :3], rot_range)[0].tolist()
+    tx, ty, tz = ((2 * u[3:] - 1) * trans_range).tolist()
+    return {"rx_rad": rx, "ry_rad": ry, "rz_rad": rz, "tx_m": tx, "ty_m": ty, "tz_m": tz}
+
+# --- 3. SAMPLERS ---
+
+class PoseSampler:
+    """
+    Pose of every sample id for one run. total is the number of sample ids of the whole run
+    (start_index + samples), only the grid needs it.
+
+        sampler = PoseSampler(args.pose_sampler, seed, args.rot_range, args.trans_range, total)
+        params = sampler.params(i, sample_rng(seed, i))
+    """
+
+    def __init__(self, name, seed, rot_range, trans_range, total=None):
+        if name not in POSE_SAMPLERS:
+            raise ValueError(f"Unknown pose sampler '{name}' (choose from {', '.join(POSE_SAMPLERS)})")
+        self.name = name
+        self.rot_range = rot_range
+        self.trans_range = trans_range
+        run_rng = sample_rng(seed, 0, _POSE_STREAM)
+        self.shift = run_rng.random(6)
+
+        if name == "grid":
+            if not total:
+                raise ValueError("the grid sampler needs the total number of samples")
+            # Translation is only stratified when there is a translation range
+            self.grid_dims = 6 if trans_range > 0 else 3
+            self.total = total
+            # Every dimension is split into total strata, each holding exactly one sample id
+            self.strata = np.stack([run_rng.permutation(total) for _ in range(self.grid_dims)])
+
+    @property
+    def label(self):
+        """Name in the settings line; the grid strata depend on the total, so resuming needs the same grid."""
+        return f"grid:{self.total}" if self.name == "grid" else self.name
+
+    def unit_point(self, sample_id, rng):
+        """Point in [0, 1)^6 of a sample."""
+        if self.name == "quaternion":
+            return rng.random(6)
+        if self.name == "grid":
+            u = rng.random(6)
+            u[:self.grid_dims] = (self.strata[:, sample_id] + u[:self.grid_dims]) / self.total
+            return u
+        points = sobol_points([sample_id]) if self.name == "sobol" else halton_points([sample_id])
+        return (points[0] + self.shift) % 1.0
+
+    def params(self, sample_id, rng):
+        """Pose dict (sensor_core.sample_pose_params format) of a sample, rng is the sample's RNG."""
+        if self.name == "random":
+            return sample_pose_params(self.trans_range, self.rot_range, rng)
+        return unit_pose_params(self.unit_point(sample_id, rng), self.rot_range, self.trans_range)
+
+# --- 4. COVERAGE ---
+
+def pose_coverage(params, rot_range, trans_range, probes=4096, seed=0):
+    """
+    Coverage of a list of pose dicts: for uniform random probe poses within the ranges, the
+    distance to the nearest sampled pose. Returns {'rot_mean_deg', 'rot_p95_deg', 'rot_max_deg'}
+    plus 'trans_mean_m', 'trans_p95_m' when there is a translation range.
+    """
+    rng = np.random.default_rng(seed)
+    samples = euler_to_quaternions([p["rx_rad"] for p in params], [p["ry_rad"] for p in params],
+                                   [p["rz_rad"] for p in params])
+    probe_q = euler_to_quaternions(*box_euler_angles(rng.random((probes, 3)), rot_range).T)
+
+    nearest = np.empty(probes)
+    for start in range(0, probes, 256):
+        dots = np.abs(probe_q[start:start + 256] @ samples.T).max(axis=1)
+        nearest[start:start + 256] = np.degrees(2 * np.arccos(np.clip(dots, -1.0, 1.0)))
+    coverage = {"samples": len(params), "rot_mean_deg": float(nearest.mean()),
+                "rot_p95_deg": float(np.percentile(nearest, 95)), "rot_max_deg": float(nearest.max())}
+
+    if trans_range > 0:
+        translations = np.array([[p["tx_m"], p["ty_m"], p["tz_m"]] for p in params])
+        probe_t = rng.uniform(-trans_range, trans_range, (probes, 3))
+        dist = np.empty(probes)
+        for start in range(0, probes, 256):
+            diff = probe_t[start:start + 256, np.newaxis] - translations[np.newaxis]
+            dist[start:start + 256] = np.sqrt((diff**2).sum(axis=2)).min(axis=1)
+        coverage.update(trans_mean_m=float(dist.mean()), trans_p95_m=float(np.percentile(dist, 95)))
+    return coverage
+
+def run_sampler(args, seed):
+    """PoseSampler of a generator run (--pose_sampler, --rot_range, --trans_range, the run's sample ids)."""
+    return PoseSampler(args.pose_sampler, seed, args.rot_range, args.trans_range, args.start_index + args.samples)
+
+def report_coverage(args):
+    """
+    Coverage (--coverage) of the poses in the finished ground_truth.csv of the run, i.e. after
+    the shards are merged. Printed and written to <output>/pose_coverage.json. Returns the dict.
+    """
+    gt_path = os.path.join(load_setups(args)[0]["output"], "ground_truth.csv")
+    with open(gt_path, 'r') as f:
+        label = parse_settings_line(f.readline())['poses']
+        rows = list(csv.DictReader(f))
+    params = [{k: float(row[k]) for k in ("rx_rad", "ry_rad", "rz_rad", "tx_m", "ty_m", "tz_m")} for row in rows]
+    coverage = dict(pose_coverage(params, args.rot_range, args.trans_range), sampler=label)
+    with open(os.path.join(args.output, "pose_coverage.json"), 'w') as f:
+        json.dump(coverage, f, indent=1)
+    print(f"--- Pose coverage ({label}): {format_coverage(coverage)} ---")
+    return coverage
+
+def format_coverage(coverage):
+    text = (f"{coverage['samples']} poses, nearest pose {coverage['rot_mean_deg']:.1f} deg on average "
+            f"(p95 {coverage['rot_p95_deg']:.1f}, max {coverage['rot_max_deg']:.1f})")
+    if 'trans_mean_m' in coverage:
+        text += f", {coverage['trans_mean_m'] * 1000:.1f} mm (p95 {coverage['trans_p95_m'] * 1000:.1f})"
+    return text
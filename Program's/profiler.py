@@ -0,0 +1,141 @@
+"""
+Per-stage timing and throughput of a generator run (--profile).
+
+The generators time their stages per sample (pose, raycast, noise, write) and count the rays
+cast, hits and scan bytes written. With --profile every sample becomes one line of
+profile.jsonl in the output directory, and profile_summary.json gets the totals of the run:
+
+    profiler = RunProfiler(args.output, enabled=args.profile)
+    with profiler.stage("mesh_load"):            # outside a sample: a run stage
+        ...
+    profiler.start_sample(i)
+    with profiler.stage("raycast"):
+        ...
+    profiler.count(rays=len(dirs), hits=len(points))
+    profiler.end_sample()
+    profiler.close()                              # writes profile_summary.json
+
+With a write queue (--write_queue > 0) the scans are serialized by a writer thread after
+their sample ended, so the samples carry no 'bytes' and only the summary has the total.
+
+A disabled profiler only costs the calls. read_summary(output_dir) loads the summary
+(used by the DataGenerator.ipynb status display). Shards of a run use their own name
+(profile_shardXX).
+"""
+import os
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+class RunProfiler:
+    """Collects stage times and counters per sample; see the module docstring."""
+
+    def __init__(self, output_dir, enabled=True, name="profile"):
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.name = name
+        self.started = time.perf_counter()
+        self.run_stages = {}
+        self.totals = {}
+        self.counters = {}
+        self.samples = 0
+        self._sample = None
+        self._file = None
+        if enabled:
+            os.makedirs(output_dir, exist_ok=True)
+            self._file = open(os.path.join(output_dir, f"{name}.jsonl"), 'w')
+
+    def stage(self, name):
+        """Context manager that adds its wall time to the current sample (or the run) under name."""
+        if not self.enabled:
+            return nullcontext()
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            target = self._sample['stages'] if self._sample is not None else self.run_stages
+            target[name] = target.get(name, 0.0) + time.perf_counter() - started
+
+    def count(self, **counters):
+        """Adds counters (rays, hits, bytes, ...) to the current sample."""
+        if self.enabled and self._sample is not None:
+            for key, value in counters.items():
+                self._sample[key] = self._sample.get(key, 0) + int(value)
+
+    def start_sample(self, sample_id):
+        if self.enabled:
+            self._sample = {'sample_id': sample_id, 'stages': {}, 'started': time.perf_counter()}
+
+    def end_sample(self):
+        """Writes the sample's record and adds it to the run totals."""
+        if not self.enabled or self._sample is None:
+            return
+        record = self._sample
+        self._sample = None
+        record['seconds'] = time.perf_counter() - record.pop('started')
+        raycast = record['stages'].get('raycast', 0.0)
+        if 'rays' in record and raycast > 0:
+            record['rays_per_s'] = record['rays'] / raycast
+        self._file.write(json.dumps(record) + "\n")
+
+        self.samples += 1
+        for name, seconds in record['stages'].items():
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+        for key in ('rays', 'hits', 'bytes'):
+            if key in record:
+                self.counters[key] = self.counters.get(key, 0) + record[key]
+        self.counters['seconds'] = self.counters.get('seconds', 0.0) + record['seconds']
+
+    def summary(self):
+        """Totals of the run so far as a JSON-ready dict."""
+        wall = time.perf_counter() - self.started
+        sample_seconds = self.counters.get('seconds', 0.0)
+        summary = {
+            'samples': self.samples,
+            'wall_seconds': wall,
+            'samples_per_s': self.samples / wall if wall > 0 else 0.0,
+            'seconds_per_sample': sample_seconds / self.samples if self.samples else 0.0,
+            'rays': self.counters.get('rays', 0),
+            'hits': self.counters.get('hits', 0),
+            'bytes': self.counters.get('bytes', 0),
+            'stages': {name: {'total': total, 'mean': total / self.samples,
+                              'share': total / sample_seconds if sample_seconds > 0 else 0.0}
+                       for name, total in self.totals.items()},
+            'run_stages': dict(self.run_stages),
+        }
+        if self.totals.get('raycast'):
+            summary['rays_per_s'] = summary['rays'] / self.totals['raycast']
+        return summary
+
+    def close(self, **extra):
+        """Writes profile_summary.json (plus extra fields) and closes the per-sample file."""
+        if not self.enabled or self._file.closed:
+            return
+        self._file.close()
+        with open(os.path.join(self.output_dir, f"{self.name}_summary.json"), 'w') as f:
+            json.dump({**self.summary(), **extra}, f, indent=1)
+
+def read_summary(output_dir, name="profile"):
+    """profile_summary.json of a run as a dict, or None when the run was not profiled."""
+    path = os.path.join(output_dir, f"{name}_summary.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def format_summary(summary):
+    """One-line text of a summary: throughput and the slowest stages."""
+    stages = sorted(summary['stages'].items(), key=lambda item: -item[1]['total'])
+    text = f"{summary['samples_per_s']:.2f} samples/s"
+    if 'rays_per_s' in summary:
+        text += f", {summary['rays_per_s'] / 1e6:.2f} Mrays/s"
+    if stages:
+        text += " | " + ", ".join(f"{name} {stage['share']:.0%}" for name, stage in stages[:3])
+    return text
+
+# Default for functions with an optional profiler argument; every call is a no-op
+NO_PROFILER = RunProfiler(None, enabled=False)
@@ -0,0 +1,93 @@
+"""
+Image-space operations on organized scans (--organized / the 'range' scan formats).
+
+A range scan keeps the sensor's pixel grid, so neighbourhoods are the pixel neighbours and
+no KD-tree search is needed for normals or downsampling:
+
+    store = ScanStore("../Blender_Generated_Data/Test_1/cam_d435/setup_front")
+    intrinsics, pixels, ranges = store.range_image(5)
+    xyz = xyz_image(intrinsics, pixels, ranges)             # (H, W, 3), NaN without a hit
+    normals = image_normals(intrinsics, xyz)[valid_mask(xyz)]
+    points, normals = image_downsample(xyz, normals, step=4)
+
+The hit order of store[i] and of xyz[valid_mask(xyz)] is the same (row-major pixel order).
+"""
+import numpy as np
+
+from scan_store import range_points
+
+def xyz_image(intrinsics, pixels, ranges):
+    """(H, W, 3) float32 image of world space points, NaN where the ray hit nothing."""
+    image = np.full((intrinsics['res_h'] * intrinsics['res_w'], 3), np.nan, dtype=np.float32)
+    image[pixels] = range_points(intrinsics, pixels, ranges)
+    return image.reshape(intrinsics['res_h'], intrinsics['res_w'], 3)
+
+def range_image(intrinsics, pixels, ranges):
+    """(H, W) float32 image of the ranges, NaN where the ray hit nothing."""
+    image = np.full(intrinsics['res_h'] * intrinsics['res_w'], np.nan, dtype=np.float32)
+    image[pixels] = ranges
+    return image.reshape(intrinsics['res_h'], intrinsics['res_w'])
+
+def valid_mask(xyz):
+    return ~np.isnan(xyz[..., 0])
+
+def _neighbour_difference(xyz, axis, max_jump):
+    """Central difference along an image axis, one-sided next to holes and depth jumps."""
+    forward = np.full_like(xyz, np.nan)
+    backward = np.full_like(xyz, np.nan)
+    inner = [slice(None)] * 3
+    inner[axis] = slice(None, -1)
+    shifted = [slice(None)] * 3
+    shifted[axis] = slice(1, None)
+    step = xyz[tuple(shifted)] - xyz[tuple(inner)]
+    forward[tuple(inner)] = step
+    backward[tuple(shifted)] = step
+
+    # Neighbours across a depth jump belong to another surface
+    for diff in (forward, backward):
+        with np.errstate(invalid='ignore'):
+            diff[np.linalg.norm(diff, axis=2) > max_jump] = np.nan
+    central = 0.5 * (forward + backward)
+    return np.where(np.isnan(central), np.where(np.isnan(forward), backward, forward), central)
+
+def image_normals(intrinsics, xyz, max_jump=0.05):
+    """
+    (H, W, 3) unit normals from the cross product of the row and column neighbour differences,
+    oriented towards the sensor. Pixels without usable neighbours get the inverted ray direction.
+    """
+    d_col = _neighbour_difference(xyz, 1, max_jump)
+    d_row = _neighbour_difference(xyz, 0, max_jump)
+    normals = np.cross(d_col, d_row)
+
+    to_sensor = np.asarray(intrinsics['position'], dtype=np.float32) - xyz
+    to_sensor /= np.linalg.norm(to_sensor, axis=2, keepdims=True)
+    length = np.linalg.norm(normals, axis=2, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        normals = np.where(length > 1e-12, normals / length, np.nan)
+    normals = np.where(np.isnan(normals), to_sensor, normals)
+
+    flip = np.einsum('hwc,hwc->hw', normals, to_sensor) < 0
+    normals[flip] *= -1
+    return normals.astype(np.float32)
+
+def image_downsample(xyz, normals=None, step=2):
+    """
+    Average of the hits in every step x step pixel block, the grid counterpart of a voxel
+    downsample. Returns (points (M, 3), normals (M, 3) or None), normals renormalized.
+    """
+    h, w = xyz.shape[:2]
+    pad_h, pad_w = -h % step, -w % step
+    def blocks(image):
+        padded = np.pad(image, ((0, pad_h), (0, pad_w), (0, 0)), constant_values=np.nan)
+        return padded.reshape((h + pad_h) // step, step, (w + pad_w) // step, step, 3)
+
+    xyz_blocks = blocks(xyz)
+    counts = (~np.isnan(xyz_blocks[..., 0])).sum(axis=(1, 3))
+    keep = counts > 0
+    points = np.nansum(xyz_blocks, axis=(1, 3))[keep] / counts[keep][:, np.newaxis]
+    if normals is None:
+        return points.astype(np.float32), None
+
+    sums = np.nansum(blocks(np.where(np.isnan(xyz), np.nan, normals)), axis=(1, 3))[keep]
+    sums /= np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return points.astype(np.float32), sums.astype(np.float32)
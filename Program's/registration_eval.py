@@ -0,0 +1,394 @@
+"""
+Parallel RANSAC + ICP evaluation of a scan dataset against one reference scan
+(the pipeline of VectorTest4.ipynb).
+
+The reference is preprocessed once (voxel downsample, normals, FPFH). The result is
+passed as plain arrays to every worker process, so the workers only rebuild the Open3D
+objects. Scans are registered on a process pool and the results are reported as they finish:
+
+    dataset = ScanDataset("../Blender_Generated_Data")
+    df_res = evaluate(dataset, voxel_size=0.01, workers=8, on_result=print)
+    print_report(df_res)
+
+With cache_dir the scan features (downsampled cloud, normals, FPFH) are kept in a
+FeatureCache. Reruns with other ICP / RANSAC settings then skip the feature extraction.
+
+With pyramid=True (or a PYRAMID_PARAMS dict) every scan is registered coarse to fine
+(register_scan_pyramid): a cheap RANSAC on a coarse voxel level, checked with ICP on that
+level, and the full RANSAC budget only when no cheap level converges. The 'levels' column
+holds the time, iteration budget, fitness and RMSE of every step.
+"""
+import os
+import json
+import time
+import math
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+import open3d as o3d
+
+from feature_cache import FeatureCache, feature_key
+from pose_metrics import normalize_rotations, invert_poses, pose_errors
+
+RESULT_COLUMNS = ['id', 'fitness', 'rmse', 'rot_error', 'trans_error', 'matrix_icp', 'seconds']
+PYRAMID_COLUMNS = ['global_level', 'fallback', 'levels']
+
+# Neighbourhood searches of the features, radii in voxel sizes (part of the feature cache key)
+FEATURE_PARAMS = {'normal_radius': 2, 'normal_max_nn': 30, 'fpfh_radius': 5, 'fpfh_max_nn': 100}
+
+# Coarse-to-fine registration (register_scan_pyramid). levels are voxel size multipliers, coarse to fine.
+# A level has converged when its ICP reaches min_fitness with an inlier RMSE below max_rmse level voxel
+# sizes; icp_distance is the ICP correspondence distance of the coarse levels in level voxel sizes.
+PYRAMID_PARAMS = {
+    'levels': (4, 2, 1),
+    'min_fitness': 0.9,
+    'max_rmse': 0.4,
+    'icp_distance': 1.0,
+    'ransac_iterations': 5000,
+    'fallback_iterations': 100000,
+    'icp_iterations': 30,
+}
+
+# --- 1. REGISTRATION STEPS ---
+
+def to_pcd(points, normals=None):
+    """(N, 3) array to an Open3D point cloud."""
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(np.asarray(points, dtype=np.float64))
+    if normals is not None:
+        pcd.normals = o3d.utility.Vector3dVector(np.asarray(normals, dtype=np.float64))
+    return pcd
+
+def preprocess_point_cloud(pcd, voxel_size):
+    """
+    1. Downsample (for performance in RANSAC)
+    2. Estimate Normals
+    3. Compute FPFH Features (Geometric fingerprints)
+    """
+    # Downsample
+    pcd_down = pcd.voxel_down_sample(voxel_size)
+
+    # Estimate Normals
+    estimate_normals(pcd_down, voxel_size)
+
+    # Compute FPFH Features
+    pcd_fpfh = o3d.pipelines.registration.compute_fpfh_feature(
+        pcd_down,
+        o3d.geometry.KDTreeSearchParamHybrid(radius=voxel_size * FEATURE_PARAMS['fpfh_radius'],
+                                             max_nn=FEATURE_PARAMS['fpfh_max_nn']))
+
+    return pcd_down, pcd_fpfh
+
+def execute_global_registration(source_down, target_down, source_fpfh, target_fpfh, voxel_size, max_iterations=100000):
+    """RANSAC: Rough Alignment based on features."""
+    distance_threshold = voxel_size * 1.5
+
+    result = o3d.pipelines.registration.registration_ransac_based_on_feature_matching(
+        source_down, target_down, source_fpfh, target_fpfh, True,
+        distance_threshold,
+        o3d.pipelines.registration.TransformationEstimationPointToPoint(False),
+        3, # Take 3 points to propose a match
+        [o3d.pipelines.registration.CorrespondenceCheckerBasedOnEdgeLength(0.9),
+         o3d.pipelines.registration.CorrespondenceCheckerBasedOnDistance(distance_threshold)],
+        o3d.pipelines.registration.RANSACConvergenceCriteria(max_iterations, 0.999)
+    )
+    return result
+
+def estimate_normals(pcd, voxel_size):
+    pcd.estimate_normals(o3d.geometry.KDTreeSearchParamHybrid(radius=voxel_size * FEATURE_PARAMS['normal_radius'],
+                                                              max_nn=FEATURE_PARAMS['normal_max_nn']))
+
+def refine_registration(source, target, initial_transform, voxel_size):
+    """ICP: Fine Alignment using Point-to-Plane. The target needs normals (see estimate_normals)."""
+    distance_threshold = voxel_size * 0.4
+
+    # Ensure normals are computed on original high-res clouds
+    if not source.has_normals():
+        estimate_normals(source, voxel_size)
+    if not target.has_normals():
+        estimate_normals(target, voxel_size)
+
+    result = o3d.pipelines.registration.registration_icp(
+        source, target, distance_threshold, initial_transform,
+        o3d.pipelines.registration.TransformationEstimationPointToPlane()
+    )
+    return result
+
+def level_icp(source, target, distance_threshold, initial_transform, max_iterations=30,
+              relative_fitness=1e-6, relative_rmse=1e-6):
+    """
+    Point-to-plane ICP in one registration_icp call, stopping at max_iterations or when fitness
+    and RMSE change less than the relative limits. The target needs normals.
+    """
+    registration = o3d.pipelines.registration
+    criteria = registration.ICPConvergenceCriteria(relative_fitness, relative_rmse, max_iterations)
+    return registration.registration_icp(source, target, distance_threshold, initial_transform,
+                                         registration.TransformationEstimationPointToPlane(), criteria)
+
+# --- 2. MATH HELPERS ---
+
+def get_rotation_error(R_est, R_gt):
+    R_diff = np.dot(R_est, R_gt.T)
+    tr = np.clip(np.trace(R_diff), -1, 3)
+    return math.degrees(math.acos((tr - 1) / 2))
+
+def get_translation_error(t_est, t_gt):
+    return np.linalg.norm(t_est - t_gt)
+
+def normalize_matrix(matrix):
+    """Copy of a 4x4 pose with unit length rotation columns (removes the object scale)."""
+    return normalize_rotations(np.asarray(matrix, dtype=float)[np.newaxis])[0]
+
+def parse_ground_truth_matrix(row):
+    cols = [f"m{r}{c}" for r in range(4) for c in range(4)]
+    flat = row[cols].values.astype(float)
+    return normalize_matrix(flat.reshape(4, 4))
+
+# --- 3. WORKERS ---
+
+# Reference, its pyramid levels and the feature cache of the current worker process, set once by _init_worker
+_REFERENCE = None
+_REFERENCE_LEVELS = None
+_CACHE = None
+
+def feature_arrays(points, voxel_size, cache=None):
+    """
+    Normals of the full cloud plus the downsampled cloud, its normals and FPFH of one scan,
+    as a dict of arrays. Looked up in / added to the cache when one is given.
+    """
+    key = None
+    if cache is not None:
+        key = feature_key(points, voxel_size, FEATURE_PARAMS)
+        arrays = cache.get(key)
+        if arrays is not None:
+            return arrays
+
+    pcd = to_pcd(points)
+    pcd_down, pcd_fpfh = preprocess_point_cloud(pcd, voxel_size)
+    estimate_normals(pcd, voxel_size)
+    arrays = {
+        'normals': np.asarray(pcd.normals),
+        'down_points': np.asarray(pcd_down.points), 'down_normals': np.asarray(pcd_down.normals),
+        'fpfh': np.asarray(pcd_fpfh.data),
+    }
+    if cache is not None:
+        cache.put(key, arrays)
+    return arrays
+
+def level_arrays(points, voxel_size, cache=None):
+    """Downsampled cloud, its normals and FPFH of one pyramid level (feature_arrays without the full cloud normals)."""
+    key = None
+    if cache is not None:
+        key = feature_key(points, voxel_size, {**FEATURE_PARAMS, 'full_normals': False})
+        arrays = cache.get(key)
+        if arrays is not None:
+            return arrays
+
+    pcd_down, pcd_fpfh = preprocess_point_cloud(to_pcd(points), voxel_size)
+    arrays = {'down_points': np.asarray(pcd_down.points), 'down_normals': np.asarray(pcd_down.normals),
+              'fpfh': np.asarray(pcd_fpfh.data)}
+    if cache is not None:
+        cache.put(key, arrays)
+    return arrays
+
+def pyramid_arrays(points, voxel_size, params=PYRAMID_PARAMS, cache=None):
+    """{level: level_arrays} of the pyramid levels of a (reference) scan."""
+    return {level: level_arrays(points, voxel_size * level, cache) for level in params['levels']}
+
+def _level_features(arrays):
+    fpfh = o3d.pipelines.registration.Feature()
+    fpfh.data = np.asarray(arrays['fpfh'], dtype=np.float64)
+    return to_pcd(arrays['down_points'], arrays['down_normals']), fpfh
+
+def features_from_arrays(points, arrays):
+    """(full cloud with normals, downsampled cloud, FPFH feature) Open3D objects of feature_arrays output."""
+    fpfh = o3d.pipelines.registration.Feature()
+    fpfh.data = np.asarray(arrays['fpfh'], dtype=np.float64)
+    return to_pcd(points, arrays['normals']), to_pcd(arrays['down_points'], arrays['down_normals']), fpfh
+
+def _init_worker(reference_points, reference, cache_dir, cache_bytes, reference_levels=None):
+    global _REFERENCE, _REFERENCE_LEVELS, _CACHE
+    _REFERENCE = features_from_arrays(reference_points, reference)
+    _REFERENCE_LEVELS = None
+    if reference_levels is not None:
+        _REFERENCE_LEVELS = {level: _level_features(arrays) for level, arrays in reference_levels.items()}
+    _CACHE = FeatureCache(cache_dir, cache_bytes) if cache_dir else None
+
+def register_scan(points, voxel_size):
+    """RANSAC + ICP of one scan onto the worker's reference. Returns (T_icp, fitness, rmse, seconds)."""
+    started = time.time()
+    pcd_target, target_down, target_fpfh = _REFERENCE
+
+    # --- STEP 1: Global Registration (RANSAC) ---
+    pcd_source, source_down, source_fpfh = features_from_arrays(points, feature_arrays(points, voxel_size, _CACHE))
+    ransac_result = execute_global_registration(source_down, target_down, source_fpfh, target_fpfh, voxel_size)
+
+    # --- STEP 2: Local Refinement (ICP) ---
+    icp_result = refine_registration(pcd_source, pcd_target, ransac_result.transformation, voxel_size)
+    return np.asarray(icp_result.transformation), icp_result.fitness, icp_result.inlier_rmse, time.time() - started
+
+def register_scan_pyramid(points, voxel_size, params=PYRAMID_PARAMS):
+    """
+    Coarse-to-fine RANSAC + ICP of one scan onto the worker's reference (needs reference_levels):
+
+    1. Per coarse level (all but the last): RANSAC with the cheap budget on the level's features,
+       then ICP on the level's clouds. The first level that converges (min_fitness, max_rmse)
+       gives the initial transform, the finer levels are skipped.
+    2. No level converged: RANSAC with the fallback budget on the last level (the fixed pipeline).
+    3. Point-to-plane ICP on the full clouds, as in register_scan.
+
+    Returns (T_icp, fitness, rmse, seconds, levels) with one dict per step in levels. Open3D
+    does not report how many iterations RANSAC / ICP ran, the steps hold the budget (max_iterations).
+    """
+    started = time.time()
+    pcd_target = _REFERENCE[0]
+    steps = []
+
+    def step(level, stage, step_started, result, max_iterations):
+        steps.append({'level': level, 'stage': stage, 'seconds': time.time() - step_started,
+                      'max_iterations': max_iterations, 'fitness': result.fitness, 'rmse': result.inlier_rmse})
+
+    initial, global_level, fallback = None, None, False
+    for level in params['levels'][:-1]:
+        level_voxel = voxel_size * level
+        step_started = time.time()
+        source_down, source_fpfh = _level_features(level_arrays(points, level_voxel, _CACHE))
+        target_down, target_fpfh = _REFERENCE_LEVELS[level]
+        ransac = execute_global_registration(source_down, target_down, source_fpfh, target_fpfh, level_voxel,
+                                             params['ransac_iterations'])
+        step(level, 'ransac', step_started, ransac, params['ransac_iterations'])
+
+        step_started = time.time()
+        icp = level_icp(source_down, target_down, level_voxel * params['icp_distance'],
+                        ransac.transformation, params['icp_iterations'])
+        step(level, 'icp', step_started, icp, params['icp_iterations'])
+        if icp.fitness >= params['min_fitness'] and icp.inlier_rmse <= params['max_rmse'] * level_voxel:
+            initial, global_level = icp.transformation, level
+            break
+
+    if initial is None:
+        level = params['levels'][-1]
+        step_started = time.time()
+        source_down, source_fpfh = _level_features(level_arrays(points, voxel_size * level, _CACHE))
+        target_down, target_fpfh = _REFERENCE_LEVELS[level]
+        ransac = execute_global_registration(source_down, target_down, source_fpfh, target_fpfh, voxel_size * level,
+                                             params['fallback_iterations'])
+        step(level, 'fallback_ransac', step_started, ransac, params['fallback_iterations'])
+        initial, global_level, fallback = ransac.transformation, level, True
+
+    # Full resolution refinement with the distance of refine_registration
+    step_started = time.time()
+    icp = level_icp(to_pcd(points), pcd_target, voxel_size * 0.4, initial, params['icp_iterations'])
+    step(1, 'icp_full', step_started, icp, params['icp_iterations'])
+
+    levels = {'global_level': global_level, 'fallback': fallback, 'steps': steps}
+    return np.asarray(icp.transformation), icp.fitness, icp.inlier_rmse, time.time() - started, levels
+
+# --- 4. EVALUATION ---
+
+def result_row(sample_id, T_icp, fitness, rmse, seconds, T_gt, symmetries=None, levels=None, reference_pose=None):
+    """
+    Compares a registration with the ground truth. T_icp maps the scan onto the reference, so the
+    scan pose is inverse(T_icp) @ reference_pose (inverse(T_icp) when reference_pose is None,
+    i.e. a reference at the identity pose).
+    With a symmetry group (e.g. pose_metrics.CUBE_SYMMETRIES) 'rot_error_sym' is added,
+    with the levels of register_scan_pyramid the PYRAMID_COLUMNS.
+    """
+    estimate = invert_poses(T_icp[np.newaxis])
+    if reference_pose is not None:
+        estimate = estimate @ np.asarray(reference_pose)
+    errors = pose_errors(estimate, np.asarray(T_gt)[np.newaxis], symmetries)
+    row = {
+        'id': sample_id,
+        'fitness': fitness,
+        'rmse': rmse,
+        'matrix_icp': T_icp,
+        'seconds': seconds,
+    }
+    row.update({name: float(values[0]) for name, values in errors.items()})
+    if levels is not None:
+        row.update(global_level=levels['global_level'], fallback=levels['fallback'], levels=levels['steps'])
+    return row
+
+def evaluate(dataset, voxel_size, reference_index=0, indices=None, workers=None, on_result=None,
+             cache_dir=None, cache_bytes=2 * 2**30, symmetries=None, pyramid=None):
+    """
+    Registers every scan of a ScanDataset (default: all but the reference) onto the reference scan.
+    on_result(row) is called for every finished scan. Returns the results DataFrame ordered by id.
+    cache_dir enables the shared feature cache (at most cache_bytes on disk), symmetries adds
+    the symmetry-aware 'rot_error_sym' column. pyramid (True or a PYRAMID_PARAMS dict) switches
+    to register_scan_pyramid and adds the PYRAMID_COLUMNS.
+    """
+    workers = workers or os.cpu_count()
+    if indices is None:
+        indices = [i for i in range(len(dataset)) if i != reference_index]
+    reference_points = dataset.points(reference_index)
+    cache = FeatureCache(cache_dir, cache_bytes) if cache_dir else None
+    reference = feature_arrays(reference_points, voxel_size, cache)
+    if pyramid is True:
+        pyramid = PYRAMID_PARAMS
+    reference_levels = pyramid_arrays(reference_points, voxel_size, pyramid, cache) if pyramid else None
+
+    results = []
+    initargs = (reference_points, reference, cache_dir, cache_bytes, reference_levels)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        # Keep a few scans per worker in flight, so large datasets are not all loaded at once
+        in_flight = {}
+        scans = dataset.iter(indices)
+        for i, points, T_gt in scans:
+            if pyramid:
+                in_flight[pool.submit(register_scan_pyramid, points, voxel_size, pyramid)] = (i, T_gt)
+            else:
+                in_flight[pool.submit(register_scan, points, voxel_size)] = (i, T_gt)
+            if len(in_flight) < 2 * workers:
+                continue
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            _collect(done, in_flight, dataset, results, on_result, symmetries)
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            _collect(done, in_flight, dataset, results, on_result, symmetries)
+
+    columns = RESULT_COLUMNS + (['rot_error_sym'] if symmetries is not None else []) + (PYRAMID_COLUMNS if pyramid else [])
+    return pd.DataFrame(results, columns=columns).sort_values('id', ignore_index=True)
+
+def _collect(done, in_flight, dataset, results, on_result, symmetries):
+    for future in done:
+        i, T_gt = in_flight.pop(future)
+        info = dataset.info(i)
+        sample_id = int(info.get('id', info.get('sample_id', i)))
+        try:
+            T_icp, fitness, rmse, seconds, *levels = future.result()
+            row = result_row(sample_id, T_icp, fitness, rmse, seconds, T_gt, symmetries, *levels)
+        except Exception as e:
+            print(f"Registration Error Sample {sample_id}: {e}")
+            continue
+        results.append(row)
+        if on_result:
+            on_result(row)
+
+def print_report(df_res):
+    print("\n=== FINAL REPORT ===")
+    print(f"Mean Fitness:         {df_res['fitness'].mean():.5f}")
+    print(f"Mean Rotation Error:  {df_res['rot_error'].mean():.5f} deg")
+    if 'rot_error_sym' in df_res:
+        print(f"Mean Sym. Rot. Error: {df_res['rot_error_sym'].mean():.5f} deg")
+    print(f"Mean Trans Error:     {df_res['trans_error'].mean():.5f} m")
+    print(f"Mean Time per Scan:   {df_res['seconds'].mean():.3f} s")
+    if 'levels' in df_res and len(df_res):
+        print(f"Converged per Level:  {df_res['global_level'].value_counts().sort_index().to_dict()}, "
+              f"fallback RANSAC: {df_res['fallback'].mean():.1%}")
+        steps = pd.DataFrame([s for levels in df_res['levels'] for s in levels])
+        for (level, stage), group in steps.groupby(['level', 'stage'], sort=False):
+            print(f"  {stage:16s} x{level}: {group['seconds'].mean() * 1000:8.1f} ms, "
+                  f"fitness {group['fitness'].mean():.3f}, ran for {len(group) / len(df_res):.0%} of the scans")
+
+def write_report(df_res, filepath):
+    """Writes the results as csv, with the ICP matrix flattened into m00..m33 columns."""
+    df_out = df_res.drop(columns=['matrix_icp'])
+    if 'levels' in df_out:
+        df_out['levels'] = df_out['levels'].map(json.dumps)
+    flat = np.stack(df_res['matrix_icp'].to_list()).reshape(-1, 16) if len(df_res) else np.empty((0, 16))
+    for k, name in enumerate(f"m{r}{c}" for r in range(4) for c in range(4)):
+        df_out[name] = flat[:, k]
+    df_out.to_csv(filepath, index=False)
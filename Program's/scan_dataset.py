@@ -0,0 +1,190 @@
+"""
+Lazy, memory-bounded access to generated scans for the analysis notebooks.
+
+Supported layouts:
+
+    flat     <root>/dataset_index.csv + <root>/scans/scan_XXXX.csv
+    nested   <root>/Test_*/cam_*/setup_*/ground_truth.csv (+ scans in any scan_store format),
+             every ground_truth.csv below root by default, narrow it with pattern=NESTED_PATTERN
+             (a pattern is used even when the root has a dataset_index.csv)
+    batch    a single directory containing ground_truth.csv
+
+Only the index files are read up front. Scans are parsed on access, kept in an LRU cache
+with a byte budget, and iterating prefetches the next scans on a thread pool:
+
+    dataset = ScanDataset("../Blender_Generated_Data")
+    points, T_gt = dataset[5]
+    for points, T_gt in dataset:                # one scan at a time, next ones in flight
+        ...
+    for clouds, T_gts in dataset.batches(32):   # list of (N, 3) arrays, (B, 4, 4) array
+        ...
+"""
+import os
+import glob
+import threading
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from scan_store import ScanStore, read_ground_truth, row_matrix, load_scan_csv
+
+NESTED_PATTERN = os.path.join("Test_*", "cam_*", "setup_*")
+
+class ScanDataset:
+    """
+    Indexable dataset of (points, T_gt) pairs: points is an (N, 3) float32 array,
+    T_gt the 4x4 ground truth matrix as stored by the generator.
+    """
+
+    def __init__(self, root, pattern=None, cache_bytes=512 * 2**20, prefetch=8, workers=4):
+        self.root = root
+        self.cache_bytes = cache_bytes
+        self.prefetch = prefetch
+        self.workers = workers
+
+        # One entry per scan: (batch directory relative to root, position in that batch)
+        self.entries = []
+        self.rows = []
+        self._stores = {}
+
+        index_path = os.path.join(root, "dataset_index.csv")
+        if os.path.exists(os.path.join(root, "ground_truth.csv")):
+            self._add_batch("")
+        else:
+            # Without a pattern a flat index wins; an explicit pattern only falls back to it when nothing matches
+            if pattern is not None or not os.path.exists(index_path):
+                for gt_path in sorted(glob.glob(os.path.join(root, pattern or "**", "ground_truth.csv"), recursive=True)):
+                    self._add_batch(os.path.relpath(os.path.dirname(gt_path), root))
+            if not self.entries and os.path.exists(index_path):
+                _, rows = read_ground_truth(index_path)
+                self._add_rows(None, rows)
+
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def _add_batch(self, batch):
+        store = ScanStore(os.path.join(self.root, batch))
+        self._stores[batch] = store
+        self._add_rows(batch, store.rows)
+
+    def _add_rows(self, batch, rows):
+        for pos, row in enumerate(rows):
+            self.entries.append((batch, pos))
+            self.rows.append(row)
+
+    # --- INDEX ---
+
+    def __len__(self):
+        return len(self.entries)
+
+    def batch_names(self):
+        """Batch directories in index order ('Test_1/cam_d435/setup_front', ...)."""
+        return list(dict.fromkeys(batch for batch, _ in self.entries if batch is not None))
+
+    def indices(self, batch):
+        """Dataset indices of one batch directory."""
+        return [i for i, (b, _) in enumerate(self.entries) if b == batch]
+
+    def matrix(self, i):
+        return row_matrix(self.rows[i])
+
+    def info(self, i):
+        """Ground truth row of scan i, plus its 'batch' directory."""
+        return dict(self.rows[i], batch=self.entries[i][0])
+
+    # --- LOADING ---
+
+    def _load(self, i):
+        batch, pos = self.entries[i]
+        if batch is None:
+            return load_scan_csv(os.path.join(self.root, "scans", self.rows[i]['filename']))
+        # Copy container slices, so the data is read here and not on first use
+        return np.ascontiguousarray(self._stores[batch][pos])
+
+    def points(self, i):
+        """Points of scan i, through the LRU cache."""
+        with self._lock:
+            if i in self._cache:
+                self._cache.move_to_end(i)
+                return self._cache[i]
+
+        points = self._load(i)
+
+        with self._lock:
+            if i not in self._cache and points.nbytes <= self.cache_bytes:
+                self._cache[i] = points
+                self._cached_bytes += points.nbytes
+                while self._cached_bytes > self.cache_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cached_bytes -= evicted.nbytes
+        return points
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"scan index {i} out of range for {len(self)} scans")
+        return self.points(i), self.matrix(i)
+
+    # --- ITERATION ---
+
+    def iter(self, indices=None):
+        """Yields (index, points, T_gt) in order while the next 'prefetch' scans load in the background."""
+        indices = range(len(self)) if indices is None else indices
+        if self.prefetch <= 0:
+            for i in indices:
+                yield i, self.points(i), self.matrix(i)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            todo = iter(indices)
+            for i in todo:
+                pending.append((i, pool.submit(self.points, i)))
+                if len(pending) > self.prefetch:
+                    break
+            while pending:
+                i, future = pending.popleft()
+                next_i = next(todo, None)
+                if next_i is not None:
+                    pending.append((next_i, pool.submit(self.points, next_i)))
+                yield i, future.result(), self.matrix(i)
+
+    def __iter__(self):
+        for _, points, T_gt in self.iter():
+            yield points, T_gt
+
+    def batches(self, batch_size, indices=None):
+        """Yields (list of point arrays, (B, 4, 4) matrices) batches. Scans differ in size, so the points stay a list."""
+        clouds, matrices = [], []
+        for _, points, T_gt in self.iter(indices):
+            clouds.append(points)
+            matrices.append(T_gt)
+            if len(clouds) == batch_size:
+                yield clouds, np.stack(matrices)
+                clouds, matrices = [], []
+        if clouds:
+            yield clouds, np.stack(matrices)
+
+    @property
+    def clouds(self):
+        """Read-only {index: points} mapping that loads lazily (drop-in for a dict of loaded scans)."""
+        return PointCloudView(self)
+
+class PointCloudView(Mapping):
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __getitem__(self, i):
+        if not isinstance(i, (int, np.integer)) or not 0 <= i < len(self.dataset):
+            raise KeyError(i)
+        return self.dataset.points(int(i))
+
+    def __iter__(self):
+        return iter(range(len(self.dataset)))
+
+    def __len__(self):
+        return len(self.dataset)
@@ -0,0 +1,645 @@
+"""
+Scan storage formats for the generators and the notebooks.
+
+    csv    one scan_XXXX.csv per sample (the original text format)
+    npy    one scans.npy float32 (P, 3) point buffer per batch + scans_index.npy (N, 3) int64
+           [sample_id, offset, count] table
+    shard  one self-contained scans.shard file: header, float32 point buffer and a table
+           with sample_id, offset, count and the 4x4 pose of every scan
+    range  organized scans (--organized): one scans.range file with the sensor intrinsics and
+           per scan the hit bitmask of the pixel grid (cropped to the hits) and the range of
+           every hit; range16 stores the ranges as float16 offsets from the scan's nearest hit
+
+For npy/shard the ground_truth.csv 'filename' column names the container file and the
+extra 'point_offset' / 'point_count' columns locate the scan inside it. Both containers
+are memory-mapped by ScanStore, so scan i is a slice without any parsing. Range scans are
+located by 'record_offset' / 'point_count', their XYZ points are rebuilt from the sensor
+rays on access (ScanStore.range_image gives the image itself, see range_image.py).
+
+open_batch_output opens the ground truth file and scan writer of a generator run. With
+resume=True it keeps the samples an interrupted run already wrote (see --resume).
+batch_output wraps both for the generation loop; with a queue (--write_queue) an
+AsyncBatchOutput serializes and writes the scans on a background thread.
+
+Conversion tool:
+    python scan_store.py to_csv   <batch_dir> [--out <dir>]
+    python scan_store.py from_csv <batch_dir> --format shard [--out <dir>]
+"""
+import os
+import csv
+import json
+import time
+import queue
+import struct
+import argparse
+import warnings
+import threading
+import numpy as np
+
+from sensor_core import (SCAN_FORMATS, GT_HEADER, GT_MATRIX_HEADER, scan_filename, ground_truth_row,
+                         write_scan_csv, settings_seed, parse_settings_line, sensor_rotation,
+                         build_direction_grid, project_points)
+
+STORAGE_COLUMNS = ['point_offset', 'point_count']
+RANGE_STORAGE_COLUMNS = ['record_offset', 'point_count']
+_POINT_BYTES = 12
+
+# --- 1. NPY CONTAINER ---
+
+# Fixed header size, so the shape can be rewritten in place when the batch is closed
+_NPY_HEADER_LEN = 128
+
+def _npy_header(n_points):
+    header = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, 3), }" % n_points
+    header = header.ljust(_NPY_HEADER_LEN - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+# --- 2. SHARD CONTAINER ---
+
+_SHARD_MAGIC = b'SCANSHRD'
+_SHARD_VERSION = 1
+_SHARD_HEADER = struct.Struct('<8sIIQQ')      # magic, version, n_scans, n_points, table_offset
+_SHARD_DATA_START = 64
+SHARD_TABLE_DTYPE = np.dtype([('sample_id', '<i8'), ('offset', '<i8'), ('count', '<i8'), ('matrix', '<f4', (16,))])
+
+def read_shard(filepath):
+    """Memory-maps a .shard file. Returns (points (P, 3) float32, table structured array)."""
+    with open(filepath, 'rb') as f:
+        magic, version, n_scans, n_points, table_offset = _SHARD_HEADER.unpack(f.read(_SHARD_HEADER.size))
+    if magic != _SHARD_MAGIC or version != _SHARD_VERSION:
+        raise ValueError(f"'{filepath}' is not a version {_SHARD_VERSION} scan shard")
+
+    # np.memmap refuses empty maps
+    points = np.empty((0, 3), np.float32)
+    table = np.empty(0, SHARD_TABLE_DTYPE)
+    if n_points:
+        points = np.memmap(filepath, dtype='<f4', mode='r', offset=_SHARD_DATA_START, shape=(n_points, 3))
+    if n_scans:
+        table = np.memmap(filepath, dtype=SHARD_TABLE_DTYPE, mode='r', offset=table_offset, shape=(n_scans,))
+    return points, table
+
+# --- 3. RANGE IMAGE CONTAINER ---
+
+_RANGE_MAGIC = b'RANGEIMG'
+_RANGE_VERSION = 1
+_RANGE_HEADER = struct.Struct('<8sII')      # magic, version, length of the JSON intrinsics
+_RANGE_DATA_START = 1024
+_RANGE_RECORD = struct.Struct('<fHHHH')     # range offset, first row, first col, rows, cols of the mask crop
+
+def read_range_container(filepath):
+    """Memory-maps a .range file. Returns (intrinsics dict, records as a uint8 array)."""
+    with open(filepath, 'rb') as f:
+        magic, version, json_len = _RANGE_HEADER.unpack(f.read(_RANGE_HEADER.size))
+        if magic != _RANGE_MAGIC or version != _RANGE_VERSION:
+            raise ValueError(f"'{filepath}' is not a version {_RANGE_VERSION} range image container")
+        intrinsics = json.loads(f.read(json_len))
+    size = os.path.getsize(filepath) - _RANGE_DATA_START
+    data = np.memmap(filepath, dtype=np.uint8, mode='r', offset=_RANGE_DATA_START, shape=(size,)) if size else np.empty(0, np.uint8)
+    return intrinsics, data
+
+def range_record_size(intrinsics, data, offset, count):
+    """Bytes of the record at offset (records are mask crop + ranges, so the size varies)."""
+    _, _, _, rows, cols = _RANGE_RECORD.unpack_from(data, offset)
+    return _RANGE_RECORD.size + (rows * cols + 7) // 8 + count * np.dtype(intrinsics['range_dtype']).itemsize
+
+def decode_range_record(intrinsics, data, offset, count):
+    """Flat pixel indices (row-major, ascending) and float32 ranges of the hits of one record."""
+    base, row0, col0, rows, cols = _RANGE_RECORD.unpack_from(data, offset)
+    start = offset + _RANGE_RECORD.size
+    mask_bytes = (rows * cols + 7) // 8
+    crop = np.unpackbits(np.asarray(data[start:start + mask_bytes]), count=rows * cols).reshape(rows, cols)
+    r, c = np.nonzero(crop)
+    pixels = (r + row0) * intrinsics['res_w'] + (c + col0)
+    ranges = np.frombuffer(data, dtype=intrinsics['range_dtype'], count=count, offset=start + mask_bytes)
+    return pixels, ranges.astype(np.float32) + np.float32(base)
+
+def range_points(intrinsics, pixels, ranges):
+    """XYZ world points (float32) of range image hits: sensor position + range * pixel ray."""
+    grid = build_direction_grid(intrinsics['res_w'], intrinsics['res_h'], intrinsics['fov_h'], intrinsics['fov_v'])
+    dirs = grid[pixels] @ np.asarray(intrinsics['rotation']).T
+    return (np.asarray(intrinsics['position']) + ranges[:, np.newaxis] * dirs).astype(np.float32)
+
+# --- 4. WRITERS ---
+
+def _reopen(path, keep_bytes):
+    """Opens an unfinished container for appending after its first keep_bytes bytes."""
+    f = open(path, 'r+b')
+    f.truncate(keep_bytes)
+    f.seek(0, os.SEEK_END)
+    return f
+
+class CsvScanWriter:
+    """One scan_XXXX.csv per sample. bytes_written counts the scan data of this writer (all writers)."""
+    storage_columns = []
+    bytes_written = 0
+    file = None
+
+    def __init__(self, output_dir, name="scans", resume=(), settings=None):
+        self.output_dir = output_dir
+
+    def write(self, sample_id, points, matrix):
+        """Stores one scan. Returns (filename, extra ground truth columns)."""
+        filename = scan_filename(sample_id)
+        path = os.path.join(self.output_dir, filename)
+        write_scan_csv(path, points)
+        self.bytes_written += os.path.getsize(path)
+        return filename, []
+
+    def flush(self, fsync=False):
+        """Pushes the scans written so far to the disk (csv scans are complete files already)."""
+        if self.file is None or self.file.closed:
+            return
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class NpyScanWriter(CsvScanWriter):
+    """All scans of a batch appended to one memory-mappable .npy point buffer."""
+    storage_columns = STORAGE_COLUMNS
+
+    def __init__(self, output_dir, name="scans", resume=(), settings=None):
+        """resume: ground truth rows of scans already in the file, writing continues after them."""
+        self.output_dir = output_dir
+        self.filename = f"{name}.npy"
+        self.index_path = os.path.join(output_dir, f"{name}_index.npy")
+        self.index = [(int(r['sample_id']), int(r['point_offset']), int(r['point_count'])) for r in resume]
+        self.n_points = sum(count for _, _, count in self.index)
+        path = os.path.join(output_dir, self.filename)
+        if self.index:
+            self.file = _reopen(path, _NPY_HEADER_LEN + self.n_points * _POINT_BYTES)
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(_npy_header(0))
+
+    def write(self, sample_id, points, matrix):
+        points = np.ascontiguousarray(points, dtype='<f4')
+        offset = self.n_points
+        self.file.write(points.tobytes())
+        self.n_points += len(points)
+        self.bytes_written += points.nbytes
+        self.index.append((sample_id, offset, len(points)))
+        return self.filename, [offset, len(points)]
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.seek(0)
+        self.file.write(_npy_header(self.n_points))
+        self.file.close()
+        np.save(self.index_path, np.array(self.index, dtype=np.int64).reshape(-1, 3))
+
+class ShardScanWriter(CsvScanWriter):
+    """All scans of a batch plus their poses in one self-contained .shard file."""
+    storage_columns = STORAGE_COLUMNS
+
+    def __init__(self, output_dir, name="scans", resume=(), settings=None):
+        """resume: ground truth rows of scans already in the file, writing continues after them."""
+        self.output_dir = output_dir
+        self.filename = f"{name}.shard"
+        # Poses of resumed scans come back from the (6 decimal) ground truth columns
+        self.table = [(int(r['sample_id']), int(r['point_offset']), int(r['point_count']),
+                       row_matrix(r).astype(np.float32).reshape(16)) for r in resume]
+        self.n_points = sum(count for _, _, count, _ in self.table)
+        path = os.path.join(output_dir, self.filename)
+        if self.table:
+            self.file = _reopen(path, _SHARD_DATA_START + self.n_points * _POINT_BYTES)
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(b'\0' * _SHARD_DATA_START)
+
+    def write(self, sample_id, points, matrix):
+        points = np.ascontiguousarray(points, dtype='<f4')
+        offset = self.n_points
+        self.file.write(points.tobytes())
+        self.n_points += len(points)
+        self.bytes_written += points.nbytes
+        self.table.append((sample_id, offset, len(points), np.asarray(matrix, dtype=np.float32).reshape(16)))
+        return self.filename, [offset, len(points)]
+
+    def close(self):
+        if self.file.closed:
+            return
+        # Keep the table 8-byte aligned after the float32 points
+        self.file.write(b'\0' * (-self.file.tell() % 8))
+        table_offset = self.file.tell()
+        self.file.write(np.array(self.table, dtype=SHARD_TABLE_DTYPE).tobytes())
+        self.file.seek(0)
+        self.file.write(_SHARD_HEADER.pack(_SHARD_MAGIC, _SHARD_VERSION, len(self.table), self.n_points, table_offset))
+        self.file.close()
+
+class RangeScanWriter(CsvScanWriter):
+    """
+    Organized scans of a batch in one .range file. The points are put back on the sensor's
+    pixel grid (project_points), so every hit keeps only its range; the intrinsics come
+    from the settings line.
+    """
+    storage_columns = RANGE_STORAGE_COLUMNS
+    range_dtype = '<f4'
+
+    def __init__(self, output_dir, name="scans", resume=(), settings=None):
+        """resume: ground truth rows of scans already in the file, writing continues after them."""
+        if settings is None:
+            raise ValueError("range images need the sensor settings line")
+        sensor = parse_settings_line(settings)
+        self.intrinsics = {
+            'res_w': sensor['res_w'], 'res_h': sensor['res_h'], 'fov_h': sensor['fov_h'], 'fov_v': sensor['fov_v'],
+            'position': sensor['position'].tolist(), 'rotation': sensor_rotation(sensor['position']).tolist(),
+            'range_dtype': self.range_dtype,
+        }
+        self.output_dir = output_dir
+        self.filename = f"{name}.range"
+        path = os.path.join(output_dir, self.filename)
+
+        self.n_bytes = 0
+        if resume:
+            intrinsics, data = read_range_container(path)
+            last = resume[-1]
+            offset, count = int(last['record_offset']), int(last['point_count'])
+            self.n_bytes = offset + range_record_size(intrinsics, data, offset, count)
+            del data
+            self.file = _reopen(path, _RANGE_DATA_START + self.n_bytes)
+        else:
+            self.file = open(path, 'wb')
+            header = json.dumps(self.intrinsics).encode()
+            self.file.write(_RANGE_HEADER.pack(_RANGE_MAGIC, _RANGE_VERSION, len(header)) + header)
+            self.file.write(b'\0' * (_RANGE_DATA_START - self.file.tell()))
+
+    def write(self, sample_id, points, matrix):
+        intr = self.intrinsics
+        row, col, ranges = project_points(points, intr['position'], intr['rotation'],
+                                          intr['res_w'], intr['res_h'], intr['fov_h'], intr['fov_v'])
+        # Grid order, one hit per pixel: points off their pixel ray (noise) would be merged, so they are refused
+        pixels, first = np.unique(row * intr['res_w'] + col, return_index=True)
+        if len(pixels) < len(points):
+            raise ValueError(f"scan {sample_id}: {len(points) - len(pixels)} points share a pixel, "
+                             "range formats only store noise-free scans")
+        ranges = ranges[first]
+        row, col = row[first], col[first]
+
+        if len(pixels):
+            row0, col0 = row.min(), col.min()
+            crop = np.zeros((row.max() - row0 + 1, col.max() - col0 + 1), dtype=bool)
+            crop[row - row0, col - col0] = True
+        else:
+            row0 = col0 = 0
+            crop = np.zeros((0, 0), dtype=bool)
+        base = np.float32(ranges.min()) if len(ranges) and self.range_dtype == '<f2' else np.float32(0.0)
+
+        offset = self.n_bytes
+        record = (_RANGE_RECORD.pack(base, row0, col0, *crop.shape) + np.packbits(crop).tobytes()
+                  + (ranges - base).astype(self.range_dtype).tobytes())
+        self.file.write(record)
+        self.n_bytes += len(record)
+        self.bytes_written += len(record)
+        return self.filename, [offset, len(pixels)]
+
+    def close(self):
+        self.file.close()
+
+class Range16ScanWriter(RangeScanWriter):
+    """RangeScanWriter with float16 ranges, relative to the nearest hit of each scan."""
+    range_dtype = '<f2'
+
+_WRITERS = {"csv": CsvScanWriter, "npy": NpyScanWriter, "shard": ShardScanWriter,
+            "range": RangeScanWriter, "range16": Range16ScanWriter}
+
+def open_scan_writer(fmt, output_dir, name="scans", resume=(), settings=None):
+    """Returns the scan writer for one of SCAN_FORMATS. The range formats need the settings line."""
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unknown scan format '{fmt}' (choose from {', '.join(SCAN_FORMATS)})")
+    return _WRITERS[fmt](output_dir, name, resume, settings)
+
+# --- 5. RESUMING ---
+
+def existing_seed(gt_path):
+    """Seed in the settings line of an existing ground truth file, or None."""
+    if not os.path.exists(gt_path):
+        return None
+    with open(gt_path, 'r') as f:
+        return settings_seed(f.readline())
+
+def _written_rows(gt_path, settings, header, sample_ids):
+    """
+    Complete ground truth rows of an interrupted run that follow sample_ids, and the file
+    length before the first row and after each row. Raises ValueError when the run used other settings.
+    """
+    rows = []
+    with open(gt_path, 'rb') as f:
+        if f.readline().decode() != settings:
+            raise ValueError(f"'{gt_path}' was generated with other settings, remove it or drop --resume")
+        if f.readline().decode().rstrip('\r\n').split(',') != header:
+            raise ValueError(f"'{gt_path}' has other columns (scan format changed?)")
+        ends = [f.tell()]
+        for line in f:
+            # A row cut off by the crash has no line end
+            if len(rows) == len(sample_ids) or not line.endswith(b'\n'):
+                break
+            values = next(csv.reader([line.decode()]))
+            if len(values) != len(header) or values[0] != str(sample_ids[len(rows)]):
+                break
+            rows.append(dict(zip(header, values)))
+            ends.append(ends[-1] + len(line))
+    return rows, ends
+
+def _scans_on_disk(rows, output_dir):
+    """Number of leading rows whose scan data was completely written."""
+    containers = {}
+    for k, row in enumerate(rows):
+        filename = row['filename']
+        path = os.path.join(output_dir, filename)
+        if filename.endswith('.csv'):
+            if not os.path.exists(path):
+                return k
+            continue
+        if not os.path.exists(path):
+            return k
+
+        # Byte extents inside the container's data section
+        count = int(row['point_count'])
+        if filename.endswith('.range'):
+            if filename not in containers:
+                containers[filename] = [read_range_container(path), 0]
+            (intrinsics, data), next_offset = containers[filename]
+            offset = int(row['record_offset'])
+            available = len(data)
+            if offset + _RANGE_RECORD.size > available:
+                return k
+            size = range_record_size(intrinsics, data, offset, count)
+        else:
+            if filename not in containers:
+                data_start = _SHARD_DATA_START if filename.endswith('.shard') else _NPY_HEADER_LEN
+                containers[filename] = [os.path.getsize(path) - data_start, 0]
+            available, next_offset = containers[filename]
+            offset, size = int(row['point_offset']) * _POINT_BYTES, count * _POINT_BYTES
+
+        if offset != next_offset or offset + size > available:
+            return k
+        containers[filename][1] = offset + size
+    return len(rows)
+
+def open_batch_output(output_dir, gt_name, store_name, fmt, settings, sample_ids, resume=False):
+    """
+    Opens the ground truth file and scan writer of a generator run.
+    With resume, the samples of an interrupted run with the same settings line are kept and
+    both files continue after the last complete one.
+    Returns (ground truth file, scan writer, sample ids still to generate).
+    """
+    gt_path = os.path.join(output_dir, gt_name)
+    header = GT_HEADER + GT_MATRIX_HEADER + _WRITERS[fmt].storage_columns
+
+    if resume and os.path.exists(gt_path):
+        rows, ends = _written_rows(gt_path, settings, header, sample_ids)
+        rows = rows[:_scans_on_disk(rows, output_dir)]
+        with open(gt_path, 'r+b') as f:
+            f.truncate(ends[len(rows)])
+        gt_file = open(gt_path, 'a', newline='')
+        return gt_file, open_scan_writer(fmt, output_dir, store_name, rows, settings), sample_ids[len(rows):]
+
+    gt_file = open(gt_path, 'w', newline='')
+    gt_file.write(settings)
+    csv.writer(gt_file).writerow(header)
+    return gt_file, open_scan_writer(fmt, output_dir, store_name, settings=settings), sample_ids
+
+# --- 6. BATCH OUTPUT ---
+
+class BatchOutput:
+    """Scan writer and ground truth file of one batch, written in the generation loop's thread."""
+
+    def __init__(self, gt_file, scan_writer):
+        self.gt_file = gt_file
+        self.scan_writer = scan_writer
+        self.gt_writer = csv.writer(gt_file)
+
+    @property
+    def bytes_written(self):
+        return self.scan_writer.bytes_written
+
+    def write(self, sample_id, points, matrix, params):
+        """Stores one scan and appends its ground truth row. Returns the scan bytes written."""
+        written = self.scan_writer.bytes_written
+        filename, storage = self.scan_writer.write(sample_id, points, matrix)
+        self.gt_writer.writerow(ground_truth_row(sample_id, filename, matrix, params) + storage)
+        return self.scan_writer.bytes_written - written
+
+    def close(self):
+        self.scan_writer.close()
+        self.gt_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class AsyncBatchOutput(BatchOutput):
+    """
+    BatchOutput that hands the scans to a writer thread through a bounded queue, so the
+    serialization and disk time overlap with the ray casting. write() blocks while the queue
+    is full (at most queue_size scans are held in memory).
+
+    The thread collects the ground truth rows and appends them in one go every flush_rows
+    scans or flush_interval seconds, after the scan data they point to (fsynced, so a resumed
+    run finds both). A write error on the thread is raised again by the next write() / close().
+    The points must not be changed after write(), which returns None: the scan is not
+    serialized yet, only bytes_written after close() is complete.
+    """
+    _DONE = object()
+
+    def __init__(self, gt_file, scan_writer, queue_size=16, flush_interval=5.0, flush_rows=256):
+        super().__init__(gt_file, scan_writer)
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self._rows = []
+        self._thread = threading.Thread(target=self._run, name=f"scan-writer-{gt_file.name}", daemon=True)
+        self._thread.start()
+
+    def write(self, sample_id, points, matrix, params):
+        self._raise_error()
+        self.queue.put((sample_id, points, matrix, params))
+        return None
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                # Without an interval every scan is flushed, so there is nothing to wake up for
+                item = self.queue.get(timeout=self.flush_interval) if self.flush_interval > 0 else self.queue.get()
+            except queue.Empty:
+                item = None
+            if item is self._DONE:
+                break
+            if self.error is not None:
+                # Keep draining, so the generation loop is never blocked on a dead writer
+                continue
+            try:
+                if item is not None:
+                    sample_id, points, matrix, params = item
+                    filename, storage = self.scan_writer.write(sample_id, points, matrix)
+                    self._rows.append(ground_truth_row(sample_id, filename, matrix, params) + storage)
+                if len(self._rows) >= self.flush_rows or time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                self.error = e
+        if self.error is None:
+            try:
+                self._flush()
+            except Exception as e:
+                self.error = e
+
+    def _flush(self):
+        if not self._rows:
+            return
+        self.scan_writer.flush(fsync=True)
+        self.gt_writer.writerows(self._rows)
+        self._rows = []
+        self.gt_file.flush()
+        os.fsync(self.gt_file.fileno())
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """Waits for the queued scans, then closes the files. Raises the writer thread's error (once)."""
+        if self._thread.is_alive():
+            self.queue.put(self._DONE)
+            self._thread.join()
+        super().close()
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+def batch_output(gt_file, scan_writer, queue_size=0, flush_interval=5.0):
+    """BatchOutput of open_batch_output's files, an AsyncBatchOutput when queue_size > 0."""
+    if queue_size > 0:
+        return AsyncBatchOutput(gt_file, scan_writer, queue_size, flush_interval)
+    return BatchOutput(gt_file, scan_writer)
+
+# --- 7. READERS ---
+
+def read_ground_truth(gt_path):
+    """Reads a ground_truth.csv. Returns (settings line or None, list of row dicts)."""
+    settings = None
+    with open(gt_path, 'r', newline='') as f:
+        first = f.readline()
+        if first.startswith('#'):
+            settings = first.strip()
+        else:
+            f.seek(0)
+        rows = list(csv.DictReader(f))
+    return settings, rows
+
+def row_matrix(row):
+    """4x4 ground truth matrix of a ground_truth.csv row dict."""
+    return np.array([float(row[c]) for c in GT_MATRIX_HEADER]).reshape(4, 4)
+
+class ScanStore:
+    """
+    Read access to one batch directory in any of the SCAN_FORMATS.
+    store[i] returns the (N, 3) float32 points of the i-th ground truth row.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.settings, self.rows = read_ground_truth(os.path.join(directory, "ground_truth.csv"))
+        self._containers = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        row = self.rows[i]
+        filename = row['filename']
+        if filename.endswith('.csv'):
+            return load_scan_csv(os.path.join(self.directory, filename))
+        if filename.endswith('.range'):
+            intrinsics, pixels, ranges = self.range_image(i)
+            return range_points(intrinsics, pixels, ranges)
+
+        offset, count = int(row['point_offset']), int(row['point_count'])
+        return self._container(filename)[offset:offset + count]
+
+    def matrix(self, i):
+        return row_matrix(self.rows[i])
+
+    @property
+    def format(self):
+        """Scan format of the batch (one of SCAN_FORMATS), taken from the first row."""
+        if not self.rows:
+            return "csv"
+        filename = self.rows[0]['filename']
+        if filename.endswith('.range'):
+            return "range16" if self._container(filename)[0]['range_dtype'] == '<f2' else "range"
+        return os.path.splitext(filename)[1][1:]
+
+    def range_image(self, i):
+        """(intrinsics, flat pixel indices, float32 ranges) of an organized scan."""
+        row = self.rows[i]
+        intrinsics, data = self._container(row['filename'])
+        pixels, ranges = decode_range_record(intrinsics, data, int(row['record_offset']), int(row['point_count']))
+        return intrinsics, pixels, ranges
+
+    def _container(self, filename):
+        if filename not in self._containers:
+            path = os.path.join(self.directory, filename)
+            if filename.endswith('.shard'):
+                self._containers[filename] = read_shard(path)[0]
+            elif filename.endswith('.range'):
+                self._containers[filename] = read_range_container(path)
+            else:
+                self._containers[filename] = np.load(path, mmap_mode='r')
+        return self._containers[filename]
+
+def load_scan_csv(filepath):
+    """Reads an X,Y,Z scan csv into an (N, 3) float32 array."""
+    # A scan without hits is a header-only file, which is valid here
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="loadtxt: input contained no data")
+        return np.loadtxt(filepath, delimiter=',', skiprows=1, dtype=np.float32, ndmin=2).reshape(-1, 3)
+
+# --- 8. CONVERSION ---
+
+def convert(directory, out_dir, fmt):
+    """Rewrites a batch directory in another scan format (ground_truth.csv included)."""
+    store = ScanStore(directory)
+    os.makedirs(out_dir, exist_ok=True)
+    with open_scan_writer(fmt, out_dir, settings=store.settings) as writer, open(os.path.join(out_dir, "ground_truth.csv"), 'w', newline='') as gt_file:
+        if store.settings:
+            gt_file.write(store.settings + "\n")
+        gt_writer = csv.writer(gt_file)
+        gt_writer.writerow(GT_HEADER + GT_MATRIX_HEADER + writer.storage_columns)
+
+        for i, row in enumerate(store.rows):
+            sample_id = int(row['sample_id'])
+            matrix = store.matrix(i)
+            filename, storage = writer.write(sample_id, store[i], matrix)
+            params = {k: float(row[k]) for k in GT_HEADER[2:]}
+            gt_writer.writerow(ground_truth_row(sample_id, filename, matrix, params) + storage)
+    print(f"Converted {len(store)} scans to '{fmt}' in {out_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert scan batches between storage formats")
+    parser.add_argument("command", choices=["to_csv", "from_csv"])
+    parser.add_argument("directory", help="Batch directory containing ground_truth.csv")
+    parser.add_argument("--format", choices=SCAN_FORMATS[1:], default="shard", help="Target format for from_csv")
+    parser.add_argument("--out", help="Output directory (default: <directory>_<format>)")
+    args = parser.parse_args()
+
+    fmt = "csv" if args.command == "to_csv" else args.format
+    out_dir = args.out or f"{args.directory.rstrip('/')}_{fmt}"
+    convert(args.directory, out_dir, fmt)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+Blender-free building blocks shared by BlenderSensorProgram.py and HeadlessSensorProgram.py:
+command line arguments, sensor geometry, random poses and the scan / ground truth file contract.
+Only depends on the standard library and NumPy.
+"""
+import os
+import re
+import argparse
+import math
+import json
+import secrets
+import numpy as np
+
+SCAN_FORMATS = ("csv", "npy", "shard", "range", "range16")
+# Organized formats: one range per pixel ray (see scan_store.RangeScanWriter)
+RANGE_FORMATS = ("range", "range16")
+
+# --- 1. COMMAND LINE ---
+
+def non_negative_float(text):
+    """argparse type of a float argument that must not be negative (--fsync_interval)."""
+    value = float(text)
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"must be >= 0, got {text}")
+    return value
+
+def add_common_arguments(parser):
+    """Adds the arguments every generator backend understands (same names as the notebook passes)."""
+    # Required unless every setup in --setups brings its own (see load_setups)
+    parser.add_argument("--sensor_res")
+    parser.add_argument("--sensor_fov")
+    parser.add_argument("--position")
+    parser.add_argument("--samples", type=int, required=True)
+    parser.add_argument("--output", required=True)
+
+    parser.add_argument("--rot_range", type=float, default=180.0)
+    parser.add_argument("--trans_range", type=float, default=0.0)
+    # How the poses fill the ranges: independent random draws or an even coverage (see pose_sampling.py)
+    parser.add_argument("--pose_sampler", choices=("random", "quaternion", "sobol", "halton", "grid"), default="random",
+                        help="Pose sampling strategy")
+    parser.add_argument("--coverage", action="store_true",
+                        help="Write pose_coverage.json for the finished run (after the merge when sharded)")
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("--target_name", default="Cube")
+    parser.add_argument("--max_dist", type=float, default=100.0)
+
+    # Only the rays around the target's projected bounding box are cast; the scans are identical
+    parser.add_argument("--full_grid", action="store_true", help="Cast every pixel (disables the target ROI culling)")
+
+    # NEW: Optional flag to enable/disable visualization images
+    # Use action='store_true' -> if present = True, if missing = False
+    parser.add_argument("--viz", action="store_true", help="Generate debug visualization images")
+    # Debug views are reused across jobs with the same setup (see BlenderSensorProgram.start_debug_views)
+    parser.add_argument("--viz_res", default="640x360", help="Debug view resolution WxH ('scene' keeps the .blend setting)")
+    parser.add_argument("--viz_cache", default=None, help="Shared debug view cache directory (default: <output>/viz_cache)")
+    parser.add_argument("--viz_sync", action="store_true", help="Render missing debug views in this process before the samples")
+
+    # Scan storage: text csv per sample, or one binary point buffer per batch (see scan_store.py)
+    parser.add_argument("--format", choices=SCAN_FORMATS, default="csv", help="Scan storage format")
+    # Organized scans: hit mask + range per pixel, short for --format range (float32) / range16 (float16)
+    parser.add_argument("--organized", nargs="?", const="float32", choices=("float32", "float16"), default=None,
+                        help="Store range images instead of point lists")
+
+    # Reproducible / split runs: every sample id gets its own RNG derived from --seed,
+    # so any shard of the id range can be generated independently (see parallel_generate.py)
+    parser.add_argument("--seed", type=int, default=None, help="Base seed (random when omitted, recorded in the settings line)")
+    parser.add_argument("--start_index", type=int, default=0, help="First sample id of this run")
+    parser.add_argument("--shards", type=int, default=1, help="Number of shards the sample range is split into")
+    parser.add_argument("--shard-index", dest="shard_index", type=int, default=0, help="Shard generated by this process")
+
+    # Scans are written by a background thread per output while the next poses are cast (0 = in the loop)
+    parser.add_argument("--write_queue", type=int, default=16, help="Scans buffered for the writer thread, 0 writes synchronously")
+    parser.add_argument("--fsync_interval", type=non_negative_float, default=5.0,
+                        help="Seconds between ground truth appends + fsync (0 = after every scan)")
+
+    # Continue an interrupted run: keeps the samples already written (same settings required)
+    parser.add_argument("--resume", action="store_true", help="Continue after the samples already in the output")
+
+    # Several sensors / positions in one run: every pose is scanned from each setup (paired views)
+    parser.add_argument("--setups", default=None, help="JSON list of setups (inline or a .json file), see load_setups")
+
+    # Stage times, rays/s and bytes per sample in profile.jsonl / profile_summary.json (see profiler.py)
+    parser.add_argument("--profile", action="store_true", help="Record per-stage timing and throughput")
+    return parser
+
+def parse_sensor_spec(sensor_res, sensor_fov):
+    """Parses '640x480' and '87.0x58.0' strings. Raises ValueError on a bad format."""
+    res_w, res_h = map(int, sensor_res.split('x'))
+    fov_h, fov_v = map(float, sensor_fov.split('x'))
+    return res_w, res_h, fov_h, fov_v
+
+def parse_position(location_str):
+    """Parses an 'x,y,z' string into a float64 array."""
+    x, y, z = map(float, location_str.split(','))
+    return np.array([x, y, z])
+
+def scan_format(args):
+    """Scan format of a run (--organized overrides --format)."""
+    if args.organized is not None:
+        return "range16" if args.organized == "float16" else "range"
+    return args.format
+
+SETUP_KEYS = ("sensor_res", "sensor_fov", "position", "max_dist", "noise")
+
+def load_setups(args):
+    """
+    Sensor setups of a run, one dict per setup with 'name', 'output', 'res_w', 'res_h', 'fov_h',
+    'fov_v', 'position' (the 'x,y,z' string), 'max_dist' and 'noise'.
+
+    Without --setups this is the single setup of the command line, written to --output.
+    --setups is a JSON list (inline or the path of a .json file) such as
+        [{"name": "cam_d435/setup_front", "sensor_res": "848x480", "sensor_fov": "69.0x42.0",
+          "position": "0.0,2.0,1.5", "max_dist": 10.0}, ...]
+    where every setup is written to --output/<name> and missing keys default to the command line.
+    Raises ValueError on a bad or incomplete setup, and on noise with a range format.
+    """
+    if args.setups is None:
+        specs = [{"name": ""}]
+    elif os.path.exists(args.setups):
+        with open(args.setups, 'r') as f:
+            specs = json.load(f)
+    else:
+        specs = json.loads(args.setups)
+
+    setups = []
+    for k, spec in enumerate(specs):
+        unknown = set(spec) - set(SETUP_KEYS) - {"name"}
+        if unknown:
+            raise ValueError(f"unknown setup keys {sorted(unknown)}")
+        values = {key: spec.get(key, getattr(args, key)) for key in SETUP_KEYS}
+        if None in (values["sensor_res"], values["sensor_fov"], values["position"]):
+            raise ValueError(f"setup {k} needs sensor_res, sensor_fov and position")
+
+        res_w, res_h, fov_h, fov_v = parse_sensor_spec(values["sensor_res"], values["sensor_fov"])
+        parse_position(values["position"])
+        name = spec.get("name", f"setup_{k}")
+        setups.append({
+            "name": name, "output": os.path.join(args.output, name) if name else args.output,
+            "res_w": res_w, "res_h": res_h, "fov_h": fov_h, "fov_v": fov_v, "position": values["position"],
+            "max_dist": float(values["max_dist"]), "noise": float(values["noise"]),
+        })
+
+    if len({setup["output"] for setup in setups}) < len(setups):
+        raise ValueError("setup names must be unique")
+    # Noisy points leave their pixel ray, a range image can neither place nor keep them
+    if scan_format(args) in RANGE_FORMATS and any(setup["noise"] > 0 for setup in setups):
+        raise ValueError("--noise needs a point format (npy, shard, csv), add noise to range scans with noise_augment.py")
+    return setups
+
+# --- 2. SENSOR GEOMETRY ---
+
+# Direction grids only depend on the sensor spec, so they are built once per spec
+_DIRECTION_GRIDS = {}
+
+def build_direction_grid(res_w, res_h, fov_h, fov_v):
+    """
+    Returns the unit ray directions of every pixel in sensor space as an (H*W, 3) float32 array.
+    Rows are ordered like the pixel loop (y outer, x inner), the sensor looks along -Z.
+    """
+    key = (res_w, res_h, fov_h, fov_v)
+    if key not in _DIRECTION_GRIDS:
+        u = np.arange(res_w) / res_w - 0.5
+        v = np.arange(res_h) / res_h - 0.5
+        grid = np.empty((res_h, res_w, 3))
+        grid[..., 0] = np.tan(u * math.radians(fov_h))[np.newaxis, :]
+        grid[..., 1] = np.tan(v * math.radians(fov_v))[:, np.newaxis]
+        grid[..., 2] = -1.0
+        grid /= np.linalg.norm(grid, axis=2, keepdims=True)
+        _DIRECTION_GRIDS[key] = grid.reshape(-1, 3).astype(np.float32)
+    return _DIRECTION_GRIDS[key]
+
+def project_points(points, sensor_loc, sensor_rot, res_w, res_h, fov_h, fov_v):
+    """
+    Inverse of the build_direction_grid mapping: nearest pixel (row, col) of world space points
+    seen from the sensor, clipped to the image, and their distance to the sensor.
+    """
+    offsets = np.asarray(points, dtype=np.float64) - np.asarray(sensor_loc, dtype=np.float64)
+    local = offsets @ np.asarray(sensor_rot, dtype=np.float64)
+    depth = -local[:, 2]
+    col = np.rint((np.arctan2(local[:, 0], depth) / math.radians(fov_h) + 0.5) * res_w).astype(np.int64)
+    row = np.rint((np.arctan2(local[:, 1], depth) / math.radians(fov_v) + 0.5) * res_h).astype(np.int64)
+    return np.clip(row, 0, res_h - 1), np.clip(col, 0, res_w - 1), np.linalg.norm(offsets, axis=1)
+
+def box_corners(bbox_min, bbox_max, matrix=None):
+    """The 8 corners of an axis-aligned box as an (8, 3) array, moved by a 4x4 matrix when given."""
+    corners = np.array([[x, y, z] for x in (bbox_min[0], bbox_max[0])
+                                  for y in (bbox_min[1], bbox_max[1])
+                                  for z in (bbox_min[2], bbox_max[2])], dtype=np.float64)
+    if matrix is not None:
+        matrix = np.asarray(matrix, dtype=np.float64)
+        corners = corners @ matrix[:3, :3].T + matrix[:3, 3]
+    return corners
+
+def target_roi(res_w, res_h, fov_h, fov_v, sensor_loc, sensor_rot, corners, max_dist, margin=1):
+    """
+    Region of interest of a target enclosed by the world space 'corners' (its bounding box).
+    The corners are projected with the inverse of the build_direction_grid mapping; the whole
+    target projects inside their pixel rectangle, so rays outside of it can never hit it.
+    Rays also end at the far side of the box's bounding sphere.
+    Returns (indices into the direction grid, clamped max_dist). The indices are None (full grid)
+    when the box is not completely in front of the sensor.
+    """
+    sensor_loc = np.asarray(sensor_loc, dtype=np.float64)
+    center = corners.mean(axis=0)
+    radius = np.linalg.norm(corners - center, axis=1).max()
+    max_dist = min(max_dist, np.linalg.norm(center - sensor_loc) + radius)
+
+    local = (corners - sensor_loc) @ np.asarray(sensor_rot, dtype=np.float64)
+    depth = -local[:, 2]
+    if depth.min() <= 1e-9:
+        return None, max_dist
+
+    # Pixel x has the angle (x / W - 0.5) * fov, so x = (angle / fov + 0.5) * W
+    x = (np.arctan(local[:, 0] / depth) / math.radians(fov_h) + 0.5) * res_w
+    y = (np.arctan(local[:, 1] / depth) / math.radians(fov_v) + 0.5) * res_h
+    cols = np.arange(max(int(math.floor(x.min())) - margin, 0), min(int(math.ceil(x.max())) + margin + 1, res_w))
+    rows = np.arange(max(int(math.floor(y.min())) - margin, 0), min(int(math.ceil(y.max())) + margin + 1, res_h))
+
+    # Row-major like the grid, so the hits keep the order of a full scan
+    return (rows[:, np.newaxis] * res_w + cols[np.newaxis, :]).ravel(), max_dist
+
+def quaternion_to_matrix(q):
+    """(w, x, y, z) unit quaternion to a 3x3 rotation matrix."""
+    w, x, y, z = q
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+        [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)],
+    ])
+
+def sensor_rotation(position):
+    """
+    Rotation of a sensor at 'position' that looks at the world origin.
+    Port of Blender's Vector.to_track_quat('-Z', 'Y') as used by setup_sensor_object,
+    so both backends produce the same sensor frame.
+    """
+    tvec = np.asarray(position, dtype=np.float64)
+    length = np.linalg.norm(tvec)
+    if length == 0.0:
+        return np.eye(3)
+
+    # 1. Shortest rotation of +Z onto the (sensor - target) vector
+    nor = np.array([-tvec[1], tvec[0], 0.0])
+    if abs(tvec[0]) + abs(tvec[1]) < 1e-4:
+        nor[0] = 1.0
+    nor /= np.linalg.norm(nor)
+    half = 0.5 * math.acos(max(-1.0, min(1.0, tvec[2] / length)))
+    q = np.concatenate([[math.cos(half)], nor * math.sin(half)])
+
+    # 2. Twist around the tracking axis so local Y points up
+    fp = quaternion_to_matrix(q)[:, 2]
+    angle = -0.5 * math.atan2(-fp[0], -fp[1])
+    q2 = np.concatenate([[math.cos(angle)], tvec * (math.sin(angle) / length)])
+
+    w1, x1, y1, z1 = q2
+    w2, x2, y2, z2 = q
+    q = np.array([
+        w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+        w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+        w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+        w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2,
+    ])
+    return quaternion_to_matrix(q)
+
+def euler_to_matrix(rx, ry, rz):
+    """Blender 'XYZ' Euler angles (radians) to a 3x3 rotation matrix (Rz @ Ry @ Rx)."""
+    cx, sx = math.cos(rx), math.sin(rx)
+    cy, sy = math.cos(ry), math.sin(ry)
+    cz, sz = math.cos(rz), math.sin(rz)
+    rot_x = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    rot_y = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rot_z = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    return rot_z @ rot_y @ rot_x
+
+def apply_noise(points, noise, rng=None):
+    """Adds gaussian noise (std in meters) to every coordinate of an (N, 3) array in place."""
+    if noise > 0:
+        rng = rng or np.random.default_rng()
+        points += rng.normal(0.0, noise, points.shape).astype(np.float32)
+    return points
+
+# --- 3. SEEDS & SHARDS ---
+
+def random_seed():
+    """Fresh base seed for runs started without --seed."""
+    return secrets.randbits(32)
+
+def sample_rng(seed, sample_id, *stream):
+    """
+    Independent RNG of one sample id, identical no matter which shard or process generates it.
+    Extra stream numbers give further independent RNGs of the same sample (e.g. per setup).
+    """
+    return np.random.default_rng(np.random.SeedSequence([seed, sample_id, *stream]))
+
+def shard_sample_ids(start_index, samples, shards, shard_index):
+    """Contiguous, disjoint slice of range(start_index, start_index + samples) for one shard."""
+    if not 0 <= shard_index < shards:
+        raise ValueError(f"shard index {shard_index} out of range for {shards} shards")
+    lo = start_index + samples * shard_index // shards
+    hi = start_index + samples * (shard_index + 1) // shards
+    return range(lo, hi)
+
+def shard_file_names(shards, shard_index):
+    """(ground truth file, scan container name) of a shard. A single shard keeps the plain names."""
+    if shards == 1:
+        return "ground_truth.csv", "scans"
+    return f"ground_truth_shard{shard_index:02d}.csv", f"scans_shard{shard_index:02d}"
+
+# --- 4. TARGET POSES ---
+
+def sample_pose_params(trans_range, rot_range, rng):
+    """Draws a random target pose: uniform Euler angles in +-rot_range degrees, translation in +-trans_range."""
+    rx_deg, ry_deg, rz_deg = rng.uniform(-rot_range, rot_range, 3)
+    rx, ry, rz = map(math.radians, [rx_deg, ry_deg, rz_deg])
+
+    tx, ty, tz = rng.uniform(-trans_range, trans_range, 3).tolist()
+    return {"rx_rad": rx, "ry_rad": ry, "rz_rad": rz, "tx_m": tx, "ty_m": ty, "tz_m": tz}
+
+def pose_matrix(params, scale=1.0):
+    """4x4 world matrix of the target for a pose dict (what Blender reports as matrix_world)."""
+    matrix = np.eye(4)
+    matrix[:3, :3] = euler_to_matrix(params["rx_rad"], params["ry_rad"], params["rz_rad"]) * scale
+    matrix[:3, 3] = (params["tx_m"], params["ty_m"], params["tz_m"])
+    return matrix
+
+# --- 5. OUTPUT CONTRACT ---
+
+GT_HEADER = ['sample_id', 'filename', 'rx_rad', 'ry_rad', 'rz_rad', 'tx_m', 'ty_m', 'tz_m']
+GT_MATRIX_HEADER = [f"m{r}{c}" for r in range(4) for c in range(4)]
+
+def settings_line(res_w, res_h, fov_h, fov_v, position, max_dist, seed=None, poses=None):
+    """The '# Settings:' comment that opens every ground_truth.csv. poses: PoseSampler.label, omitted for random."""
+    line = f"# Settings: Res={res_w}x{res_h}, FOV={fov_h}x{fov_v}, Pos={position}, Range={max_dist}"
+    if seed is not None:
+        line += f", Seed={seed}"
+    if poses is not None and poses != "random":
+        line += f", Poses={poses}"
+    return line + "\n"
+
+def settings_seed(line):
+    """Seed recorded in a settings line, or None."""
+    match = re.search(r"Seed=(\d+)", line)
+    return int(match.group(1)) if match else None
+
+_SETTINGS_PATTERN = re.compile(r"# Settings: Res=(\d+)x(\d+), FOV=([^x,]+)x([^,]+), Pos=(.+?), Range=([^,\s]+)")
+
+def parse_settings_line(line):
+    """
+    Sensor setup of a settings line: {'res_w', 'res_h', 'fov_h', 'fov_v', 'position' (array),
+    'max_dist', 'seed', 'poses'}. Raises ValueError on a line in another format.
+    """
+    match = _SETTINGS_PATTERN.match(line)
+    if not match:
+        raise ValueError(f"Not a settings line: {line.strip()}")
+    res_w, res_h, fov_h, fov_v, position, max_dist = match.groups()
+    poses = re.search(r"Poses=([\w:]+)", line)
+    return {"res_w": int(res_w), "res_h": int(res_h), "fov_h": float(fov_h), "fov_v": float(fov_v),
+            "position": parse_position(position), "max_dist": float(max_dist), "seed": settings_seed(line),
+            "poses": poses.group(1) if poses else "random"}
+
+def scan_filename(sample_id):
+    return f"scan_{sample_id:04d}.csv"
+
+def ground_truth_row(sample_id, filename, gt_matrix, params):
+    """One ground_truth.csv row. gt_matrix may be a mathutils Matrix or a 4x4 array."""
+    flat_matrix = [f"{gt_matrix[r][c]:.6f}" for r in range(4) for c in range(4)]
+    row_data = [sample_id, filename, f"{params['rx_rad']:.6f}", f"{params['ry_rad']:.6f}", f"{params['rz_rad']:.6f}", f"{params['tx_m']:.6f}", f"{params['ty_m']:.6f}", f"{params['tz_m']:.6f}"]
+    return row_data + flat_matrix
+
+def write_scan_csv(filepath, points):
+    """Writes an (N, 3) point array as an X,Y,Z csv with six decimals."""
+    np.savetxt(filepath, points, fmt='%.6f', delimiter=',', header='X,Y,Z', comments='')
+
+# --- 6. WORKER PROTOCOL ---
+
+# A '--serve' worker reads one JSON job spec per line. The keys are the argument names
+# without '--' ({"sensor_res": "848x480", "samples": 10, "viz": true, ...}), 'id' is echoed back.
+# Every finished job is answered with one '@@JOB {...}' line.
+JOB_REPORT_PREFIX = "@@JOB "
+
+def job_arguments(spec):
+    """Command line arguments of a job spec. True values become flags, False / None are left out."""
+    args = []
+    for key, value in spec.items():
+        if key == "id" or value is None or value is False:
+            continue
+        args.append(f"--{key}")
+        if value is not True:
+            args.append(str(value))
+    return args
+
+def job_spec(arguments, job_id=None):
+    """Inverse of job_arguments: job spec of a generator command line."""
+    spec = {"id": job_id}
+    i = 0
+    while i < len(arguments):
+        key = arguments[i][2:]
+        if i + 1 < len(arguments) and not arguments[i + 1].startswith("--"):
+            spec[key] = arguments[i + 1]
+            i += 2
+        else:
+            spec[key] = True
+            i += 1
+    return spec
+
+def job_report(result):
+    """Completion line of one job (result needs a 'status' of 'done' or 'error')."""
+    return JOB_REPORT_PREFIX + json.dumps(result) + "\n"
+
+def parse_job_report(line):
+    """Result dict of a completion line, None for any other output line."""
+    if not line.startswith(JOB_REPORT_PREFIX):
+        return None
+    return json.loads(line[len(JOB_REPORT_PREFIX):])
@@ -0,0 +1,219 @@
+"""
+Generation and registration evaluation in one pipeline, without writing the scans to disk.
+
+Generator processes cast the scans of their share of the sample ids (the same shards, seeds
+and poses as parallel_generate.py / HeadlessSensorProgram.py) and put (sample_id, points,
+T_gt) records on a bounded queue. Evaluation processes take them off as soon as they
+arrive and run the registration of registration_eval.py against the reference scan (the
+first sample id). Only the result rows come back to the main process:
+
+    python stream_pipeline.py --generators 2 --evaluators 6 --voxel_size 0.01 --pyramid -- \
+        --mesh cube.obj --sensor_res 848x480 --sensor_fov 69.0x42.0 --position 0.0,2.0,1.5 \
+        --samples 1000 --output ../Blender_Generated_Data/sweep_1 --seed 42
+
+The reference pose is random like every other, so the estimated pose of a scan is
+inverse(T_icp) @ T_ref before it is compared with its ground truth.
+
+The report goes to <output>/registration_results.csv. With --save the generators also write
+their scans to --output as usual (one shard per generator, merged at the end), so the
+batch can be evaluated again later. The records go through a bounded multiprocessing.Queue
+(a feeder thread per process writing to a pipe); when it is full the generators wait for
+the evaluators.
+"""
+import os
+import sys
+import time
+import queue
+import argparse
+import multiprocessing as mp
+
+import pandas as pd
+
+from sensor_core import (load_setups, scan_format, parse_position, sensor_rotation, random_seed, sample_rng,
+                         shard_sample_ids, shard_file_names, pose_matrix, settings_line)
+from mesh_raycast import load_mesh, TriangleBVH
+from scan_store import open_batch_output, batch_output
+from HeadlessSensorProgram import build_parser, perform_mesh_scan
+from parallel_generate import merge_shard_ground_truth
+from pose_metrics import CUBE_SYMMETRIES
+from pose_sampling import run_sampler
+
+# End of the records for one evaluation process
+_STOP = None
+
+# --- 1. GENERATION ---
+
+def stream_setup(args):
+    """The single setup of a streamed run (see load_setups) with its sensor pose. Raises ValueError."""
+    setups = load_setups(args)
+    if len(setups) != 1:
+        raise ValueError("streaming evaluates one sensor setup, run the setups one by one")
+    setup = setups[0]
+    setup["sensor_loc"] = parse_position(setup["position"])
+    setup["sensor_rot"] = sensor_rotation(setup["sensor_loc"])
+    return setup
+
+def scan_sample(bvh, setup, args, sampler, seed, sample_id):
+    """(points, T_gt, pose params) of one sample, identical to the scan HeadlessSensorProgram.py writes."""
+    rng = sample_rng(seed, sample_id)
+    params = sampler.params(sample_id, rng)
+    gt_matrix = pose_matrix(params)
+    points = perform_mesh_scan(bvh, setup["sensor_loc"], setup["sensor_rot"], gt_matrix,
+                               setup["res_w"], setup["res_h"], setup["fov_h"], setup["fov_v"],
+                               max_dist=setup["max_dist"], noise=setup["noise"], rng=rng, roi=not args.full_grid)
+    return points, gt_matrix, params
+
+def _generate(generator_args, seed, shards, shard_index, reference_id, records, save):
+    """Generator process: scans one shard of the sample ids onto the records queue (and to disk with save)."""
+    args = build_parser().parse_args(generator_args)
+    setup = stream_setup(args)
+    bvh = TriangleBVH(*load_mesh(args.mesh, scale=args.mesh_scale))
+    sample_ids = shard_sample_ids(args.start_index, args.samples, shards, shard_index)
+    sampler = run_sampler(args, seed)
+
+    output = None
+    if save:
+        gt_name, store_name = shard_file_names(shards, shard_index)
+        settings = settings_line(setup["res_w"], setup["res_h"], setup["fov_h"], setup["fov_v"],
+                                 setup["position"], setup["max_dist"], seed, sampler.label)
+        gt_file, scan_writer, _ = open_batch_output(setup["output"], gt_name, store_name, scan_format(args), settings, sample_ids)
+        output = batch_output(gt_file, scan_writer, args.write_queue, args.fsync_interval)
+
+    try:
+        for i in sample_ids:
+            points, gt_matrix, params = scan_sample(bvh, setup, args, sampler, seed, i)
+            if output is not None:
+                output.write(i, points, gt_matrix, params)
+            if i != reference_id:
+                records.put((i, points, gt_matrix))
+    finally:
+        if output is not None:
+            output.close()
+
+# --- 2. EVALUATION ---
+
+def _evaluate(reference_args, reference_pose, voxel_size, pyramid, symmetries, records, results):
+    """Evaluation process: registers records until _STOP, puts result rows (or (sample_id, error)) on results."""
+    # Open3D is only needed by the evaluators
+    import registration_eval
+    registration_eval._init_worker(*reference_args)
+    while True:
+        record = records.get()
+        if record is _STOP:
+            break
+        sample_id, points, T_gt = record
+        try:
+            if pyramid:
+                T_icp, fitness, rmse, seconds, levels = registration_eval.register_scan_pyramid(points, voxel_size, pyramid)
+            else:
+                (T_icp, fitness, rmse, seconds), levels = registration_eval.register_scan(points, voxel_size), None
+            results.put(registration_eval.result_row(sample_id, T_icp, fitness, rmse, seconds, T_gt, symmetries, levels,
+                                                     reference_pose))
+        except Exception as e:
+            results.put((sample_id, str(e)))
+
+def stream_evaluate(generator_args, voxel_size, generators=2, evaluators=None, pyramid=None,
+                    symmetries=CUBE_SYMMETRIES, save=False, on_result=None, queue_size=None):
+    """
+    Generates the scans of a HeadlessSensorProgram.py argument list and registers them on the
+    fly onto the first sample. pyramid and symmetries as in registration_eval.evaluate.
+    on_result(row) is called for every finished scan. Returns the results DataFrame ordered by id.
+    """
+    import registration_eval
+
+    args = build_parser().parse_args(generator_args)
+    setup = stream_setup(args)
+    seed = args.seed if args.seed is not None else random_seed()
+    evaluators = evaluators or max(1, (os.cpu_count() or 2) - generators)
+    if pyramid is True:
+        pyramid = registration_eval.PYRAMID_PARAMS
+
+    # The reference is scanned here as well, so the evaluators can start with the first record
+    bvh = TriangleBVH(*load_mesh(args.mesh, scale=args.mesh_scale))
+    reference_id = args.start_index
+    reference_points, reference_pose, _ = scan_sample(bvh, setup, args, run_sampler(args, seed), seed, reference_id)
+    reference = registration_eval.feature_arrays(reference_points, voxel_size)
+    reference_levels = registration_eval.pyramid_arrays(reference_points, voxel_size, pyramid) if pyramid else None
+    reference_args = (reference_points, reference, None, 0, reference_levels)
+    if save:
+        os.makedirs(setup["output"], exist_ok=True)
+
+    records = mp.Queue(maxsize=queue_size or 2 * evaluators)
+    results = mp.Queue()
+    generator_procs = [mp.Process(target=_generate, args=(generator_args, seed, generators, k, reference_id, records, save))
+                       for k in range(generators)]
+    evaluator_args = (reference_args, reference_pose, voxel_size, pyramid, symmetries, records, results)
+    evaluator_procs = [mp.Process(target=_evaluate, args=evaluator_args) for _ in range(evaluators)]
+    for proc in generator_procs + evaluator_procs:
+        proc.start()
+
+    rows = []
+    expected = args.samples - 1
+    started = time.time()
+    try:
+        while len(rows) < expected:
+            try:
+                item = results.get(timeout=1.0)
+            except queue.Empty:
+                failed = [proc for proc in generator_procs + evaluator_procs if proc.exitcode not in (None, 0)]
+                if failed:
+                    raise RuntimeError(f"{len(failed)} pipeline processes failed (exit codes {[p.exitcode for p in failed]})")
+                continue
+            if isinstance(item, tuple):
+                sample_id, error = item
+                print(f"Registration Error Sample {sample_id}: {error}")
+                expected -= 1
+                continue
+            rows.append(item)
+            if on_result:
+                on_result(item)
+    finally:
+        for _ in evaluator_procs:
+            try:
+                records.put(_STOP, timeout=1.0)
+            except queue.Full:
+                # Evaluators that stopped early; the ones still running are terminated below
+                break
+        for proc in generator_procs + evaluator_procs:
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+
+    elapsed = time.time() - started
+    print(f"--- {len(rows)} scans generated and registered in {elapsed:.1f} s ({len(rows) / elapsed:.2f} scans/s) ---")
+    if save:
+        merge_shard_ground_truth(setup["output"], generators)
+
+    columns = registration_eval.RESULT_COLUMNS + (['rot_error_sym'] if symmetries is not None else [])
+    columns += registration_eval.PYRAMID_COLUMNS if pyramid else []
+    return pd.DataFrame(rows, columns=columns).sort_values('id', ignore_index=True)
+
+# --- 3. MAIN EXECUTION ---
+
+def main():
+    argv = sys.argv[1:]
+    if "--" not in argv:
+        sys.exit("usage: stream_pipeline.py [options] -- <HeadlessSensorProgram.py arguments>")
+    split = argv.index("--")
+    generator_args = argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description="Generate and evaluate scans without intermediate storage")
+    parser.add_argument("--generators", type=int, default=2, help="Generator processes")
+    parser.add_argument("--evaluators", type=int, default=None, help="Registration processes (default: the other cores)")
+    parser.add_argument("--voxel_size", type=float, default=0.01)
+    parser.add_argument("--pyramid", action="store_true", help="Coarse-to-fine registration (register_scan_pyramid)")
+    parser.add_argument("--no_symmetry", action="store_true", help="Skip the cube-symmetric rotation error")
+    parser.add_argument("--save", action="store_true", help="Also write the scans to the generator's --output")
+    args = parser.parse_args(argv[:split])
+
+    import registration_eval
+    df_res = stream_evaluate(generator_args, args.voxel_size, args.generators, args.evaluators, args.pyramid or None,
+                             None if args.no_symmetry else CUBE_SYMMETRIES, args.save)
+    registration_eval.print_report(df_res)
+
+    output = build_parser().parse_args(generator_args).output
+    os.makedirs(output, exist_ok=True)
+    registration_eval.write_report(df_res, os.path.join(output, "registration_results.csv"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Range scan formats against the point formats: python -m pytest test_range_format.py
+"""
+import argparse
+
+import numpy as np
+import pytest
+
+from sensor_core import add_common_arguments, load_setups, parse_position, sensor_rotation, settings_line, sample_rng, \
+    sample_pose_params, pose_matrix
+from mesh_raycast import load_mesh, TriangleBVH
+from scan_store import open_scan_writer, ScanStore, open_batch_output, batch_output
+from HeadlessSensorProgram import perform_mesh_scan
+
+CUBE_OBJ = """v -0.1 -0.1 -0.1
+v 0.1 -0.1 -0.1
+v 0.1 0.1 -0.1
+v -0.1 0.1 -0.1
+v -0.1 -0.1 0.1
+v 0.1 -0.1 0.1
+v 0.1 0.1 0.1
+v -0.1 0.1 0.1
+f 1 4 3 2
+f 5 6 7 8
+f 1 2 6 5
+f 2 3 7 6
+f 3 4 8 7
+f 4 1 5 8
+"""
+SENSOR = ["--sensor_res", "160x120", "--sensor_fov", "69x42", "--position", "0.0,0.6,0.4"]
+
+def parse(extra, output):
+    parser = argparse.ArgumentParser()
+    add_common_arguments(parser)
+    return parser.parse_args(SENSOR + ["--samples", "3", "--output", str(output)] + extra)
+
+def write_batch(tmp_path, fmt, noise=0.0):
+    """Scans three cube poses into <tmp_path>/<fmt>, returns the ScanStore."""
+    mesh = tmp_path / "cube.obj"
+    mesh.write_text(CUBE_OBJ)
+    bvh = TriangleBVH(*load_mesh(str(mesh)))
+    position = "0.0,0.6,0.4"
+    sensor_loc = parse_position(position)
+    output = tmp_path / fmt
+    output.mkdir()
+    settings = settings_line(160, 120, 69.0, 42.0, position, 100.0, 7)
+    gt_file, writer, _ = open_batch_output(str(output), "ground_truth.csv", "scans", fmt, settings, [0, 1, 2])
+    with batch_output(gt_file, writer) as batch:
+        for i in range(3):
+            rng = sample_rng(7, i)
+            params = sample_pose_params(0.02, 180.0, rng)
+            matrix = pose_matrix(params)
+            points = perform_mesh_scan(bvh, sensor_loc, sensor_rotation(sensor_loc), matrix, 160, 120, 69.0, 42.0,
+                                       max_dist=100.0, noise=noise, rng=rng)
+            batch.write(i, points, matrix, params)
+    return ScanStore(str(output))
+
+def test_range_matches_npy(tmp_path):
+    npy, organized = write_batch(tmp_path, "npy"), write_batch(tmp_path, "range")
+    for i in range(3):
+        points, reference = organized[i], npy[i]
+        assert len(points) == len(reference) > 0
+        # Range scans come back in pixel order, the cast order is the same grid order
+        np.testing.assert_allclose(points, reference, atol=1e-5)
+
+def test_range_refuses_noise(tmp_path):
+    with pytest.raises(ValueError, match="noise"):
+        load_setups(parse(["--format", "range", "--noise", "0.01"], tmp_path))
+    with pytest.raises(ValueError, match="noise"):
+        load_setups(parse(["--organized", "--noise", "0.01"], tmp_path))
+    assert len(load_setups(parse(["--format", "npy", "--noise", "0.01"], tmp_path))) == 1
+
+def test_range_writer_refuses_shared_pixels(tmp_path):
+    settings = settings_line(160, 120, 69.0, 42.0, "0.0,0.6,0.4", 100.0, 7)
+    writer = open_scan_writer("range", str(tmp_path), settings=settings)
+    point = np.array([[0.0, 0.0, 0.0]], dtype=np.float32)
+    with pytest.raises(ValueError, match="share a pixel"):
+        writer.write(0, np.concatenate([point, point + 1e-4]), np.eye(4))
+    writer.close()